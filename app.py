@@ -1,21 +1,84 @@
 import streamlit as st
 import pandas as pd
+import yaml
+from pathlib import Path
 
 # SQL Server connector
-from services.sql_server import connect_sql_server, fetch_table, fetch_query
+from services.sql_server import pooled_connection, fetch_table, fetch_query, pushdown_kpis, fetch_sample, \
+    fill_sample_medians
+from core.ingestion import read_dataset, UPLOAD_TYPES
+from core.pipeline_manager import run_pipeline_job
+from core.column_stats import frame_fingerprint
+from services.storage_manager import StorageManager
+from services.cache_handler import cache_data
+from services.job_queue import get_job_queue, JOB_DONE, JOB_FAILED, FINAL_STATES
+from services.session_manager import current_session_id, get_session_data_manager
+
+SQL_CHUNKSIZE = 50_000
+
+
+def load_config(path="config.yaml") -> dict:
+    p = Path(path)
+    if not p.exists():
+        return {}
+    return yaml.safe_load(p.read_text(encoding="utf-8")) or {}
+
+
+CONFIG = load_config()
+data_dir = CONFIG.get("paths", {}).get("data_dir", "data")
+storage_max_mb = CONFIG.get("storage", {}).get("max_cache_mb", 2048)
+storage = StorageManager(data_dir, max_bytes=storage_max_mb * 1024 * 1024 if storage_max_mb else None)
+jobs_config = CONFIG.get("jobs", {})
+jobs = get_job_queue(max_workers=jobs_config.get("max_workers", 2),
+                     jobs_dir=jobs_config.get("jobs_dir", "reports/jobs/"))
+sessions_config = CONFIG.get("sessions", {})
+# Frames every session holds: one shared copy per content hash, budgeted, spilled into storage's frame cache
+session_data = get_session_data_manager(data_dir=data_dir,
+                                        max_total_mb=sessions_config.get("max_total_mb", 4096),
+                                        max_session_mb=sessions_config.get("max_session_mb", 1024),
+                                        idle_timeout_minutes=sessions_config.get("idle_timeout_minutes", 60),
+                                        max_disk_mb=storage_max_mb,
+                                        dtype_backend=CONFIG.get("ingestion", {}).get("dtype_backend", "compact"))
+
+def load_upload(content_hash: str, uploaded_file):
+    """
+    Parsed upload, shared across reruns and sessions through the session data manager:
+    parsed once per content hash, then reused (or read back from the columnar cache if spilled).
+    """
+    session_id = current_session_id()
+    df = session_data.get(session_id, "upload")
+    if df is None or st.session_state.get("upload_hash") != content_hash:
+        df = session_data.attach(session_id, "upload", content_hash)
+    if df is None:
+        df, info = storage.load_dataset(uploaded_file, reader=read_dataset, content_hash=content_hash)
+        df = session_data.put(session_id, "upload", df, content_hash=content_hash, meta=info)
+    st.session_state["upload_hash"] = content_hash
+    return df, session_data.metadata(content_hash)
+
+
+@cache_data(show_spinner=False, max_entries=32)
+def describe_frame(dataset_hash: str, _df: pd.DataFrame) -> pd.DataFrame:
+    return _df.describe(include="all")
+
 
 # -------------------------------
 # Core InsightIQ Pipeline Stubs
 # -------------------------------
-def run_pipeline(df: pd.DataFrame):
+def run_pipeline(df: pd.DataFrame, dataset_hash: str, source_kpis: dict = None):
     """
     Main InsightIQ processing pipeline
+    source_kpis: whole-table KPIs computed by the database when df is only a sample
     """
+    if source_kpis:
+        st.subheader("🧮 Table KPIs (computed on the server)")
+        st.json(source_kpis)
+        st.caption(f"Charts and analysis below use a sample of {len(df):,} of {source_kpis['row_count']:,} rows.")
+
     st.subheader("📊 Dataset Preview")
     st.dataframe(df.head())
 
     st.subheader("📈 Basic Statistics")
-    st.write(df.describe(include="all"))
+    st.write(describe_frame(dataset_hash, df))
 
     st.subheader("🧠 AI Insights (Sample)")
     st.info(
@@ -23,6 +86,44 @@ def run_pipeline(df: pd.DataFrame):
         "(KPI detection, summaries, PDF reports, dashboards, etc.)"
     )
 
+    st.subheader("⚙️ Full Analysis")
+    priority = st.selectbox("Priority", ["normal", "high", "low"], key="job_priority")
+    if st.button("Run full analysis in background"):
+        job_id = jobs.submit(run_pipeline_job, df, CONFIG, dataset_hash=dataset_hash, source_kpis=source_kpis,
+                             name=f"analysis ({len(df):,} rows)",
+                             priority={"high": 0, "normal": 10, "low": 20}[priority])
+        st.session_state.setdefault("job_ids", []).append(job_id)
+        st.success(f"Queued job {job_id}. Progress is shown under Background Jobs.")
+
+
+def render_jobs():
+    """Status, progress and results of this session's background jobs (kept across reruns)."""
+    job_ids = st.session_state.get("job_ids", [])
+    if not job_ids:
+        return
+    st.subheader("🗂️ Background Jobs")
+    st.button("Refresh status")
+    for job_id in reversed(job_ids):
+        try:
+            info = jobs.status(job_id)
+        except KeyError:
+            continue
+        with st.expander(f"{info['name']} — {info['status']} [{job_id}]", expanded=info["status"] not in FINAL_STATES):
+            st.progress(info["progress"], text=info["message"] or info["status"])
+            if info["status"] not in FINAL_STATES:
+                if st.button("Cancel", key=f"cancel_{job_id}"):
+                    jobs.cancel(job_id)
+            elif info["status"] == JOB_FAILED:
+                st.error(info["error"])
+            elif info["status"] == JOB_DONE:
+                results = jobs.result(job_id) or {}
+                if results.get("insights"):
+                    st.markdown(results["insights"])
+                report_path = results.get("report_path")
+                if report_path and Path(report_path).exists():
+                    st.download_button("Download PDF report", Path(report_path).read_bytes(),
+                                       file_name=Path(report_path).name, key=f"report_{job_id}")
+
 # -------------------------------
 # Streamlit UI
 # -------------------------------
@@ -42,12 +143,18 @@ source_type = st.sidebar.selectbox(
 # CSV Upload
 # -------------------------------
 if source_type == "CSV Upload":
-    uploaded_file = st.file_uploader("Upload CSV file", type=["csv"])
+    uploaded_file = st.file_uploader("Upload CSV, Parquet or Feather file", type=UPLOAD_TYPES)
 
     if uploaded_file:
-        df = pd.read_csv(uploaded_file)
-        st.success("CSV file loaded successfully")
-        run_pipeline(df)
+        df, ingest_info = load_upload(storage.content_hash(uploaded_file), uploaded_file)
+        st.success("File loaded successfully")
+        source_note = "columnar cache" if ingest_info["cache_hit"] else ingest_info["engine"]
+        st.caption(
+            f"Parsed {ingest_info['rows']:,} rows x {ingest_info['columns']} columns "
+            f"in {ingest_info['parse_seconds']:.2f}s ({source_note}), "
+            f"{ingest_info['memory_mb']} MB in memory"
+        )
+        run_pipeline(df, ingest_info["content_hash"])
 
 # -------------------------------
 # SQL Server Integration
@@ -65,27 +172,65 @@ elif source_type == "SQL Server":
     table_name = ""
     sql_query = ""
 
+    pushdown = False
     if mode == "Table":
         table_name = st.sidebar.text_input("Table Name")
+        pushdown = st.sidebar.checkbox("Pushdown KPIs + sample",
+                                       help="Compute KPIs on the server and fetch only a random sample")
     else:
         sql_query = st.sidebar.text_area("SQL Query")
 
+    if pushdown:
+        row_limit = st.sidebar.number_input("Sample rows", min_value=1_000, value=100_000, step=10_000)
+    else:
+        row_limit = st.sidebar.number_input("Row limit (0 = all rows)", min_value=0, value=0, step=10_000)
+
     if st.sidebar.button("Load Data"):
         try:
-            conn = connect_sql_server(
+            with pooled_connection(
                 server=server,
                 database=database,
                 username=username,
                 password=password
-            )
-
-            if mode == "Table":
-                df = fetch_table(conn, table_name)
-            else:
-                df = fetch_query(conn, sql_query)
+            ) as conn:
+                progress = st.progress(0, text="Fetching rows...")
+
+                def on_progress(rows_fetched):
+                    fraction = min(rows_fetched / row_limit, 1.0) if row_limit else 0
+                    progress.progress(fraction, text=f"Fetched {rows_fetched:,} rows")
+
+                max_rows = int(row_limit) or None
+                source_kpis = None
+                if pushdown:
+                    progress.progress(0, text="Computing KPIs on the server...")
+                    source_kpis = pushdown_kpis(conn, table_name)
+                    df = fetch_sample(conn, table_name, n_rows=max_rows, row_count=source_kpis["row_count"],
+                                      chunksize=SQL_CHUNKSIZE, progress_callback=on_progress)
+                    fill_sample_medians(source_kpis, df)
+                elif mode == "Table":
+                    df = fetch_table(conn, table_name, chunksize=SQL_CHUNKSIZE,
+                                     max_rows=max_rows, progress_callback=on_progress)
+                else:
+                    df = fetch_query(conn, sql_query, chunksize=SQL_CHUNKSIZE,
+                                     max_rows=max_rows, progress_callback=on_progress)
+                progress.empty()
 
             st.success("SQL Server data loaded successfully")
-            run_pipeline(df)
+            # Kept by the session data manager so later widget clicks (e.g. background runs) still see it
+            sql_hash = frame_fingerprint(df)
+            session_data.put(current_session_id(), "sql", df, content_hash=sql_hash)
+            del df
+            st.session_state["sql_hash"] = sql_hash
+            st.session_state["sql_kpis"] = source_kpis
 
         except Exception as e:
             st.error(f"Failed to connect or fetch data: {e}")
+
+    if "sql_hash" in st.session_state:
+        sql_df = session_data.get(current_session_id(), "sql")
+        if sql_df is None:
+            st.warning("The loaded SQL data was released (idle session or disk cache limit). Please load it again.")
+        else:
+            run_pipeline(sql_df, st.session_state["sql_hash"], st.session_state.get("sql_kpis"))
+
+render_jobs()
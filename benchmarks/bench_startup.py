@@ -0,0 +1,130 @@
+# benchmarks/bench_startup.py
+# Cold-import time of the app's entry modules, and a guard against import-time regressions.
+#
+# Usage (from the repository root):
+#   python -m benchmarks.bench_startup
+#   python -m benchmarks.bench_startup --max-seconds 1.5 --repeat 5
+#
+# Exits non-zero when a module takes longer than --max-seconds to import, or when importing it
+# pulls in one of HEAVY_MODULES (those must only load when their pipeline stage runs).
+
+import argparse
+import json
+import re
+import statistics
+import subprocess
+import sys
+from datetime import datetime, timezone
+from pathlib import Path
+
+from benchmarks.run_benchmarks import RESULTS_DIR, SCHEMA_VERSION, environment_info
+
+DEFAULT_MODULES = ["core.pipeline_manager", "core.registry", "core.ingestion", "services.sql_server"]
+HEAVY_MODULES = ["transformers", "torch", "ydata_profiling", "plotly", "fpdf", "sklearn", "statsmodels", "kaleido"]
+IMPORTTIME_LINE = re.compile(r"import time:\s+(\d+)\s+\|\s+(\d+)\s+\| (\s*)(\S+)")
+
+_PROBE = """
+import json, sys, time
+t0 = time.perf_counter()
+import {module}
+elapsed = time.perf_counter() - t0
+heavy = sorted({{m.split('.')[0] for m in sys.modules}} & set({heavy!r}))
+print(json.dumps({{"seconds": round(elapsed, 4), "heavy_loaded": heavy}}))
+"""
+
+
+def measure_import(module: str, cwd: str = "."):
+    """
+    Import `module` in a fresh interpreter with -X importtime.
+    Returns seconds, the heavy libraries it loaded, and the slowest top-level imports.
+    """
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", _PROBE.format(module=module, heavy=HEAVY_MODULES)],
+        capture_output=True, text=True, cwd=cwd,
+    )
+    if proc.returncode != 0:
+        return {"status": "error", "error": (proc.stderr.strip().splitlines() or ["import failed"])[-1]}
+    result = json.loads(proc.stdout.strip().splitlines()[-1])
+
+    # Nesting depth is the indentation of the package name; depth 0 = imported directly by the probe
+    top_level = []
+    for line in proc.stderr.splitlines():
+        m = IMPORTTIME_LINE.match(line)
+        if m and len(m.group(3)) == 0:
+            top_level.append((int(m.group(2)), m.group(4)))
+    result["slowest_imports"] = [{"module": name, "cumulative_ms": round(us / 1000, 1)}
+                                 for us, name in sorted(top_level, reverse=True)[:10]]
+    result["status"] = "ok"
+    return result
+
+
+def run_startup_suite(modules, repeat: int = 3, log=print):
+    results = []
+    for module in modules:
+        runs = [measure_import(module) for _ in range(repeat)]
+        ok = [r for r in runs if r["status"] == "ok"]
+        if not ok:
+            case = {"module": module, **runs[0]}
+        else:
+            seconds = [r["seconds"] for r in ok]
+            case = {
+                "module": module,
+                "status": "ok",
+                "import_seconds": seconds,
+                "import_seconds_min": min(seconds),
+                "import_seconds_median": statistics.median(seconds),
+                "heavy_loaded": ok[0]["heavy_loaded"],
+                "slowest_imports": ok[0]["slowest_imports"],
+            }
+        log(f"{module:<28} {case['status']:<6} {case.get('import_seconds_min', '-')}s  "
+            f"heavy: {', '.join(case.get('heavy_loaded', [])) or 'none'}")
+        results.append(case)
+    return results
+
+
+def check(results, max_seconds: float, log=print):
+    """Return the list of failed guards (slow import, heavy library loaded, import error)."""
+    failures = []
+    for case in results:
+        if case["status"] != "ok":
+            failures.append({"module": case["module"], "reason": f"import failed: {case.get('error')}"})
+            continue
+        if case["heavy_loaded"]:
+            failures.append({"module": case["module"], "reason": f"loads {case['heavy_loaded']} at import"})
+        if max_seconds and case["import_seconds_min"] > max_seconds:
+            failures.append({"module": case["module"],
+                             "reason": f"{case['import_seconds_min']:.2f}s > {max_seconds}s"})
+    for f in failures:
+        log(f"FAIL {f['module']}: {f['reason']}")
+    return failures
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="InsightIQ start-up (import time) benchmark")
+    parser.add_argument("--modules", default=",".join(DEFAULT_MODULES), help="comma-separated modules to import")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--max-seconds", type=float, default=2.0, help="fail if any import is slower (0 = off)")
+    parser.add_argument("--out", default=None, help="output JSON path")
+    args = parser.parse_args(argv)
+
+    started = datetime.now(timezone.utc)
+    modules = [m for m in args.modules.split(",") if m]
+    results = run_startup_suite(modules, repeat=args.repeat)
+    failures = check(results, args.max_seconds)
+    doc = {
+        "schema_version": SCHEMA_VERSION,
+        "created": started.isoformat(),
+        "environment": environment_info(),
+        "config": {"benchmark": "startup", "repeat": args.repeat, "max_seconds": args.max_seconds},
+        "results": results,
+        "failures": failures,
+    }
+    out = Path(args.out) if args.out else RESULTS_DIR / f"startup_{started:%Y%m%dT%H%M%S}.json"
+    out.parent.mkdir(parents=True, exist_ok=True)
+    out.write_text(json.dumps(doc, indent=2, default=str))
+    print(f"Results written to {out}")
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
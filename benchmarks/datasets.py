@@ -0,0 +1,73 @@
+# benchmarks/datasets.py
+# Synthetic dataset generators for the benchmark suite
+
+import numpy as np
+import pandas as pd
+
+
+def parse_scale(text: str) -> int:
+    """
+    "10k" -> 10_000, "1M" -> 1_000_000, "2500" -> 2500
+    """
+    text = text.strip().lower().replace("_", "")
+    multipliers = {"k": 1_000, "m": 1_000_000}
+    if text and text[-1] in multipliers:
+        return int(float(text[:-1]) * multipliers[text[-1]])
+    return int(text)
+
+
+def make_dataset(n_rows: int, n_numeric: int = 8, n_categorical: int = 4, n_datetime: int = 1,
+                 null_rate: float = 0.05, cardinality: int = 50, duplicate_rate: float = 0.01,
+                 string_dtype: str = "object", seed: int = 42) -> pd.DataFrame:
+    """
+    Build a business-like table:
+      - num_<i>: float columns with different distributions (normal, lognormal, trend)
+      - cat_<i>: text columns with `cardinality` distinct values (zipf-skewed)
+      - date_<i>: daily timestamps spanning ~3 years
+    null_rate of numeric/categorical cells are blanked, duplicate_rate of rows are exact copies.
+    string_dtype: "object" (like pd.read_csv) or "string[pyarrow]" (like core.ingestion).
+    """
+    rng = np.random.default_rng(seed)
+    data = {}
+
+    for i in range(n_datetime):
+        start = np.datetime64("2022-01-01")
+        offsets = rng.integers(0, 3 * 365, size=n_rows)
+        data[f"date_{i}"] = pd.to_datetime(start + offsets.astype("timedelta64[D]"))
+
+    for i in range(n_numeric):
+        kind = i % 3
+        if kind == 0:
+            col = rng.normal(100, 15, size=n_rows)
+        elif kind == 1:
+            col = rng.lognormal(3, 1, size=n_rows)
+        else:
+            col = np.linspace(0, 50, n_rows) + rng.normal(0, 5, size=n_rows)
+        if null_rate:
+            col[rng.random(n_rows) < null_rate] = np.nan
+        data[f"num_{i}"] = col
+
+    labels = np.array([f"value_{j}" for j in range(max(cardinality, 1))], dtype=object)
+    for i in range(n_categorical):
+        codes = np.minimum(rng.zipf(1.5, size=n_rows) - 1, len(labels) - 1)
+        col = labels[codes]
+        if null_rate:
+            col = col.copy()
+            col[rng.random(n_rows) < null_rate] = None
+        data[f"cat_{i}"] = pd.Series(col, dtype=string_dtype)
+
+    df = pd.DataFrame(data)
+    n_dupes = int(n_rows * duplicate_rate)
+    if n_dupes:
+        src = rng.integers(0, n_rows - n_dupes, size=n_dupes)
+        df = pd.concat([df.iloc[:n_rows - n_dupes], df.iloc[src]], ignore_index=True)
+    return df
+
+
+# Named shapes used by the suite; "wide" stresses correlation/profiling code paths
+PROFILES = {
+    "default": dict(n_numeric=8, n_categorical=4, n_datetime=1, null_rate=0.05, cardinality=50),
+    "wide": dict(n_numeric=100, n_categorical=20, n_datetime=1, null_rate=0.05, cardinality=50),
+    "sparse": dict(n_numeric=8, n_categorical=4, n_datetime=1, null_rate=0.4, cardinality=50),
+    "high_cardinality": dict(n_numeric=8, n_categorical=4, n_datetime=1, null_rate=0.05, cardinality=100_000),
+}
@@ -0,0 +1,283 @@
+# benchmarks/run_benchmarks.py
+# Time and memory-profile every core module at increasing row counts.
+#
+# Usage (from the repository root):
+#   python -m benchmarks.run_benchmarks --scales 10k,100k,1M --profile default
+#   python -m benchmarks.run_benchmarks --only basic_cleaning,compute_basic_kpis --scales 10M
+#   python -m benchmarks.run_benchmarks --compare benchmarks/results/old.json benchmarks/results/new.json
+
+import argparse
+import json
+import multiprocessing as mp
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import traceback
+from datetime import datetime, timezone
+from importlib import metadata
+from pathlib import Path
+
+SCHEMA_VERSION = 1
+DEFAULT_SCALES = "10k,100k,1M,10M"
+RESULTS_DIR = Path(__file__).parent / "results"
+TRACKED_PACKAGES = ["pandas", "numpy", "pyarrow", "scikit-learn", "statsmodels", "plotly",
+                    "kaleido", "ydata-profiling", "fpdf", "fpdf2", "transformers", "torch"]
+
+
+# -------------------------------
+# Benchmarks: setup(df) -> run() callable; only run() is timed
+# -------------------------------
+def _basic_cleaning(df):
+    from core.data_cleaning import basic_cleaning
+    return lambda: basic_cleaning(df)
+
+def _compute_basic_kpis(df):
+    from core.kpi_extractor import compute_basic_kpis
+    return lambda: compute_basic_kpis(df)
+
+def _generate_top_visuals(df):
+    from core.visualization import generate_top_visuals
+    return lambda: generate_top_visuals(df)
+
+def _detect_anomalies(df):
+    from core.anomaly_detector import detect_anomalies
+    return lambda: detect_anomalies(df)
+
+def _run_kmeans(df):
+    from core.clustering import run_kmeans
+    return lambda: run_kmeans(df)
+
+def _simple_forecast(df):
+    from core.forecasting import simple_forecast
+    target = next(c for c in df.columns if c.startswith("num_"))
+    return lambda: simple_forecast(df, date_col="date_0", target_col=target)
+
+def _generate_profile_html(df):
+    from core.profiling_engine import generate_profile_html
+    return lambda: generate_profile_html(df, minimal=True)
+
+def _pdf_report(df):
+    from core.kpi_extractor import compute_basic_kpis
+    from core.visualization import generate_top_visuals
+    from core.report_generator import PDFReport, clear_image_cache
+    kpis = compute_basic_kpis(df)
+    figs = generate_top_visuals(df)
+
+    def run():
+        clear_image_cache()  # time cold rendering on every repeat
+        report = PDFReport()
+        report.add_title()
+        report.add_kpis(kpis)
+        report.add_insights("Benchmark insights placeholder.")
+        report.add_figures(fig for _, fig in figs[:3])
+        with tempfile.TemporaryDirectory() as tmp:
+            report.output(str(Path(tmp) / "bench.pdf"))
+    return run
+
+def _pipeline(df):
+    from core import forecasting
+    from core.pipeline_manager import PipelineManager
+    from core.report_generator import clear_image_cache
+    tmp = tempfile.mkdtemp(prefix="insightiq_bench_")
+    # No disk tiers for generations or PNGs, so nothing is written into the repository
+    # and no repeat is served from a previous one
+    manager = PipelineManager({"paths": {"data_dir": f"{tmp}/data", "report_dir": f"{tmp}/reports"},
+                               "llm": {"cache_dir": None},
+                               "report": {"image_cache_dir": None}})
+
+    def run():
+        # Time a cold run on every repeat: drop the process-wide PNG and fitted-series caches
+        clear_image_cache()
+        with forecasting._FORECAST_CACHE_LOCK:
+            forecasting._FORECAST_CACHE.clear()
+        manager.run_full_pipeline(df)
+    return run
+
+
+# name -> (setup function, default row cap; cases above the cap are skipped unless --no-caps)
+BENCHMARKS = {
+    "basic_cleaning": (_basic_cleaning, None),
+    "compute_basic_kpis": (_compute_basic_kpis, None),
+    "generate_top_visuals": (_generate_top_visuals, None),
+    "detect_anomalies": (_detect_anomalies, None),
+    "run_kmeans": (_run_kmeans, None),
+    "simple_forecast": (_simple_forecast, None),
+    "generate_profile_html": (_generate_profile_html, 1_000_000),
+    "pdf_report": (_pdf_report, None),
+    "pipeline": (_pipeline, 1_000_000),
+}
+
+
+# -------------------------------
+# Case execution (one fresh process per case so peak RSS is per benchmark)
+# -------------------------------
+def _run_case(name, n_rows, profile, repeat, trace_memory, seed):
+    from benchmarks.datasets import make_dataset, PROFILES
+    from core.ingestion import frame_memory_bytes
+    from services.instrumentation import measure, peak_rss_bytes
+
+    df = make_dataset(n_rows, seed=seed, **PROFILES[profile])
+    result = {
+        "columns": int(df.shape[1]),
+        "dataset_mb": round(frame_memory_bytes(df) / (1024 * 1024), 2),
+    }
+    run = BENCHMARKS[name][0](df)
+    records = []
+    for _ in range(repeat):
+        with measure(f"bench:{name}", data=df, trace_memory=trace_memory) as record:
+            run()
+        records.append(record)
+
+    walls = [r["wall_seconds"] for r in records]
+    best = records[walls.index(min(walls))]
+    result.update({
+        "wall_seconds": walls,
+        "wall_seconds_min": min(walls),
+        "wall_seconds_median": statistics.median(walls),
+        "cpu_seconds": best["cpu_seconds"],
+        "rows_per_second": round(n_rows / min(walls), 1) if min(walls) > 0 else None,
+        "tracemalloc_peak_mb": max((r.get("tracemalloc_peak_mb", 0) for r in records), default=None),
+    })
+    peak = peak_rss_bytes()
+    result["rss_peak_mb"] = round(peak / (1024 * 1024), 2) if peak is not None else None
+    return result
+
+
+def _case_entry(queue, *args):
+    try:
+        queue.put({"status": "ok", **_run_case(*args)})
+    except MemoryError:
+        queue.put({"status": "oom", "error": "MemoryError"})
+    except Exception as e:
+        queue.put({"status": "error", "error": repr(e), "traceback": traceback.format_exc()})
+
+
+def run_case_isolated(name, n_rows, profile, repeat, trace_memory, seed, timeout):
+    ctx = mp.get_context("spawn")
+    queue = ctx.Queue()
+    proc = ctx.Process(target=_case_entry, args=(queue, name, n_rows, profile, repeat, trace_memory, seed))
+    proc.start()
+    proc.join(timeout)
+    if proc.is_alive():
+        proc.terminate()
+        proc.join()
+        return {"status": "timeout", "error": f"exceeded {timeout}s"}
+    if queue.empty():
+        # Killed without reporting, typically by the OOM killer
+        return {"status": "crashed", "error": f"exit code {proc.exitcode}"}
+    return queue.get()
+
+
+# -------------------------------
+# Result files
+# -------------------------------
+def environment_info():
+    packages = {}
+    for pkg in TRACKED_PACKAGES:
+        try:
+            packages[pkg] = metadata.version(pkg)
+        except metadata.PackageNotFoundError:
+            pass
+    try:
+        commit = subprocess.run(["git", "rev-parse", "HEAD"], capture_output=True, text=True,
+                                check=True).stdout.strip()
+    except Exception:
+        commit = None
+    return {
+        "python": sys.version.split()[0],
+        "platform": platform.platform(),
+        "processor": platform.processor(),
+        "cpu_count": mp.cpu_count(),
+        "git_commit": commit,
+        "packages": packages,
+    }
+
+
+def run_suite(names, scales, profile, repeat, trace_memory, seed, timeout, no_caps, log=print):
+    results = []
+    for n_rows in scales:
+        for name in names:
+            cap = BENCHMARKS[name][1]
+            case = {"benchmark": name, "rows": n_rows, "profile": profile}
+            if cap is not None and n_rows > cap and not no_caps:
+                case.update({"status": "skipped", "error": f"above default cap of {cap} rows"})
+            else:
+                case.update(run_case_isolated(name, n_rows, profile, repeat, trace_memory, seed, timeout))
+            log(f"{name:<24} {n_rows:>12,} rows  {case['status']:<8} "
+                f"{case.get('wall_seconds_min', '-')}s  peak RSS {case.get('rss_peak_mb', '-')} MB")
+            results.append(case)
+    return results
+
+
+def compare(old_path, new_path, threshold=1.2, log=print):
+    """
+    Compare wall_seconds_min of matching (benchmark, rows, profile) cases.
+    Returns the list of regressions (new/old ratio above threshold).
+    """
+    def index(path):
+        doc = json.loads(Path(path).read_text())
+        return {(r["benchmark"], r["rows"], r["profile"]): r for r in doc["results"]
+                if r.get("status") == "ok"}
+
+    old, new = index(old_path), index(new_path)
+    regressions = []
+    log(f"{'benchmark':<24} {'rows':>12} {'old s':>10} {'new s':>10} {'ratio':>7}")
+    for key in sorted(set(old) & set(new)):
+        o, n = old[key]["wall_seconds_min"], new[key]["wall_seconds_min"]
+        ratio = n / o if o else float("inf")
+        flag = "  REGRESSION" if ratio > threshold else ""
+        log(f"{key[0]:<24} {key[1]:>12,} {o:>10.3f} {n:>10.3f} {ratio:>7.2f}{flag}")
+        if ratio > threshold:
+            regressions.append({"benchmark": key[0], "rows": key[1], "profile": key[2], "ratio": ratio})
+    return regressions
+
+
+def main(argv=None):
+    from benchmarks.datasets import parse_scale, PROFILES
+
+    parser = argparse.ArgumentParser(description="InsightIQ benchmark suite")
+    parser.add_argument("--scales", default=DEFAULT_SCALES, help="comma-separated row counts, e.g. 10k,1M")
+    parser.add_argument("--profile", default="default", choices=sorted(PROFILES))
+    parser.add_argument("--only", default="", help="comma-separated benchmark names")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--timeout", type=float, default=1800, help="seconds per case")
+    parser.add_argument("--trace-memory", action="store_true", help="record tracemalloc peaks (slower)")
+    parser.add_argument("--no-caps", action="store_true", help="run heavy benchmarks above their row caps")
+    parser.add_argument("--out", default=None, help="output JSON path")
+    parser.add_argument("--compare", nargs=2, metavar=("OLD", "NEW"))
+    parser.add_argument("--threshold", type=float, default=1.2, help="regression ratio for --compare")
+    args = parser.parse_args(argv)
+
+    if args.compare:
+        regressions = compare(*args.compare, threshold=args.threshold)
+        return 1 if regressions else 0
+
+    names = [n for n in args.only.split(",") if n] or list(BENCHMARKS)
+    unknown = set(names) - set(BENCHMARKS)
+    if unknown:
+        parser.error(f"unknown benchmarks: {sorted(unknown)}")
+    scales = [parse_scale(s) for s in args.scales.split(",") if s]
+
+    started = datetime.now(timezone.utc)
+    results = run_suite(names, scales, args.profile, args.repeat, args.trace_memory,
+                        args.seed, args.timeout, args.no_caps)
+    doc = {
+        "schema_version": SCHEMA_VERSION,
+        "created": started.isoformat(),
+        "environment": environment_info(),
+        "config": {"profile": args.profile, "scales": scales, "repeat": args.repeat,
+                   "seed": args.seed, "trace_memory": args.trace_memory},
+        "results": results,
+    }
+    out = Path(args.out) if args.out else RESULTS_DIR / f"bench_{args.profile}_{started:%Y%m%dT%H%M%S}.json"
+    out.parent.mkdir(parents=True, exist_ok=True)
+    out.write_text(json.dumps(doc, indent=2, default=str))
+    print(f"Results written to {out}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,17 +1,13 @@
 # core/ai_summarizer.py
-from transformers import pipeline
-import streamlit as st
-import os
 import pandas as pd
+from services.instrumentation import instrumented
+from services.llm_service import get_inference_service
 
-@st.cache_resource(show_spinner=False)
 def load_summarizer(model_name: str = None):
     """
-    Load Flan-T5 or other text2text model. CPU by default (device=-1).
+    Shared Flan-T5 (or other text2text) pipeline from the inference service. CPU by default.
     """
-    if model_name is None:
-        model_name = os.getenv("INSIGHT_MODEL", "google/flan-t5-small")
-    return pipeline("text2text-generation", model=model_name, device=-1)
+    return get_inference_service(model_name).pipeline()
 
 def build_summarizer_prompt(kpis: dict, sample_rows: pd.DataFrame = None, max_cols=6, max_rows=10):
     """
@@ -21,11 +17,14 @@ def build_summarizer_prompt(kpis: dict, sample_rows: pd.DataFrame = None, max_co
     lines = []
     lines.append(f"Dataset summary: {kpis.get('row_count', '?')} rows, {kpis.get('column_count', '?')} columns.")
     lines.append(f"Missing % overall: {kpis.get('missing_pct_overall', '?'):.4f}")
-    lines.append(f"Duplicates: {kpis.get('duplicate_rows', 0)}.")
+    if kpis.get("duplicate_rows", 0) is not None:
+        lines.append(f"Duplicates: {kpis.get('duplicate_rows', 0)}.")
     numeric_sample = kpis.get("numeric_sample_stats", {})
     if numeric_sample:
         for col, stats in list(numeric_sample.items())[:3]:
             lines.append(f"{col} mean {stats.get('mean',0):.2f}, median {stats.get('median',0):.2f}.")
+    for pair in kpis.get("top_correlations", [])[:3]:
+        lines.append(f"{pair['a']} vs {pair['b']}: r={pair['r']:.2f}.")
     if sample_rows is not None and not sample_rows.empty:
         small = sample_rows.iloc[:max_rows, :max_cols]
         lines.append("Sample rows (truncated):")
@@ -38,16 +37,15 @@ def build_summarizer_prompt(kpis: dict, sample_rows: pd.DataFrame = None, max_co
     )
     return prompt
 
-def generate_summary(kpis: dict, sample_rows: pd.DataFrame = None, model_name: str = None, max_length: int = 120):
+@instrumented()
+def generate_summary(kpis: dict, sample_rows: pd.DataFrame = None, model_name: str = None, max_length: int = None,
+                     service=None):
     """
     Generate human-readable summary using local model.
     Keep sample_rows small to avoid token length errors.
+    The service truncates over-long prompts (max_input_chars) and caches results by prompt.
+    max_length overrides the service's max_new_tokens (llm.max_new_tokens) only when given.
     """
-    model = load_summarizer(model_name)
+    service = service or get_inference_service(model_name)
     prompt = build_summarizer_prompt(kpis, sample_rows=sample_rows)
-    # Ensure we don't exceed token limits by limiting prompt length (heuristic)
-    if len(prompt) > 2000:
-        prompt = prompt[:2000] + "\n\n[truncated input]"
-    out = model(prompt, max_new_tokens=150, do_sample=False)
-    text = out[0].get("generated_text") or out[0].get("summary_text") or str(out[0])
-    return text
+    return service.generate(prompt, **({"max_new_tokens": max_length} if max_length else {}))
@@ -1,21 +1,27 @@
 # core/anomaly_detector.py
+from concurrent.futures import ThreadPoolExecutor
 import pandas as pd
 import numpy as np
 from sklearn.ensemble import IsolationForest
 from sklearn.preprocessing import StandardScaler
+from services.instrumentation import instrumented
+from services.model_store import ModelStore
 
-def detect_anomalies(df: pd.DataFrame, numeric_only: bool = True, n_estimators: int = 100, contamination: float = 0.01):
+@instrumented()
+def detect_anomalies(df: pd.DataFrame, numeric_only: bool = True, n_estimators: int = 100, contamination: float = 0.01, stats=None):
     """
     Run IsolationForest on numeric features and return:
       - anomalies: DataFrame with anomaly score and flag
       - summary: dict with counts
+    stats: optional ColumnStats of df, reused for numeric columns and fill medians.
     """
-    numeric = df.select_dtypes(include="number")
+    numeric = df[stats.numeric_cols] if stats is not None else df.select_dtypes(include="number")
     if numeric_only and numeric.shape[1] == 0:
         return pd.DataFrame(), {"message": "No numeric columns for anomaly detection."}
 
     # Fill NaNs (simple)
-    X = numeric.fillna(numeric.median())
+    medians = stats.medians.reindex(numeric.columns) if stats is not None else numeric.median()
+    X = numeric.fillna(medians)
     # scale
     scaler = StandardScaler()
     Xs = scaler.fit_transform(X)
@@ -35,3 +41,138 @@ def detect_anomalies(df: pd.DataFrame, numeric_only: bool = True, n_estimators:
         "anomaly_fraction": float((out["_anomaly_flag"]).mean())
     }
     return out, summary
+
+
+# -------------------------------
+# Scalable mode: fit once on a sample, persist, score in parallel chunks
+# -------------------------------
+ANOMALY_MODEL_KIND = "anomaly"
+DEFAULT_SAMPLE_SIZE = 100_000
+DEFAULT_CHUNKSIZE = 200_000
+
+
+class AnomalyModel:
+    """
+    Fitted scaler + IsolationForest plus everything needed to score new rows
+    (feature columns and the medians used to fill their NaNs).
+    """
+
+    def __init__(self, columns, fill_values, scaler, forest, fitted_rows, params):
+        self.columns = list(columns)
+        self.fill_values = np.asarray(fill_values, dtype=np.float64)
+        self.scaler = scaler
+        self.forest = forest
+        self.fitted_rows = fitted_rows
+        self.params = params
+
+    def decision_scores(self, frame: pd.DataFrame) -> np.ndarray:
+        """decision_function for the rows of frame (higher is normal, < 0 is anomalous)."""
+        X = frame[self.columns].to_numpy(dtype=np.float64, na_value=np.nan)
+        nan_rows, nan_cols = np.nonzero(np.isnan(X))
+        X[nan_rows, nan_cols] = self.fill_values[nan_cols]
+        return self.forest.decision_function(self.scaler.transform(X))
+
+
+def _anomaly_features(df: pd.DataFrame, stats=None):
+    return list(stats.numeric_cols) if stats is not None else df.select_dtypes(include="number").columns.tolist()
+
+
+def anomaly_model_key(df: pd.DataFrame, columns, params: dict, version=None) -> str:
+    return ModelStore.make_key(columns, [df[c].dtype for c in columns], params, version)
+
+
+@instrumented()
+def fit_anomaly_model(df: pd.DataFrame, sample_size: int = DEFAULT_SAMPLE_SIZE, n_estimators: int = 100,
+                      contamination: float = 0.01, stats=None, n_jobs: int = -1, random_state: int = 42):
+    """
+    Fit the scaler and IsolationForest on at most sample_size rows (IsolationForest itself
+    only looks at 256 rows per tree, so a bounded sample loses little).
+    """
+    columns = _anomaly_features(df, stats)
+    if not columns:
+        return None
+    fit_df = df.sample(n=sample_size, random_state=random_state) if len(df) > sample_size else df
+    numeric = fit_df[columns]
+    medians = stats.medians.reindex(columns) if stats is not None else numeric.median()
+    medians = medians.fillna(0)  # all-null columns
+    X = numeric.fillna(medians).to_numpy(dtype=np.float64, na_value=np.nan)
+
+    scaler = StandardScaler()
+    Xs = scaler.fit_transform(X)
+    forest = IsolationForest(n_estimators=n_estimators, contamination=contamination,
+                             random_state=random_state, n_jobs=n_jobs)
+    forest.fit(Xs)
+    params = {"n_estimators": n_estimators, "contamination": contamination, "sample_size": sample_size}
+    return AnomalyModel(columns, medians.to_numpy(), scaler, forest, len(fit_df), params)
+
+
+def iter_anomaly_scores(chunks, model: AnomalyModel):
+    """
+    Score a stream of chunks (e.g. newly loaded rows) and yield (flagged_index, flagged_scores) per chunk.
+    """
+    for chunk in chunks:
+        scores = model.decision_scores(chunk)
+        flagged = scores < 0
+        yield chunk.index[flagged], scores[flagged]
+
+
+@instrumented()
+def score_anomalies(df: pd.DataFrame, model: AnomalyModel, chunksize: int = DEFAULT_CHUNKSIZE, n_workers: int = None):
+    """
+    Score every row in parallel chunks without copying the frame.
+    Returns a DataFrame indexed like df holding only flagged rows (column "_anomaly_score")
+    and a summary dict.
+    """
+    bounds = [(start, min(start + chunksize, len(df))) for start in range(0, len(df), chunksize)]
+
+    def score_chunk(bound):
+        start, stop = bound
+        scores = model.decision_scores(df.iloc[start:stop])
+        flagged = np.flatnonzero(scores < 0)
+        return start + flagged, scores[flagged]
+
+    positions, scores = [], []
+    with ThreadPoolExecutor(max_workers=n_workers) as pool:
+        for pos, sc in pool.map(score_chunk, bounds):
+            positions.append(pos)
+            scores.append(sc)
+    positions = np.concatenate(positions) if positions else np.empty(0, dtype=np.int64)
+    scores = np.concatenate(scores) if scores else np.empty(0)
+
+    flagged = pd.DataFrame({"_anomaly_score": scores}, index=df.index[positions])
+    summary = {
+        "total_rows": len(df),
+        "anomaly_count": int(len(flagged)),
+        "anomaly_fraction": float(len(flagged) / len(df)) if len(df) else 0.0,
+    }
+    return flagged, summary
+
+
+@instrumented()
+def detect_anomalies_scalable(df: pd.DataFrame, store=None, version=None, sample_size: int = DEFAULT_SAMPLE_SIZE,
+                              n_estimators: int = 100, contamination: float = 0.01, chunksize: int = DEFAULT_CHUNKSIZE,
+                              stats=None, n_workers: int = None):
+    """
+    Large-data variant of detect_anomalies:
+      - reuses a persisted model for the same schema/parameters/version from `store`
+        (services.model_store.ModelStore), otherwise fits on a sample and saves it
+      - scores all rows in parallel chunks and returns only flagged rows and their scores
+    Pass a new `version` (e.g. a retraining date) to force a refit.
+    """
+    columns = _anomaly_features(df, stats)
+    if not columns:
+        return pd.DataFrame(), {"message": "No numeric columns for anomaly detection."}
+
+    params = {"n_estimators": n_estimators, "contamination": contamination, "sample_size": sample_size}
+    key = anomaly_model_key(df, columns, params, version)
+    model = store.load(ANOMALY_MODEL_KIND, key) if store is not None else None
+    from_cache = model is not None
+    if model is None:
+        model = fit_anomaly_model(df, sample_size=sample_size, n_estimators=n_estimators,
+                                  contamination=contamination, stats=stats)
+        if store is not None:
+            store.save(ANOMALY_MODEL_KIND, key, model)
+
+    flagged, summary = score_anomalies(df, model, chunksize=chunksize, n_workers=n_workers)
+    summary.update({"model_key": key, "model_from_cache": from_cache, "fitted_rows": model.fitted_rows})
+    return flagged, summary
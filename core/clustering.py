@@ -1,19 +1,26 @@
 # core/clustering.py
+from concurrent.futures import ThreadPoolExecutor
 import pandas as pd
 import numpy as np
-from sklearn.cluster import KMeans
+from sklearn.cluster import KMeans, MiniBatchKMeans
 from sklearn.decomposition import PCA
+from sklearn.metrics import silhouette_score
 from sklearn.preprocessing import StandardScaler
+from services.instrumentation import instrumented
+from services.model_store import ModelStore
 
-def run_kmeans(df: pd.DataFrame, n_clusters: int = 3, numeric_only: bool = True, use_pca: bool = True, pca_components: int = 5):
+@instrumented()
+def run_kmeans(df: pd.DataFrame, n_clusters: int = 3, numeric_only: bool = True, use_pca: bool = True, pca_components: int = 5, stats=None):
     """
     Performs KMeans on numeric columns. Returns dataframe with cluster labels and a summary dict.
+    stats: optional ColumnStats of df, reused for numeric columns and fill medians.
     """
-    numeric = df.select_dtypes(include="number")
+    numeric = df[stats.numeric_cols] if stats is not None else df.select_dtypes(include="number")
     if numeric.shape[1] == 0:
         return pd.DataFrame(), {"message": "No numeric columns for clustering."}
 
-    X = numeric.fillna(numeric.median())
+    medians = stats.medians.reindex(numeric.columns) if stats is not None else numeric.median()
+    X = numeric.fillna(medians)
     scaler = StandardScaler()
     Xs = scaler.fit_transform(X)
 
@@ -43,3 +50,163 @@ def run_kmeans(df: pd.DataFrame, n_clusters: int = 3, numeric_only: bool = True,
         "centers": centers
     }
     return out, summary
+
+
+# -------------------------------
+# Scalable engine: sample-based k selection, mini-batch fitting, chunked label assignment
+# -------------------------------
+CLUSTERING_MODEL_KIND = "clustering"
+DEFAULT_SAMPLE_SIZE = 100_000
+DEFAULT_CHUNKSIZE = 200_000
+DEFAULT_K_CANDIDATES = tuple(range(2, 9))
+
+
+class ClusteringModel:
+    """
+    Fitted preprocessing (fill values, scaler, optional PCA) plus MiniBatchKMeans centroids.
+    """
+
+    def __init__(self, columns, fill_values, scaler, pca, kmeans, k_scores, fitted_rows, params):
+        self.columns = list(columns)
+        self.fill_values = np.asarray(fill_values, dtype=np.float64)
+        self.scaler = scaler
+        self.pca = pca
+        self.kmeans = kmeans
+        self.k_scores = k_scores
+        self.fitted_rows = fitted_rows
+        self.params = params
+
+    @property
+    def n_clusters(self) -> int:
+        return int(self.kmeans.n_clusters)
+
+    def transform(self, frame: pd.DataFrame) -> np.ndarray:
+        X = frame[self.columns].to_numpy(dtype=np.float64, na_value=np.nan)
+        nan_rows, nan_cols = np.nonzero(np.isnan(X))
+        X[nan_rows, nan_cols] = self.fill_values[nan_cols]
+        Xs = self.scaler.transform(X)
+        return self.pca.transform(Xs) if self.pca is not None else Xs
+
+    def predict(self, frame: pd.DataFrame) -> np.ndarray:
+        return self.kmeans.predict(self.transform(frame)).astype(np.int32)
+
+
+def _evaluate_k(k, X, batch_size, silhouette_sample, random_state):
+    km = MiniBatchKMeans(n_clusters=k, batch_size=batch_size, random_state=random_state, n_init=3)
+    labels = km.fit_predict(X)
+    silhouette = float("nan")
+    if len(np.unique(labels)) > 1:
+        silhouette = float(silhouette_score(X, labels, sample_size=min(silhouette_sample, len(X)),
+                                            random_state=random_state))
+    return {"k": int(k), "inertia": float(km.inertia_), "silhouette": silhouette}
+
+
+def select_k(X: np.ndarray, candidates=DEFAULT_K_CANDIDATES, batch_size: int = 4096,
+             silhouette_sample: int = 10_000, n_workers: int = None, random_state: int = 42):
+    """
+    Fit MiniBatchKMeans for every candidate k in parallel and pick the best silhouette
+    (inertia breaks ties / is reported for elbow plots). Returns (best_k, scores).
+    """
+    candidates = [k for k in candidates if 1 < k < len(X)]
+    if not candidates:
+        return 1, []
+    with ThreadPoolExecutor(max_workers=n_workers) as pool:
+        scores = list(pool.map(lambda k: _evaluate_k(k, X, batch_size, silhouette_sample, random_state), candidates))
+    valid = [s for s in scores if not np.isnan(s["silhouette"])]
+    best = max(valid, key=lambda s: (s["silhouette"], -s["inertia"])) if valid else scores[0]
+    return best["k"], scores
+
+
+@instrumented()
+def fit_clustering_model(df: pd.DataFrame, n_clusters=None, candidates=DEFAULT_K_CANDIDATES,
+                         sample_size: int = DEFAULT_SAMPLE_SIZE, use_pca: bool = True, pca_components: int = 5,
+                         batch_size: int = 4096, full_pass: bool = False, chunksize: int = DEFAULT_CHUNKSIZE,
+                         stats=None, n_workers: int = None, random_state: int = 42):
+    """
+    Fit scaler/PCA on a sample, choose k on that sample when n_clusters is None,
+    then fit MiniBatchKMeans. full_pass=True additionally streams every row through
+    partial_fit in chunks to refine the centroids.
+    """
+    columns = list(stats.numeric_cols) if stats is not None else df.select_dtypes(include="number").columns.tolist()
+    if not columns:
+        return None
+    fit_df = df.sample(n=sample_size, random_state=random_state) if len(df) > sample_size else df
+    medians = stats.medians.reindex(columns) if stats is not None else fit_df[columns].median()
+    medians = medians.fillna(0)
+
+    X = fit_df[columns].fillna(medians).to_numpy(dtype=np.float64, na_value=np.nan)
+    scaler = StandardScaler().fit(X)
+    Xs = scaler.transform(X)
+    pca = None
+    if use_pca and Xs.shape[1] > pca_components:
+        pca = PCA(n_components=min(pca_components, Xs.shape[1]), random_state=random_state).fit(Xs)
+        Xs = pca.transform(Xs)
+
+    k_scores = []
+    if n_clusters is None:
+        n_clusters, k_scores = select_k(Xs, candidates, batch_size=batch_size, n_workers=n_workers,
+                                        random_state=random_state)
+    kmeans = MiniBatchKMeans(n_clusters=n_clusters, batch_size=batch_size, random_state=random_state, n_init=3)
+    kmeans.fit(Xs)
+
+    params = {"n_clusters": n_clusters, "use_pca": use_pca, "pca_components": pca_components,
+              "sample_size": sample_size}
+    model = ClusteringModel(columns, medians.to_numpy(), scaler, pca, kmeans, k_scores, len(fit_df), params)
+    if full_pass:
+        for start in range(0, len(df), chunksize):
+            model.kmeans.partial_fit(model.transform(df.iloc[start:start + chunksize]))
+        model.fitted_rows = len(df)
+    return model
+
+
+def iter_cluster_labels(chunks, model: ClusteringModel):
+    """Assign labels to a stream of chunks; yields a labels Series per chunk."""
+    for chunk in chunks:
+        yield pd.Series(model.predict(chunk), index=chunk.index, name="_cluster")
+
+
+@instrumented()
+def assign_clusters(df: pd.DataFrame, model: ClusteringModel, chunksize: int = DEFAULT_CHUNKSIZE, n_workers: int = None):
+    """Labels for every row, computed in parallel chunks (no copy of df)."""
+    bounds = range(0, len(df), chunksize)
+    with ThreadPoolExecutor(max_workers=n_workers) as pool:
+        parts = list(pool.map(lambda start: model.predict(df.iloc[start:start + chunksize]), bounds))
+    labels = np.concatenate(parts) if parts else np.empty(0, dtype=np.int32)
+    return pd.Series(labels, index=df.index, name="_cluster")
+
+
+@instrumented()
+def run_kmeans_scalable(df: pd.DataFrame, n_clusters=None, store=None, version=None, candidates=DEFAULT_K_CANDIDATES,
+                        sample_size: int = DEFAULT_SAMPLE_SIZE, use_pca: bool = True, pca_components: int = 5,
+                        chunksize: int = DEFAULT_CHUNKSIZE, full_pass: bool = False, stats=None, n_workers: int = None):
+    """
+    Large-data variant of run_kmeans. Returns (labels Series aligned to df, summary dict with the
+    same keys as run_kmeans plus k_scores). With a ModelStore, the fitted scaler/PCA/centroids are
+    reused for the same schema/parameters/version instead of refitting.
+    """
+    columns = list(stats.numeric_cols) if stats is not None else df.select_dtypes(include="number").columns.tolist()
+    if not columns:
+        return pd.Series(dtype="int32"), {"message": "No numeric columns for clustering."}
+
+    params = {"n_clusters": n_clusters, "candidates": list(candidates), "sample_size": sample_size,
+              "use_pca": use_pca, "pca_components": pca_components, "full_pass": full_pass}
+    key = ModelStore.make_key(columns, [df[c].dtype for c in columns], params, version)
+    model = store.load(CLUSTERING_MODEL_KIND, key) if store is not None else None
+    from_cache = model is not None
+    if model is None:
+        model = fit_clustering_model(df, n_clusters=n_clusters, candidates=candidates, sample_size=sample_size,
+                                     use_pca=use_pca, pca_components=pca_components, full_pass=full_pass,
+                                     chunksize=chunksize, stats=stats, n_workers=n_workers)
+        if store is not None:
+            store.save(CLUSTERING_MODEL_KIND, key, model)
+
+    labels = assign_clusters(df, model, chunksize=chunksize, n_workers=n_workers)
+    summary = {
+        "n_clusters": model.n_clusters,
+        "counts": labels.value_counts().to_dict(),
+        "centers": model.kmeans.cluster_centers_.tolist(),
+        "k_scores": model.k_scores,
+        "model_key": key,
+        "model_from_cache": from_cache,
+    }
+    return labels, summary
@@ -0,0 +1,171 @@
+# core/column_stats.py
+# Single-pass per-column statistics shared by cleaning, KPIs and modelling
+
+import hashlib
+import numpy as np
+import pandas as pd
+from services.instrumentation import instrumented
+
+# Multiplier used to fold per-column hashes into one 64-bit hash per row
+_ROW_HASH_PRIME = np.uint64(1099511628211)
+
+NUMERIC_STATS = ["mean", "median", "min", "max"]
+
+
+class ColumnStats:
+    """
+    Facts about every column of one DataFrame, computed in a single scan:
+      - null_counts, distinct_counts (Series indexed by column)
+      - numeric_cols / categorical_cols / datetime_cols
+      - numeric_summary: DataFrame indexed by numeric column with mean/median/min/max
+      - row_hashes: one uint64 per row, used for duplicate detection
+    Only valid for the exact frame it was computed on.
+    """
+
+    def __init__(self, n_rows, null_counts, distinct_counts, numeric_cols, categorical_cols,
+                 datetime_cols, numeric_summary, row_hashes):
+        self.n_rows = n_rows
+        self.null_counts = null_counts
+        self.distinct_counts = distinct_counts
+        self.numeric_cols = numeric_cols
+        self.categorical_cols = categorical_cols
+        self.datetime_cols = datetime_cols
+        self.numeric_summary = numeric_summary
+        self.row_hashes = row_hashes
+        self._duplicate_mask = None
+
+    @property
+    def columns(self):
+        return self.null_counts.index.tolist()
+
+    @property
+    def null_fraction(self) -> pd.Series:
+        if self.n_rows == 0:
+            return self.null_counts.astype(float)
+        return self.null_counts / self.n_rows
+
+    @property
+    def missing_fraction_overall(self) -> float:
+        cells = self.n_rows * len(self.null_counts)
+        return float(self.null_counts.sum() / cells) if cells else float("nan")
+
+    @property
+    def duplicate_mask(self) -> np.ndarray:
+        """
+        True for every row that repeats an earlier row (same semantics as df.duplicated()).
+        """
+        if self._duplicate_mask is None:
+            self._duplicate_mask = pd.Series(self.row_hashes).duplicated().to_numpy()
+        return self._duplicate_mask
+
+    @property
+    def duplicate_rows(self) -> int:
+        return int(self.duplicate_mask.sum())
+
+    def fingerprint(self, df: pd.DataFrame) -> str:
+        """Content hash of df, reusing the row hashes from this scan."""
+        return frame_fingerprint(df, self.row_hashes)
+
+    @property
+    def means(self) -> pd.Series:
+        return self.numeric_summary["mean"]
+
+    @property
+    def medians(self) -> pd.Series:
+        return self.numeric_summary["median"]
+
+    def to_dict(self) -> dict:
+        """
+        JSON-friendly per-column summary (no row-level data).
+        """
+        out = {}
+        for col in self.columns:
+            entry = {
+                "null_count": int(self.null_counts[col]),
+                "distinct_count": int(self.distinct_counts[col]),
+                "kind": ("numeric" if col in self.numeric_cols else
+                         "categorical" if col in self.categorical_cols else
+                         "datetime" if col in self.datetime_cols else "other"),
+            }
+            if col in self.numeric_summary.index:
+                entry.update({k: float(self.numeric_summary.at[col, k]) for k in NUMERIC_STATS})
+            out[str(col)] = entry
+        return {"row_count": int(self.n_rows), "duplicate_rows": self.duplicate_rows, "columns": out}
+
+
+def _column_hashes(s: pd.Series) -> np.ndarray:
+    return pd.util.hash_pandas_object(s, index=False).to_numpy()
+
+
+def compute_row_hashes(df: pd.DataFrame, columns=None) -> np.ndarray:
+    """
+    64-bit hash per row, built column by column so no wide temporary is created.
+    columns: hash only these columns (avoids materialising df[columns]).
+    """
+    row_hashes = np.zeros(len(df), dtype=np.uint64)
+    for col in (df.columns if columns is None else columns):
+        row_hashes *= _ROW_HASH_PRIME
+        row_hashes ^= _column_hashes(df[col])
+    return row_hashes
+
+
+def frame_fingerprint(df: pd.DataFrame, row_hashes: np.ndarray = None) -> str:
+    """
+    Content hash of a DataFrame (values, column names and dtypes, not the index).
+    Pass precomputed row_hashes (e.g. ColumnStats.row_hashes) to avoid rehashing.
+    """
+    if row_hashes is None:
+        row_hashes = compute_row_hashes(df)
+    h = hashlib.sha256()
+    h.update(repr([(str(c), str(t)) for c, t in df.dtypes.items()]).encode("utf-8"))
+    h.update(np.ascontiguousarray(row_hashes).tobytes())
+    return h.hexdigest()
+
+
+@instrumented()
+def compute_column_stats(df: pd.DataFrame) -> ColumnStats:
+    """
+    Scan every column once, collecting null count, distinct count, numeric summary
+    and its contribution to the row hash.
+    """
+    n_rows = len(df)
+    numeric_cols = df.select_dtypes(include="number").columns.tolist()
+    categorical_cols = df.select_dtypes(include=["object", "string", "category"]).columns.tolist()
+    datetime_cols = df.select_dtypes(include="datetime").columns.tolist()
+    numeric_set = set(numeric_cols)
+
+    null_counts = {}
+    distinct_counts = {}
+    summary = {}
+    row_hashes = np.zeros(n_rows, dtype=np.uint64)
+
+    for col in df.columns:
+        s = df[col]
+        isna = s.isna().to_numpy()
+        null_counts[col] = int(isna.sum())
+
+        hashes = _column_hashes(s)
+        row_hashes *= _ROW_HASH_PRIME
+        row_hashes ^= hashes
+        distinct_counts[col] = int(len(pd.unique(hashes[~isna])))
+
+        if col in numeric_set:
+            values = s.to_numpy(dtype="float64", na_value=np.nan)[~isna]
+            if values.size:
+                summary[col] = [values.mean(), np.median(values), values.min(), values.max()]
+            else:
+                summary[col] = [np.nan] * len(NUMERIC_STATS)
+
+    numeric_summary = pd.DataFrame.from_dict(summary, orient="index", columns=NUMERIC_STATS)
+    numeric_summary = numeric_summary.reindex(numeric_cols)
+
+    return ColumnStats(
+        n_rows=n_rows,
+        null_counts=pd.Series(null_counts, dtype="int64").reindex(df.columns),
+        distinct_counts=pd.Series(distinct_counts, dtype="int64").reindex(df.columns),
+        numeric_cols=numeric_cols,
+        categorical_cols=categorical_cols,
+        datetime_cols=datetime_cols,
+        numeric_summary=numeric_summary,
+        row_hashes=row_hashes,
+    )
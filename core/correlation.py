@@ -0,0 +1,144 @@
+# core/correlation.py
+# One Pearson correlation pass shared by visuals, profiling and the insights prompt.
+
+import numpy as np
+import pandas as pd
+from services.instrumentation import instrumented
+
+DEFAULT_MAX_ROWS = 200_000
+DEFAULT_BLOCK_SIZE = 64
+
+
+class CorrelationResult:
+    """
+    Pairwise-complete Pearson matrix (float32) plus a ranked index of the strongest pairs.
+    """
+
+    def __init__(self, columns, matrix: np.ndarray, n_rows: int, population_rows: int):
+        self.columns = list(columns)
+        self.matrix = matrix
+        self.n_rows = n_rows
+        self.population_rows = population_rows
+        self._ranked = None
+
+    @property
+    def sampled(self) -> bool:
+        return self.n_rows < self.population_rows
+
+    def to_frame(self, columns=None) -> pd.DataFrame:
+        if columns is None:
+            return pd.DataFrame(self.matrix, index=self.columns, columns=self.columns)
+        pos = [self.columns.index(c) for c in columns]
+        return pd.DataFrame(self.matrix[np.ix_(pos, pos)], index=list(columns), columns=list(columns))
+
+    def _ranked_pairs(self):
+        if self._ranked is None:
+            i, j = np.triu_indices(len(self.columns), k=1)
+            r = self.matrix[i, j]
+            valid = ~np.isnan(r)
+            i, j, r = i[valid], j[valid], r[valid]
+            order = np.argsort(-np.abs(r), kind="stable")
+            self._ranked = (i[order], j[order], r[order])
+        return self._ranked
+
+    def top_pairs(self, k: int = 10, min_abs: float = 0.0):
+        """The k strongest pairs by |r|: [{"a", "b", "r"}, ...]."""
+        i, j, r = self._ranked_pairs()
+        out = []
+        for a, b, v in zip(i[:k], j[:k], r[:k]):
+            if abs(v) < min_abs:
+                break
+            out.append({"a": str(self.columns[a]), "b": str(self.columns[b]), "r": round(float(v), 4)})
+        return out
+
+    def focus_columns(self, max_columns: int = 20):
+        """Columns taking part in the strongest pairs, in rank order (for readable heatmaps)."""
+        if len(self.columns) <= max_columns:
+            return list(self.columns)
+        i, j, _ = self._ranked_pairs()
+        chosen = []
+        for a, b in zip(i, j):
+            for c in (a, b):
+                if c not in chosen:
+                    chosen.append(c)
+            if len(chosen) >= max_columns:
+                break
+        return [self.columns[c] for c in chosen[:max_columns]]
+
+
+def _block_stats(x_i, m_i, x_j, m_j):
+    """
+    Pairwise-complete sums between two column blocks (NaNs zeroed, m = non-null mask) via matmuls.
+    """
+    n = m_i.T @ m_j
+    sx = x_i.T @ m_j
+    sy = m_i.T @ x_j
+    sxx = (x_i * x_i).T @ m_j
+    syy = m_i.T @ (x_j * x_j)
+    sxy = x_i.T @ x_j
+    with np.errstate(invalid="ignore", divide="ignore"):
+        cov = n * sxy - sx * sy
+        var = (n * sxx - sx * sx) * (n * syy - sy * sy)
+        r = cov / np.sqrt(var)
+    r[(n < 2) | ~(var > 0)] = np.nan
+    return np.clip(r, -1.0, 1.0)
+
+
+def _column_block(df, columns, rows, means):
+    """
+    Centred float32 values (NaNs zeroed) and float32 non-null mask for one block of columns.
+    """
+    x = np.empty((len(df) if rows is None else len(rows), len(columns)), dtype=np.float32)
+    for pos, col in enumerate(columns):
+        values = df[col].to_numpy(dtype="float64", na_value=np.nan)
+        if rows is not None:
+            values = values[rows]
+        x[:, pos] = values - means[col]
+    mask = np.isfinite(x)
+    x[~mask] = 0.0
+    return x, mask.astype(np.float32)
+
+
+@instrumented()
+def compute_correlation(df: pd.DataFrame, columns=None, max_rows: int = DEFAULT_MAX_ROWS,
+                        block_size: int = DEFAULT_BLOCK_SIZE, seed: int = 42) -> CorrelationResult:
+    """
+    Pearson correlation of numeric columns (pairwise-complete, like DataFrame.corr()),
+    computed in float32 one pair of column blocks at a time: only two blocks of block_size
+    columns are held as float32 arrays at once, never the whole numeric table.
+    Above max_rows rows a seeded uniform row sample is used.
+    """
+    if columns is None:
+        columns = [c for c in df.select_dtypes(include="number").columns if not pd.api.types.is_bool_dtype(df[c])]
+    columns = list(columns)
+    population = len(df)
+    rows = None
+    if max_rows and population > max_rows:
+        rows = np.sort(np.random.default_rng(seed).choice(population, size=max_rows, replace=False))
+
+    # Centre each column (float64 mean) before the float32 products to limit cancellation error
+    means = {}
+    for col in columns:
+        values = df[col].to_numpy(dtype="float64", na_value=np.nan)
+        if rows is not None:
+            values = values[rows]
+        finite = values[np.isfinite(values)]
+        means[col] = finite.mean() if len(finite) else 0.0
+
+    p = len(columns)
+    matrix = np.full((p, p), np.nan, dtype=np.float32)
+    for start_i in range(0, p, block_size):
+        si = slice(start_i, min(start_i + block_size, p))
+        x_i, m_i = _column_block(df, columns[si], rows, means)
+        for start_j in range(start_i, p, block_size):
+            sj = slice(start_j, min(start_j + block_size, p))
+            x_j, m_j = (x_i, m_i) if start_j == start_i else _column_block(df, columns[sj], rows, means)
+            block = _block_stats(x_i, m_i, x_j, m_j)
+            matrix[si, sj] = block
+            matrix[sj, si] = block.T
+    # Self-correlation is exactly 1 (NaN stays for constant / all-null columns)
+    diag = np.diagonal(matrix).copy()
+    diag[~np.isnan(diag)] = 1.0
+    np.fill_diagonal(matrix, diag)
+    n_rows = population if rows is None else len(rows)
+    return CorrelationResult(columns, matrix, n_rows=n_rows, population_rows=population)
@@ -1,40 +1,125 @@
 # core/data_cleaning.py
 # Functions for data cleaning and preprocessing.
 
+import numpy as np
 import pandas as pd
-from sklearn.impute import SimpleImputer
+from core.column_stats import compute_column_stats, compute_row_hashes
+from services.instrumentation import instrumented, current_rss_bytes
 
-def basic_cleaning(df: pd.DataFrame, drop_threshold=0.9, fill_numeric_strategy="mean"):
+MB = 1024 * 1024
+# Upper bound on the bytes of columns copied at once while cleaning
+DEFAULT_MEMORY_BUDGET_MB = 256
+
+
+def _column_batches(df: pd.DataFrame, columns, budget_bytes: int):
+    """Group columns into consecutive batches whose in-memory size stays under budget_bytes."""
+    batch, size = [], 0
+    for col in columns:
+        col_bytes = int(df[col].memory_usage(index=False, deep=False))
+        if batch and size + col_bytes > budget_bytes:
+            yield batch
+            batch, size = [], 0
+        batch.append(col)
+        size += col_bytes
+    if batch:
+        yield batch
+
+
+def _with_category(s: pd.Series, value) -> pd.Series:
+    """Categoricals can only be filled with an existing category (e.g. 'Unknown')."""
+    if isinstance(s.dtype, pd.CategoricalDtype) and value not in s.cat.categories:
+        return s.cat.add_categories([value])
+    return s
+
+
+@instrumented()
+def basic_cleaning(df: pd.DataFrame, drop_threshold=0.9, fill_numeric_strategy="mean", stats=None,
+                   memory_budget_mb=DEFAULT_MEMORY_BUDGET_MB, inplace=False):
     """
     - Drop columns with > drop_threshold fraction of missing values
     - Fill numeric missing values with mean/median and categorical with 'Unknown'
     - Drop exact duplicate rows
-    Returns cleaned dataframe and a dict with cleaning summary.
+    stats: optional ColumnStats of df (computed here if not given) so nulls,
+    row hashes and fill values are not recomputed.
+    The result is assembled column by column: untouched columns are shared with df, and rows are
+    copied at most once, in batches of up to memory_budget_mb. inplace=True also releases each
+    batch from df as it is cleaned (df is left empty), keeping peak memory near one frame.
+    Returns cleaned dataframe and a dict with cleaning summary. Its peak_memory_mb is the resident
+    size of the whole process (highest value sampled between batches), not of this call: stages
+    running concurrently count too. memory_overhead_mb is how far it rose above the starting RSS.
     """
     summary = {}
     initial_shape = df.shape
     summary["initial_shape"] = initial_shape
+    rss_start = current_rss_bytes()
+    rss_peak = rss_start
+    if stats is None:
+        stats = compute_column_stats(df)
 
-    # Drop columns with too many nulls
-    col_null_frac = df.isnull().mean()
+    # Drop columns with too many nulls (by leaving them out of the result, no copy)
+    col_null_frac = stats.null_fraction
     drop_cols = col_null_frac[col_null_frac > drop_threshold].index.tolist()
-    df = df.drop(columns=drop_cols)
+    dropped = set(drop_cols)
+    keep_cols = [c for c in df.columns if c not in dropped]
     summary["dropped_columns"] = drop_cols
 
-    # Drop duplicate rows
-    dup_count = df.duplicated().sum()
-    df = df.drop_duplicates()
-    summary["duplicates_removed"] = int(dup_count)
+    # Drop duplicate rows (row hashes only need recomputing if columns were dropped)
+    if drop_cols:
+        dup_mask = pd.Series(compute_row_hashes(df, columns=keep_cols)).duplicated().to_numpy()
+    else:
+        dup_mask = stats.duplicate_mask
+    dup_count = int(dup_mask.sum())
+    keep_rows = np.flatnonzero(~dup_mask) if dup_count else None
+    summary["duplicates_removed"] = dup_count
+
+    # Only columns with nulls are filled; precomputed fill values are reused unless rows were removed
+    numeric = set(stats.numeric_cols)
+    categorical = set(df.select_dtypes(include=["object", "string", "category"]).columns)
+    has_nulls = {c for c in keep_cols if stats.null_counts[c] > 0}
 
-    # Numeric imputation
-    num_cols = df.select_dtypes(include="number").columns
-    if len(num_cols):
-        num_imp = SimpleImputer(strategy=fill_numeric_strategy)
-        df[num_cols] = pd.DataFrame(num_imp.fit_transform(df[num_cols]), columns=num_cols)
+    cleaned = {}
+    budget_bytes = max(int(memory_budget_mb * MB), 1)
+    for batch in _column_batches(df, keep_cols, budget_bytes):
+        if keep_rows is not None:
+            # One positional take for the whole batch instead of a full-frame boolean filter.
+            # The take already copied the rows; the shallow copy only detaches `part` from df so
+            # filling it in place below does not raise SettingWithCopyWarning
+            part = df.iloc[keep_rows, [df.columns.get_loc(c) for c in batch]].copy(deep=False)
+            fill_values = part[[c for c in batch if c in numeric and c in has_nulls]].agg(fill_numeric_strategy)
+        else:
+            part = df
+            fill_values = stats.numeric_summary[fill_numeric_strategy]
+        fills = {}
+        for col in batch:
+            if col not in has_nulls:
+                continue
+            if col in numeric:
+                fills[col] = fill_values[col]
+            elif col in categorical:
+                fills[col] = "Unknown"
+        if keep_rows is not None and fills:
+            # part is already a private copy, so fill it in place
+            for col in fills:
+                if isinstance(part[col].dtype, pd.CategoricalDtype):
+                    part[col] = _with_category(part[col], fills[col])
+            part.fillna(fills, inplace=True)
+        for col in batch:
+            if keep_rows is None and col in fills:
+                cleaned[col] = _with_category(part[col], fills[col]).fillna(fills[col])
+            else:
+                cleaned[col] = part[col]
+        if inplace:
+            for col in batch:
+                del df[col]
+        rss = current_rss_bytes()
+        if rss is not None and rss_peak is not None:
+            rss_peak = max(rss_peak, rss)
 
-    # Categorical fill
-    cat_cols = df.select_dtypes(include="object").columns
-    df[cat_cols] = df[cat_cols].fillna("Unknown")
+    index = df.index[keep_rows] if keep_rows is not None else df.index
+    df = pd.DataFrame(cleaned, copy=False) if cleaned else pd.DataFrame(index=index)
 
     summary["final_shape"] = df.shape
+    if rss_peak is not None:
+        summary["peak_memory_mb"] = round(rss_peak / MB, 2)
+        summary["memory_overhead_mb"] = round((rss_peak - rss_start) / MB, 2)
     return df, summary
@@ -0,0 +1,135 @@
+# core/dtype_optimizer.py
+# Compact dtypes after load: downcast numerics, categorize low-cardinality text, parse date-like text.
+
+import warnings
+import numpy as np
+import pandas as pd
+from services.instrumentation import instrumented
+
+# Text columns with at most this share of distinct values (and MAX_CATEGORIES) become categoricals
+MAX_CATEGORY_RATIO = 0.5
+MAX_CATEGORIES = 10_000
+# Share of non-null values that must parse for a text column to become datetime64
+MIN_DATE_PARSE_RATIO = 0.95
+DATE_PROBE_ROWS = 500
+
+
+def _column_bytes(s: pd.Series) -> int:
+    return int(s.memory_usage(index=False, deep=True))
+
+
+def _downcast_numeric(s: pd.Series) -> pd.Series:
+    """Smallest integer type that holds the range; float32 only when every value round-trips exactly."""
+    if pd.api.types.is_bool_dtype(s) or not isinstance(s.dtype, np.dtype):
+        return s
+    if pd.api.types.is_integer_dtype(s):
+        kind = "unsigned" if len(s) and s.min() >= 0 else "integer"
+        return pd.to_numeric(s, downcast=kind)
+    if s.dtype == np.float64:
+        values = s.to_numpy()
+        as32 = values.astype(np.float32)
+        with np.errstate(invalid="ignore"):
+            if np.array_equal(as32.astype(np.float64), values, equal_nan=True):
+                return pd.Series(as32, index=s.index, name=s.name)
+    return s
+
+
+def _looks_like_dates(s: pd.Series) -> bool:
+    probe = s.dropna()
+    if probe.empty:
+        return False
+    probe = probe.iloc[:DATE_PROBE_ROWS].astype(str)
+    # Plain numbers ("2021", "17") parse as dates too; require a date-ish separator
+    if probe.str.contains(r"[-/:]|\d{8}", regex=True).mean() < MIN_DATE_PARSE_RATIO:
+        return False
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore")
+        parsed = pd.to_datetime(probe, errors="coerce")
+    return parsed.notna().mean() >= MIN_DATE_PARSE_RATIO
+
+
+def _parse_dates(s: pd.Series):
+    """
+    Parsed column, or None if fewer than MIN_DATE_PARSE_RATIO of the non-null values parse.
+    Values that do not parse become NaT; the caller reports how many.
+    """
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore")
+        parsed = pd.to_datetime(s, errors="coerce")
+    non_null = s.notna().sum()
+    if non_null and parsed.notna().sum() / non_null >= MIN_DATE_PARSE_RATIO:
+        return parsed
+    return None
+
+
+def _coerced_count(before: pd.Series, after: pd.Series) -> int:
+    """Values that were present before and are missing after a conversion (unparseable dates)."""
+    return int((before.notna() & after.isna()).sum())
+
+
+def _optimize_text(s: pd.Series, parse_dates: bool, max_category_ratio: float, max_categories: int):
+    if parse_dates and _looks_like_dates(s):
+        parsed = _parse_dates(s)
+        if parsed is not None:
+            return parsed
+    n = s.notna().sum()
+    if n == 0:
+        return s
+    n_distinct = s.nunique(dropna=True)
+    if n_distinct <= max_categories and n_distinct / n <= max_category_ratio:
+        return s.astype("category")
+    return s
+
+
+@instrumented()
+def optimize_dtypes(df: pd.DataFrame, parse_dates: bool = True, downcast: bool = True, categorize: bool = True,
+                    max_category_ratio: float = MAX_CATEGORY_RATIO, max_categories: int = MAX_CATEGORIES):
+    """
+    Returns (optimized df, report). Columns that do not shrink keep their original dtype.
+    report: {"columns": {col: {"from", "to", "bytes_before", "bytes_after", "bytes_saved", "coerced_to_null"}},
+             "bytes_before", "bytes_after", "bytes_saved", "mb_saved", "values_coerced_to_null"}
+    Only changed columns are listed; unchanged columns are shared with df, not copied.
+    coerced_to_null counts values lost in the conversion: text columns become datetime64 when at least
+    MIN_DATE_PARSE_RATIO of their values parse, and the rest become NaT.
+    """
+    if not df.columns.is_unique:
+        # Column-by-column rebuild needs unique labels; leave such frames untouched
+        return df, {"columns": {}, "bytes_before": 0, "bytes_after": 0, "bytes_saved": 0, "mb_saved": 0.0,
+                    "values_coerced_to_null": 0, "skipped": "duplicate column names"}
+    columns = {}
+    report = {}
+    total_before = total_after = total_coerced = 0
+    for col in df.columns:
+        s = df[col]
+        before = _column_bytes(s)
+        new = s
+        if pd.api.types.is_numeric_dtype(s) and downcast:
+            new = _downcast_numeric(s)
+        elif (pd.api.types.is_object_dtype(s) or pd.api.types.is_string_dtype(s)) \
+                and not isinstance(s.dtype, pd.CategoricalDtype):
+            new = _optimize_text(s, parse_dates, max_category_ratio if categorize else 0.0,
+                                 max_categories if categorize else 0)
+        after = _column_bytes(new) if new is not s else before
+        # Dates are kept even if larger: they unlock time-series charts and forecasting
+        is_date = pd.api.types.is_datetime64_any_dtype(new) and not pd.api.types.is_datetime64_any_dtype(s)
+        if new is not s and (after < before or is_date):
+            columns[col] = new
+            coerced = _coerced_count(s, new) if is_date else 0
+            total_coerced += coerced
+            report[str(col)] = {"from": str(s.dtype), "to": str(new.dtype), "bytes_before": before,
+                                "bytes_after": after, "bytes_saved": before - after, "coerced_to_null": coerced}
+        else:
+            columns[col] = s
+            after = before
+        total_before += before
+        total_after += after
+
+    out = pd.DataFrame(columns, copy=False) if columns else df.copy()
+    return out, {
+        "columns": report,
+        "bytes_before": total_before,
+        "bytes_after": total_after,
+        "bytes_saved": total_before - total_after,
+        "mb_saved": round((total_before - total_after) / (1024 * 1024), 2),
+        "values_coerced_to_null": total_coerced,
+    }
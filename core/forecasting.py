@@ -1,9 +1,17 @@
 # core/forecasting.py
+import hashlib
+import multiprocessing as mp
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
 import pandas as pd
 import numpy as np
-from statsmodels.tsa.holtwinters import ExponentialSmoothing
-from statsmodels.tsa.arima.model import ARIMA
 from typing import Tuple
+from services.instrumentation import instrumented
+
+MIN_HISTORY = 6
+# Free parameters of ExponentialSmoothing(trend="add", seasonal=None) in statsmodels' order
+_HOLT_PARAM_NAMES = ("smoothing_level", "smoothing_trend", "initial_level", "initial_trend")
 
 def _ensure_datetime_index(df: pd.DataFrame, date_col: str):
     df = df.copy()
@@ -13,6 +21,33 @@ def _ensure_datetime_index(df: pd.DataFrame, date_col: str):
     df = df.set_index(date_col)
     return df
 
+def _fit_and_forecast(ts: pd.Series, periods: int, method: str, start_params=None):
+    """
+    Fit one model and forecast. start_params warm-starts the optimiser from a previous fit.
+    Returns (forecast, diagnostics, fitted params as a list).
+    """
+    # statsmodels is imported on first fit; it dominates this module's import time
+    if method == "holt":
+        from statsmodels.tsa.holtwinters import ExponentialSmoothing
+        model = ExponentialSmoothing(ts, trend="add", seasonal=None, initialization_method="estimated")
+        if start_params is not None:
+            fit = model.fit(start_params=np.asarray(start_params), use_brute=False)
+        else:
+            fit = model.fit()
+        pred = fit.forecast(periods)
+        diag = {"method": "holt", "aic": None}
+        params = [float(fit.params[name]) for name in _HOLT_PARAM_NAMES]
+    else:
+        # ARIMA simple (p,d,q) auto fallback
+        from statsmodels.tsa.arima.model import ARIMA
+        model = ARIMA(ts, order=(1,1,1))
+        fit = model.fit(start_params=np.asarray(start_params)) if start_params is not None else model.fit()
+        pred = fit.predict(start=len(ts), end=len(ts)+periods-1)
+        diag = {"method": "arima", "aic": float(getattr(fit, "aic", np.nan))}
+        params = [float(p) for p in np.asarray(fit.params)]
+    return pd.Series(pred), diag, params
+
+@instrumented()
 def simple_forecast(df: pd.DataFrame, date_col: str, target_col: str, periods: int = 12, method: str = "holt"):
     """
     Forecast target_col using either 'holt' (ExponentialSmoothing) or 'arima'.
@@ -22,23 +57,205 @@ def simple_forecast(df: pd.DataFrame, date_col: str, target_col: str, periods: i
         return pd.Series(dtype=float), {"error": "date or target column missing"}
 
     df2 = _ensure_datetime_index(df[[date_col, target_col]], date_col)
-    ts = df2[target_col].astype(float).fillna(method="ffill").fillna(method="bfill")
+    ts = df2[target_col].astype(float).ffill().bfill()
 
-    if len(ts) < 6:
+    if len(ts) < MIN_HISTORY:
         return pd.Series(dtype=float), {"error": "Not enough history for forecasting"}
 
     try:
-        if method == "holt":
-            model = ExponentialSmoothing(ts, trend="add", seasonal=None, initialization_method="estimated")
-            fit = model.fit()
-            pred = fit.forecast(periods)
-            diag = {"method": "holt", "aic": None}
-        else:
-            # ARIMA simple (p,d,q) auto fallback
-            model = ARIMA(ts, order=(1,1,1))
-            fit = model.fit()
-            pred = fit.predict(start=len(ts), end=len(ts)+periods-1)
-            diag = {"method": "arima", "aic": float(getattr(fit, "aic", np.nan))}
-        return pd.Series(pred), diag
+        pred, diag, _ = _fit_and_forecast(ts, periods, method)
+        return pred, diag
     except Exception as e:
         return pd.Series(dtype=float), {"error": str(e)}
+
+
+# -------------------------------
+# Batch forecasting: many series, one sort, process pool, warm-started model cache
+# -------------------------------
+# series key -> {"method", "n_obs", "fingerprint", "params", "periods", "forecast", "diag"}
+# (pipeline stages run on threads: every read and write of a cache goes through _FORECAST_CACHE_LOCK)
+_FORECAST_CACHE = {}
+_FORECAST_CACHE_LOCK = threading.Lock()
+MAX_CACHED_SERIES = 5000
+# Below this many series the process start-up cost outweighs the parallelism
+MIN_SERIES_FOR_POOL = 8
+# Irregular series are resampled to their median spacing unless that multiplies the points by more than this
+MAX_RESAMPLE_FACTOR = 10
+
+
+def _fingerprint(values: np.ndarray, index=None) -> str:
+    """Hash of the values and (when given) their timestamps, so shifted dates are a different series."""
+    h = hashlib.sha256(np.ascontiguousarray(values, dtype=np.float64).tobytes())
+    if index is not None:
+        h.update(pd.util.hash_pandas_object(pd.Index(index), index=False).to_numpy().tobytes())
+    return h.hexdigest()
+
+
+def _regular_series(s: pd.Series, agg="sum") -> pd.Series:
+    """
+    Put one date-indexed series on a regular calendar (ARIMA needs a frequency): its inferred
+    frequency when the dates are already evenly spaced, otherwise resampled to the median spacing
+    (empty periods stay NaN and are filled by the caller).
+    """
+    index = s.index
+    if not isinstance(index, pd.DatetimeIndex) or index.freq is not None or len(index) < 3:
+        return s
+    inferred = pd.infer_freq(index)
+    if inferred is not None:
+        return s.asfreq(inferred)
+    step = index.to_series().diff().median()
+    if pd.isna(step) or step <= pd.Timedelta(0):
+        return s
+    if (index[-1] - index[0]) / step > MAX_RESAMPLE_FACTOR * len(index):
+        return s
+    resampler = s.resample(pd.tseries.frequencies.to_offset(step))
+    regular = resampler.agg(agg)
+    return regular.where(resampler.count() > 0)
+
+
+def _series_key(target, group=None) -> str:
+    return str(target) if group is None else f"{target} | {group}"
+
+
+def _dataset_key(df: pd.DataFrame, date_col, group_col, freq, agg) -> str:
+    """
+    Identity of the data a series comes from: the frame's columns and the series preparation.
+    Stable when rows are appended (so warm starts still apply), different for other datasets.
+    """
+    payload = repr((sorted(map(str, df.columns)), str(date_col), str(group_col), freq, str(agg)))
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()[:16]
+
+
+def _forecast_task(task):
+    """
+    Worker for one series (module level so the process pool can pickle it).
+      - unchanged series: return the cached forecast
+      - only new points appended: refit warm-started from the cached parameters
+      - otherwise: fit from scratch
+    """
+    key, ts, periods, method, cached = task["key"], task["ts"], task["periods"], task["method"], task["cached"]
+    values = ts.to_numpy(dtype=np.float64)
+    fingerprint = _fingerprint(values, ts.index)
+
+    if len(ts) < MIN_HISTORY:
+        return key, None, {"error": "Not enough history for forecasting"}, None
+
+    start_params = None
+    fit_mode = "cold"
+    if cached and cached["method"] == method:
+        if cached["fingerprint"] == fingerprint and cached["periods"] == periods:
+            return key, cached["forecast"], {**cached["diag"], "fit_mode": "cached"}, cached
+        n_prev = cached["n_obs"]
+        if n_prev < len(values) and _fingerprint(values[:n_prev], ts.index[:n_prev]) == cached["fingerprint"]:
+            start_params = cached["params"]
+            fit_mode = "warm"
+
+    try:
+        try:
+            pred, diag, params = _fit_and_forecast(ts, periods, method, start_params=start_params)
+        except Exception:
+            if start_params is None:
+                raise
+            pred, diag, params = _fit_and_forecast(ts, periods, method)
+            fit_mode = "cold"
+    except Exception as e:
+        return key, None, {"error": str(e)}, None
+
+    diag = {**diag, "fit_mode": fit_mode, "n_obs": int(len(values))}
+    state = {"method": method, "n_obs": int(len(values)), "fingerprint": fingerprint,
+             "params": params, "periods": periods, "forecast": pred, "diag": diag}
+    return key, pred, diag, state
+
+
+def prepare_series_frame(df: pd.DataFrame, date_col: str, target_cols, group_col=None,
+                         freq: str = None, agg: str = "sum") -> pd.DataFrame:
+    """
+    Select, parse, sort and index the data once for all series.
+    Rows sharing a timestamp (per group) are combined with `agg`; with freq (e.g. "D", "W", "MS")
+    each series is resampled to a regular calendar.
+    """
+    cols = [date_col] + list(target_cols) + ([group_col] if group_col else [])
+    frame = df[cols].copy()
+    frame[date_col] = pd.to_datetime(frame[date_col], errors="coerce")
+    frame = frame.dropna(subset=[date_col])
+    keys = ([group_col] if group_col else []) + [pd.Grouper(key=date_col, freq=freq) if freq else date_col]
+    frame = frame.groupby(keys, sort=True, observed=True)[list(target_cols)].agg(agg)
+    return frame
+
+
+@instrumented()
+def batch_forecast(df: pd.DataFrame, date_col: str, target_cols=None, group_col=None, periods: int = 12,
+                   method: str = "holt", freq: str = None, agg: str = "sum", max_series: int = 500,
+                   n_workers: int = None, cache: dict = None, dataset_key: str = None):
+    """
+    Forecast every target column (default: all numeric columns), optionally split by group_col
+    (e.g. revenue per region). Series are fitted in parallel on a process pool.
+    freq resamples every series to one calendar; without it each series uses its inferred frequency,
+    or is resampled to its median date spacing when the dates are irregular.
+    cache: dict of fitted series state (defaults to a per-process cache); unchanged series are
+    served from it and series with only appended points are warm-started.
+    dataset_key: identity of the dataset in the cache keys (default: derived from its columns and
+    the date/group/freq/agg settings), so same-named series of different datasets do not collide.
+    Returns ({series_key: {"forecast": Series, "diag": dict}}, summary).
+    """
+    if date_col not in df.columns:
+        return {}, {"error": "date column missing"}
+    if target_cols is None:
+        target_cols = [c for c in df.select_dtypes(include="number").columns if c not in (date_col, group_col)]
+    target_cols = [c for c in target_cols if c in df.columns]
+    if not target_cols:
+        return {}, {"error": "no numeric target columns"}
+    cache = _FORECAST_CACHE if cache is None else cache
+    if dataset_key is None:
+        dataset_key = _dataset_key(df, date_col, group_col, freq, agg)
+
+    frame = prepare_series_frame(df, date_col, target_cols, group_col=group_col, freq=freq, agg=agg)
+    groups = frame.groupby(level=0, sort=False) if group_col else [(None, frame)]
+
+    tasks = []
+    cache_keys = {}   # series key -> key in the (possibly shared) cache
+    truncated = False
+    for group, part in groups:
+        if group_col:
+            part = part.droplevel(0)
+        for target in target_cols:
+            if len(tasks) >= max_series:
+                truncated = True
+                break
+            key = _series_key(target, group)
+            cache_keys[key] = f"{dataset_key} :: {key}"
+            series = part[target].astype(float)
+            if not freq:
+                # Without a calendar each group keeps its own raw dates; give every series a frequency
+                series = _regular_series(series, agg)
+            ts = series.ffill().bfill()
+            with _FORECAST_CACHE_LOCK:
+                cached = cache.get(cache_keys[key])
+            tasks.append({"key": key, "ts": ts, "periods": periods, "method": method, "cached": cached})
+        if truncated:
+            break
+
+    n_workers = n_workers or min(os.cpu_count() or 1, len(tasks))
+    if n_workers > 1 and len(tasks) >= MIN_SERIES_FOR_POOL:
+        # spawn: safe to start from pipeline worker threads
+        with ProcessPoolExecutor(max_workers=n_workers, mp_context=mp.get_context("spawn")) as pool:
+            outputs = list(pool.map(_forecast_task, tasks, chunksize=max(1, len(tasks) // (n_workers * 4))))
+    else:
+        outputs = [_forecast_task(t) for t in tasks]
+
+    forecasts = {}
+    modes = {}
+    for key, pred, diag, state in outputs:
+        if state is not None:
+            with _FORECAST_CACHE_LOCK:
+                cache.pop(cache_keys[key], None)
+                cache[cache_keys[key]] = state
+                while len(cache) > MAX_CACHED_SERIES:
+                    cache.pop(next(iter(cache)))
+        forecasts[key] = {"forecast": pred if pred is not None else pd.Series(dtype=float), "diag": diag}
+        mode = diag.get("fit_mode", "error")
+        modes[mode] = modes.get(mode, 0) + 1
+
+    summary = {"series": len(tasks), "truncated": truncated, "fit_modes": modes,
+               "method": method, "periods": periods}
+    return forecasts, summary
@@ -0,0 +1,148 @@
+# core/ingestion.py
+# Fast dataset ingestion: multithreaded Arrow CSV parsing plus Parquet/Feather reads
+
+import time
+from pathlib import Path
+import pandas as pd
+from services.instrumentation import instrumented
+
+try:
+    import pyarrow as pa
+    import pyarrow.csv as pa_csv
+    import pyarrow.feather as pa_feather
+    import pyarrow.parquet as pa_parquet
+    HAS_PYARROW = True
+except ImportError:
+    HAS_PYARROW = False
+
+FORMAT_BY_SUFFIX = {
+    ".csv": "csv",
+    ".txt": "csv",
+    ".parquet": "parquet",
+    ".pq": "parquet",
+    ".feather": "feather",
+    ".arrow": "feather",
+    ".ipc": "feather",
+    ".xlsx": "excel",
+    ".xls": "excel",
+}
+
+# Formats accepted by the upload widgets
+UPLOAD_TYPES = ["csv", "parquet", "feather", "arrow", "xlsx"]
+
+
+def detect_format(name: str) -> str:
+    """
+    Guess the file format from its name. Unknown suffixes are treated as CSV.
+    """
+    return FORMAT_BY_SUFFIX.get(Path(str(name)).suffix.lower(), "csv")
+
+
+def frame_memory_bytes(df: pd.DataFrame) -> int:
+    """
+    Resident size of a DataFrame including string payloads.
+    """
+    return int(df.memory_usage(deep=True, index=True).sum())
+
+
+def _compact_types_mapper(arrow_type):
+    # Keep strings in Arrow memory instead of one Python object per cell
+    if pa.types.is_string(arrow_type) or pa.types.is_large_string(arrow_type):
+        return pd.StringDtype("pyarrow")
+    return None
+
+
+def _arrow_to_pandas(table, dtype_backend: str) -> pd.DataFrame:
+    """
+    Convert an Arrow table to pandas.
+      - "compact": numpy numerics/datetimes, Arrow-backed strings
+      - "pyarrow": every column Arrow-backed (pd.ArrowDtype)
+      - "numpy": classic numpy/object columns, same as pd.read_csv
+    """
+    kwargs = {"split_blocks": True, "self_destruct": True, "date_as_object": False}
+    if dtype_backend == "pyarrow":
+        kwargs["types_mapper"] = pd.ArrowDtype
+    elif dtype_backend == "compact":
+        kwargs["types_mapper"] = _compact_types_mapper
+    df = table.to_pandas(**kwargs)
+
+    # Downstream code selects "datetime64[ns]"; newer pyarrow preserves coarser units
+    if dtype_backend != "pyarrow":
+        for col in df.columns:
+            dtype = df[col].dtype
+            if pd.api.types.is_datetime64_dtype(dtype) and dtype != "datetime64[ns]":
+                df[col] = df[col].astype("datetime64[ns]")
+    return df
+
+
+def _arrow_source(source, fmt: str, memory_map: bool):
+    """
+    Return something pyarrow can read without copying the upload:
+      - in-memory uploads (Streamlit UploadedFile / BytesIO) are wrapped as zero-copy buffers
+      - paths to Parquet/Feather files are memory-mapped
+    """
+    if hasattr(source, "getbuffer"):
+        return pa.BufferReader(pa.py_buffer(source.getbuffer()))
+    if isinstance(source, (str, Path)):
+        if memory_map and fmt in ("parquet", "feather"):
+            return pa.memory_map(str(source), "r")
+        return str(source)
+    return source
+
+
+def _read_with_arrow(source, fmt: str, dtype_backend: str, memory_map: bool, block_size_mb: int):
+    src = _arrow_source(source, fmt, memory_map)
+    if fmt == "csv":
+        read_options = pa_csv.ReadOptions(use_threads=True, block_size=block_size_mb * 1024 * 1024)
+        table = pa_csv.read_csv(src, read_options=read_options)
+    elif fmt == "parquet":
+        table = pa_parquet.read_table(src, use_threads=True, memory_map=memory_map)
+    else:
+        table = pa_feather.read_table(src, use_threads=True, memory_map=memory_map)
+    return _arrow_to_pandas(table, dtype_backend)
+
+
+def _read_with_pandas(source, fmt: str) -> pd.DataFrame:
+    if fmt == "csv":
+        return pd.read_csv(source)
+    if fmt == "parquet":
+        return pd.read_parquet(source)
+    return pd.read_feather(source)
+
+
+@instrumented()
+def read_dataset(source, name: str = None, dtype_backend: str = "compact",
+                 memory_map: bool = True, block_size_mb: int = 16):
+    """
+    Load a CSV, Parquet, Feather/Arrow or Excel dataset from a path or an uploaded file.
+    Uses the multithreaded Arrow readers when pyarrow is installed, pandas otherwise.
+    Returns the DataFrame and a dict with format, engine, shape, parse time and resident size.
+    """
+    name = name or getattr(source, "name", None) or str(source)
+    fmt = detect_format(name)
+
+    start = time.perf_counter()
+    if fmt == "excel":
+        df = pd.read_excel(source)
+        engine = "pandas"
+    elif HAS_PYARROW:
+        df = _read_with_arrow(source, fmt, dtype_backend, memory_map, block_size_mb)
+        engine = "pyarrow"
+    else:
+        df = _read_with_pandas(source, fmt)
+        engine = "pandas"
+    parse_seconds = time.perf_counter() - start
+
+    memory_bytes = frame_memory_bytes(df)
+    info = {
+        "source": name,
+        "format": fmt,
+        "engine": engine,
+        "dtype_backend": dtype_backend if engine == "pyarrow" else "numpy",
+        "rows": int(len(df)),
+        "columns": int(len(df.columns)),
+        "parse_seconds": round(parse_seconds, 4),
+        "memory_bytes": memory_bytes,
+        "memory_mb": round(memory_bytes / (1024 * 1024), 2),
+    }
+    return df, info
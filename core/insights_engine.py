@@ -1,16 +1,14 @@
 # core/insights_engine.py
 # Generate plain-English insights using a local transformer model (Flan-T5-small by default)
 
-from transformers import pipeline
-import streamlit as st
-import os
+from services.instrumentation import instrumented
+from services.llm_service import get_inference_service
 
-@st.cache_resource(show_spinner=False)
 def load_model(model_name="google/flan-t5-small"):
     """
-    Cached model load so Streamlit doesn't re-download repeatedly.
+    Shared text2text pipeline (owned by the process-wide inference service).
     """
-    return pipeline("text2text-generation", model=model_name, device= -1)  # device=-1 uses CPU
+    return get_inference_service(model_name).pipeline()
 
 def build_insight_prompt(kpis: dict, sample_rows=None):
     """
@@ -21,12 +19,17 @@ def build_insight_prompt(kpis: dict, sample_rows=None):
     lines.append(f"The dataset has {kpis.get('row_count')} rows and {kpis.get('column_count')} columns.")
     lines.append(f"Overall missing data is {kpis.get('missing_pct_overall')} percent.")
     duplicates = kpis.get("duplicate_rows", 0)
-    lines.append(f"Duplicate rows: {duplicates}.")
+    if duplicates is not None:
+        lines.append(f"Duplicate rows: {duplicates}.")
     # numeric stats
     numeric_stats = kpis.get("numeric_sample_stats", {})
     if numeric_stats:
         for col, stats in numeric_stats.items():
             lines.append(f"Column {col}: mean {round(stats.get('mean',0),3)}, median {round(stats.get('median',0),3)}.")
+    top_corr = kpis.get("top_correlations", [])
+    if top_corr:
+        pairs = "; ".join(f"{p['a']} and {p['b']} (r={p['r']:.2f})" for p in top_corr[:3])
+        lines.append(f"Strongest correlations: {pairs}.")
     if sample_rows is not None:
         lines.append("Here are a few sample rows:")
         # add compact sample rows text
@@ -34,11 +37,13 @@ def build_insight_prompt(kpis: dict, sample_rows=None):
     prompt = "Summarize the following dataset in plain business English and point out possible wins, risks, and anomalies:\n" + "\n".join(lines)
     return prompt
 
-def generate_insights(kpis: dict, sample_rows=None, model_name=None, max_length=120):
-    if model_name is None:
-        model_name = os.getenv("INSIGHT_MODEL", "google/flan-t5-small")
-    nlp = load_model(model_name)
+@instrumented()
+def generate_insights(kpis: dict, sample_rows=None, model_name=None, max_length=None, service=None):
+    """
+    Batched, cached generation through the shared inference service
+    (pass `service` to use one configured from config.yaml).
+    max_length overrides the service's max_new_tokens (llm.max_new_tokens) only when given.
+    """
+    service = service or get_inference_service(model_name)
     prompt = build_insight_prompt(kpis, sample_rows)
-    out = nlp(prompt, max_length=max_length, do_sample=False)
-    text = out[0]["generated_text"]
-    return text
+    return service.generate(prompt, **({"max_new_tokens": max_length} if max_length else {}))
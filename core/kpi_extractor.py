@@ -2,22 +2,28 @@
 # Extract KPIs and summary stats
 
 import pandas as pd
-import numpy as np
+from core.column_stats import compute_column_stats
+from services.instrumentation import instrumented
 
-def compute_basic_kpis(df: pd.DataFrame) -> dict:
+@instrumented()
+def compute_basic_kpis(df: pd.DataFrame, stats=None) -> dict:
+    """
+    stats: optional ColumnStats of df; computed here in one pass if not given.
+    """
+    if stats is None:
+        stats = compute_column_stats(df)
     kpis = {}
     kpis["row_count"] = int(len(df))
     kpis["column_count"] = int(len(df.columns))
-    kpis["missing_pct_overall"] = float(round(df.isnull().mean().mean() * 100, 4))
-    kpis["duplicate_rows"] = int(df.duplicated().sum())
-    kpis["numeric_columns"] = int(len(df.select_dtypes(include="number").columns))
-    kpis["categorical_columns"] = int(len(df.select_dtypes(include="object").columns))
+    kpis["missing_pct_overall"] = float(round(stats.missing_fraction_overall * 100, 4))
+    kpis["duplicate_rows"] = stats.duplicate_rows
+    kpis["numeric_columns"] = int(len(stats.numeric_cols))
+    kpis["categorical_columns"] = int(len(stats.categorical_cols))
 
     # A few sample numeric KPIs: means of top numeric columns
-    numeric = df.select_dtypes(include="number")
-    if not numeric.empty:
-        top_cols = numeric.columns[:5].tolist()
-        kpis["numeric_sample_stats"] = {c: {"mean": float(np.nanmean(numeric[c])), "median": float(np.nanmedian(numeric[c]))} for c in top_cols}
+    if stats.numeric_cols:
+        top_cols = stats.numeric_cols[:5]
+        kpis["numeric_sample_stats"] = {c: {"mean": float(stats.means[c]), "median": float(stats.medians[c])} for c in top_cols}
     else:
         kpis["numeric_sample_stats"] = {}
     return kpis
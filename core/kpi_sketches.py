@@ -0,0 +1,304 @@
+# core/kpi_sketches.py
+# Mergeable KPI state for chunked / out-of-core datasets.
+# Feed chunks with KPIAccumulator.update(), combine workers with merge(), read with to_kpis().
+
+import numpy as np
+import pandas as pd
+from core.column_stats import compute_row_hashes
+
+
+class RunningMoments:
+    """
+    Welford/Chan running count, mean, variance, min and max for one numeric column.
+    """
+
+    def __init__(self):
+        self.count = 0
+        self.mean = 0.0
+        self.m2 = 0.0
+        self.min = np.inf
+        self.max = -np.inf
+
+    def update(self, values: np.ndarray):
+        n_b = values.size
+        if n_b == 0:
+            return
+        mean_b = float(values.mean())
+        m2_b = float(((values - mean_b) ** 2).sum())
+        self._combine(n_b, mean_b, m2_b, float(values.min()), float(values.max()))
+
+    def merge(self, other: "RunningMoments"):
+        if other.count:
+            self._combine(other.count, other.mean, other.m2, other.min, other.max)
+        return self
+
+    def _combine(self, n_b, mean_b, m2_b, min_b, max_b):
+        n_a = self.count
+        n = n_a + n_b
+        delta = mean_b - self.mean
+        self.mean += delta * n_b / n
+        self.m2 += m2_b + delta * delta * n_a * n_b / n
+        self.count = n
+        self.min = min(self.min, min_b)
+        self.max = max(self.max, max_b)
+
+    @property
+    def variance(self) -> float:
+        return self.m2 / (self.count - 1) if self.count > 1 else float("nan")
+
+
+class QuantileSketch:
+    """
+    Merging t-digest (k1 scale). Centroids are rebuilt with vectorized binning,
+    so updates with millions of values stay in NumPy. Relative rank error is
+    roughly 1/compression in the middle of the distribution and smaller at the tails.
+    """
+
+    def __init__(self, compression: int = 200):
+        self.compression = compression
+        self.means = np.empty(0)
+        self.weights = np.empty(0)
+        self.min = np.inf
+        self.max = -np.inf
+
+    @property
+    def count(self) -> float:
+        return float(self.weights.sum())
+
+    def update(self, values: np.ndarray):
+        if values.size == 0:
+            return
+        self.min = min(self.min, float(values.min()))
+        self.max = max(self.max, float(values.max()))
+        self._compress(np.concatenate([self.means, values]),
+                       np.concatenate([self.weights, np.ones(values.size)]))
+
+    def merge(self, other: "QuantileSketch"):
+        if other.weights.size:
+            self.min = min(self.min, other.min)
+            self.max = max(self.max, other.max)
+            self._compress(np.concatenate([self.means, other.means]),
+                           np.concatenate([self.weights, other.weights]))
+        return self
+
+    def _compress(self, means, weights):
+        order = np.argsort(means, kind="stable")
+        means, weights = means[order], weights[order]
+        total = weights.sum()
+        # Quantile at each centroid's midpoint mapped through k1(q) = d/(2*pi) * asin(2q - 1);
+        # centroids sharing an integer k bucket are merged, which bounds each centroid's size
+        q = (np.cumsum(weights) - weights / 2) / total
+        k = self.compression / (2 * np.pi) * np.arcsin(np.clip(2 * q - 1, -1, 1))
+        buckets = np.floor(k - k.min()).astype(np.int64)
+        starts = np.flatnonzero(np.r_[True, buckets[1:] != buckets[:-1]])
+        merged_w = np.add.reduceat(weights, starts)
+        self.means = np.add.reduceat(means * weights, starts) / merged_w
+        self.weights = merged_w
+
+    def quantile(self, q: float) -> float:
+        if self.weights.size == 0:
+            return float("nan")
+        if self.weights.size == 1:
+            return float(self.means[0])
+        centers = np.cumsum(self.weights) - self.weights / 2
+        xp = np.r_[0.0, centers, self.count]
+        fp = np.r_[self.min, self.means, self.max]
+        return float(np.interp(q * self.count, xp, fp))
+
+
+class HyperLogLog:
+    """
+    HyperLogLog distinct counter over 64-bit hashes; standard error ~1.04/sqrt(2**precision).
+    """
+
+    def __init__(self, precision: int = 14):
+        self.precision = precision
+        self.registers = np.zeros(1 << precision, dtype=np.uint8)
+
+    def update_hashes(self, hashes: np.ndarray):
+        if hashes.size == 0:
+            return
+        p = np.uint64(self.precision)
+        idx = (hashes >> (np.uint64(64) - p)).astype(np.int64)
+        # Remaining bits, with a sentinel bit so the rank is bounded
+        rest = (hashes << p) | (np.uint64(1) << (p - np.uint64(1)))
+        rank = (65 - _bit_length64(rest)).astype(np.uint8)
+        np.maximum.at(self.registers, idx, rank)
+
+    def merge(self, other: "HyperLogLog"):
+        if other.precision != self.precision:
+            raise ValueError("Cannot merge HyperLogLog sketches with different precision")
+        np.maximum(self.registers, other.registers, out=self.registers)
+        return self
+
+    def estimate(self) -> float:
+        m = float(self.registers.size)
+        alpha = 0.7213 / (1 + 1.079 / m)
+        raw = alpha * m * m / np.sum(np.power(2.0, -self.registers.astype(np.float64)))
+        zeros = int((self.registers == 0).sum())
+        if raw <= 2.5 * m and zeros:
+            return m * np.log(m / zeros)  # linear counting for small cardinalities
+        return float(raw)
+
+
+def _bit_length64(x: np.ndarray) -> np.ndarray:
+    # Exact bit length of uint64 values: split into 32-bit halves, which float64 represents exactly
+    hi = (x >> np.uint64(32)).astype(np.float64)
+    lo = (x & np.uint64(0xFFFFFFFF)).astype(np.float64)
+    with np.errstate(divide="ignore"):
+        bl_hi = np.where(hi > 0, np.floor(np.log2(hi)) + 1, 0)
+        bl_lo = np.where(lo > 0, np.floor(np.log2(lo)) + 1, 0)
+    return np.where(hi > 0, 32 + bl_hi, bl_lo).astype(np.int64)
+
+
+class DuplicateEstimator:
+    """
+    Counts duplicate rows from 64-bit row hashes: exact (set of hashes) up to
+    max_exact distinct rows, HyperLogLog estimate beyond that.
+    """
+
+    def __init__(self, max_exact: int = 5_000_000, precision: int = 16):
+        self.max_exact = max_exact
+        self.rows_seen = 0
+        self.exact = np.empty(0, dtype=np.uint64)  # sorted unique hashes, None once over budget
+        self.hll = HyperLogLog(precision)
+
+    def update_hashes(self, hashes: np.ndarray):
+        self.rows_seen += int(hashes.size)
+        self.hll.update_hashes(hashes)
+        if self.exact is not None:
+            self.exact = np.union1d(self.exact, hashes)
+            if self.exact.size > self.max_exact:
+                self.exact = None
+
+    def merge(self, other: "DuplicateEstimator"):
+        self.rows_seen += other.rows_seen
+        self.hll.merge(other.hll)
+        if self.exact is not None and other.exact is not None:
+            self.exact = np.union1d(self.exact, other.exact)
+            if self.exact.size > self.max_exact:
+                self.exact = None
+        else:
+            self.exact = None
+        return self
+
+    @property
+    def is_exact(self) -> bool:
+        return self.exact is not None
+
+    def duplicate_rows(self) -> int:
+        distinct = self.exact.size if self.exact is not None else self.hll.estimate()
+        return max(int(round(self.rows_seen - distinct)), 0)
+
+
+class KPIAccumulator:
+    """
+    Mergeable equivalent of compute_basic_kpis for data that arrives in chunks
+    (SQL streaming, files larger than RAM, appended rows, parallel workers).
+    Column kinds (numeric / categorical) are fixed by the first chunk that contains the column.
+    """
+
+    def __init__(self, compression: int = 200, hll_precision: int = 14, max_exact_rows: int = 5_000_000):
+        self.compression = compression
+        self.hll_precision = hll_precision
+        self.row_count = 0
+        self.columns = []
+        self.kinds = {}
+        self.null_counts = {}
+        self.moments = {}
+        self.quantiles = {}
+        self.distinct = {}
+        self.duplicates = DuplicateEstimator(max_exact=max_exact_rows)
+
+    def _register(self, chunk: pd.DataFrame):
+        numeric = set(chunk.select_dtypes(include="number").columns)
+        categorical = set(chunk.select_dtypes(include=["object", "string", "category"]).columns)
+        for col in chunk.columns:
+            if col in self.kinds:
+                continue
+            self.columns.append(col)
+            self.kinds[col] = "numeric" if col in numeric else "categorical" if col in categorical else "other"
+            self.null_counts[col] = self.row_count  # rows seen before the column appeared
+            self.distinct[col] = HyperLogLog(self.hll_precision)
+            if self.kinds[col] == "numeric":
+                self.moments[col] = RunningMoments()
+                self.quantiles[col] = QuantileSketch(self.compression)
+
+    def update(self, chunk: pd.DataFrame):
+        """Fold one chunk into the running state."""
+        self._register(chunk)
+        for col in self.columns:
+            if col not in chunk.columns:
+                self.null_counts[col] += len(chunk)
+        self.row_count += len(chunk)
+        self.duplicates.update_hashes(compute_row_hashes(chunk))
+
+        for col in chunk.columns:
+            s = chunk[col]
+            isna = s.isna().to_numpy()
+            self.null_counts[col] += int(isna.sum())
+            hashes = pd.util.hash_pandas_object(s, index=False).to_numpy()[~isna]
+            self.distinct[col].update_hashes(hashes)
+            if self.kinds[col] == "numeric":
+                values = pd.to_numeric(s, errors="coerce").to_numpy(dtype="float64", na_value=np.nan)
+                values = values[~np.isnan(values)]
+                self.moments[col].update(values)
+                self.quantiles[col].update(values)
+        return self
+
+    def merge(self, other: "KPIAccumulator"):
+        """Combine state from another accumulator (e.g. another worker or a later append)."""
+        for col in other.columns:
+            if col not in self.kinds:
+                self.columns.append(col)
+                self.kinds[col] = other.kinds[col]
+                self.null_counts[col] = self.row_count
+                self.distinct[col] = HyperLogLog(self.hll_precision)
+                if other.kinds[col] == "numeric":
+                    self.moments[col] = RunningMoments()
+                    self.quantiles[col] = QuantileSketch(self.compression)
+            self.null_counts[col] += other.null_counts[col]
+            self.distinct[col].merge(other.distinct[col])
+            if col in other.moments and col in self.moments:
+                self.moments[col].merge(other.moments[col])
+                self.quantiles[col].merge(other.quantiles[col])
+        # Columns missing from one side are all-null there
+        for col in self.columns:
+            if col not in other.kinds:
+                self.null_counts[col] += other.row_count
+        self.row_count += other.row_count
+        self.duplicates.merge(other.duplicates)
+        return self
+
+    def to_kpis(self) -> dict:
+        """Same keys as compute_basic_kpis, plus approximate distinct counts and estimate flags."""
+        numeric_cols = [c for c in self.columns if self.kinds[c] == "numeric"]
+        cells = self.row_count * len(self.columns)
+        kpis = {
+            "row_count": int(self.row_count),
+            "column_count": int(len(self.columns)),
+            "missing_pct_overall": float(round(sum(self.null_counts.values()) / cells * 100, 4)) if cells else float("nan"),
+            "duplicate_rows": self.duplicates.duplicate_rows(),
+            "numeric_columns": len(numeric_cols),
+            "categorical_columns": sum(1 for c in self.columns if self.kinds[c] == "categorical"),
+            "numeric_sample_stats": {
+                c: {"mean": float(self.moments[c].mean) if self.moments[c].count else float("nan"),
+                    "median": self.quantiles[c].quantile(0.5)}
+                for c in numeric_cols[:5]
+            },
+            "distinct_counts_approx": {str(c): int(round(self.distinct[c].estimate())) for c in self.columns},
+            "estimated": {"median": True, "distinct_counts": True,
+                          "duplicate_rows": not self.duplicates.is_exact},
+        }
+        return kpis
+
+
+def compute_kpis_chunked(chunks, **kwargs) -> dict:
+    """
+    compute_basic_kpis over an iterable of DataFrame chunks (e.g. services.sql_server.iter_query)
+    without holding more than one chunk in memory.
+    """
+    acc = KPIAccumulator(**kwargs)
+    for chunk in chunks:
+        acc.update(chunk)
+    return acc.to_kpis()
@@ -1,81 +1,341 @@
 # core/pipeline_manager.py
 # Orchestrates the full InsightIQ pipeline
 
+# Analytic modules are resolved through core.registry when their stage first runs,
+# so importing this module stays cheap (no transformers, ydata, plotly, fpdf or statsmodels).
+
 import pandas as pd
-from core.data_cleaning import basic_cleaning
-from core.profiling_engine import generate_profile_html
-from core.kpi_extractor import compute_basic_kpis
-from core.insights_engine import generate_insights
-from core.visualization import generate_top_visuals
-from core.report_generator import PDFReport
+from core.column_stats import compute_column_stats, frame_fingerprint
+from core.ingestion import read_dataset
+from core.registry import capability
+from core.stage_graph import Stage, StageGraph
 from pathlib import Path
+from functools import partial
 import os
 from services.logger import get_logger
+from services.storage_manager import StorageManager
 
 logger = get_logger()
 
+# Bump when stage outputs change shape, so cached results from older code are not reused
+STAGE_CACHE_VERSION = 1
+# Stages with side effects (files on disk) always run
+UNCACHED_STAGES = {"report"}
+
 class PipelineManager:
-    def __init__(self, config=None):
+    def __init__(self, config=None, cache=None):
         self.config = config or {}
         self.data_dir = Path(self.config.get("paths", {}).get("data_dir", "data"))
         self.report_dir = Path(self.config.get("paths", {}).get("report_dir", "reports"))
         self.model_name = self.config.get("llm", {}).get("model_name", "google/flan-t5-small")
+        self.llm_config = {"model_name": self.model_name, **self.config.get("llm", {})}
+        self.ingestion_config = self.config.get("ingestion", {})
+        self.pipeline_config = self.config.get("pipeline", {})
+        self.ingest_info = None
         self.report_dir.mkdir(parents=True, exist_ok=True)
+        max_cache_mb = self.config.get("storage", {}).get("max_cache_mb")
+        self.storage = StorageManager(self.data_dir, max_bytes=max_cache_mb * 1024 * 1024 if max_cache_mb else None)
+        cache_config = self.config.get("pipeline_cache", {})
+        if cache is None and cache_config.get("enabled", False):
+            from services.pipeline_cache import get_pipeline_cache
+            cache = get_pipeline_cache(max_memory_mb=cache_config.get("max_memory_mb", 512),
+                                       cache_dir=cache_config.get("cache_dir", "data/pipeline_cache"),
+                                       max_disk_mb=cache_config.get("max_disk_mb", 2048))
+        self.cache = cache
 
     def load_dataset(self, uploaded_file) -> pd.DataFrame:
-        """Load CSV or XLSX dataset"""
-        name = getattr(uploaded_file, "name", "")
-        if name.lower().endswith(".csv"):
-            df = pd.read_csv(uploaded_file)
-        else:
-            df = pd.read_excel(uploaded_file)
+        """Load CSV, Parquet, Feather or XLSX dataset (served from the columnar cache when seen before)"""
+        df, info = self.storage.load_dataset(uploaded_file, reader=self._read)
+        self.ingest_info = info
+        logger.info(f"Loaded {info['source']} ({info['format']}, {info['engine']}, cache_hit={info['cache_hit']}): "
+                    f"{info['rows']}x{info['columns']} in {info['parse_seconds']}s, {info['memory_mb']} MB")
         return df
 
-    def run_full_pipeline(self, df: pd.DataFrame) -> dict:
-        """Run the full pipeline and return results"""
-        results = {}
+    def _read(self, source, name=None):
+        return read_dataset(
+            source,
+            name=name,
+            dtype_backend=self.ingestion_config.get("dtype_backend", "compact"),
+            memory_map=self.ingestion_config.get("memory_map", True),
+            block_size_mb=self.ingestion_config.get("block_size_mb", 16),
+        )
+
+    def build_stage_graph(self, df: pd.DataFrame, dataset_hash: str = None, source_kpis: dict = None) -> StageGraph:
+        """
+        Pipeline as a dependency graph:
+            optimize (compact dtypes) -> clean
+            clean -> profile_quick (fast per-column overview, without the correlation ranking)
+            clean -> correlation (one Pearson pass, shared by the stages below)
+            clean + correlation -> profile (ydata, sampled on large data)
+            clean + correlation -> kpis -> insights -> report
+            clean + correlation -> visuals -------------^
+            clean -> forecast (only when the data has a datetime column)
+        Profiling, KPIs and visuals run concurrently once cleaning is done.
+        With a pipeline cache, each stage is keyed by the dataset hash, its own parameters and its
+        upstream keys, so a parameter change only reruns the affected stage and its dependents.
+        source_kpis: KPIs computed at the source (e.g. services.sql_server.pushdown_kpis) when df
+        is only a sample; they take precedence over the ones measured on df.
+        """
+        cfg = self.pipeline_config
+        timeouts = cfg.get("timeouts", {})
+        process_stages = set(cfg.get("process_stages", []))
+
+        def stage(name, fn, depends_on=(), required=False, fallback=None):
+            return Stage(name, fn, depends_on=depends_on, required=required, fallback=fallback,
+                         timeout=timeouts.get(name),
+                         executor="process" if name in process_stages else "thread")
+
+        stages = [
+            # Optional compaction: if it fails, cleaning runs on the frame as loaded
+            stage("optimize", partial(_stage_optimize, df=df, optimize_config=self.config.get("optimize", {})),
+                  fallback={"df": df, "report": None}),
+            stage("clean", partial(_stage_clean, cleaning_config=self.config.get("cleaning", {})),
+                  depends_on=["optimize"], required=True),
+            stage("correlation", partial(_stage_correlation, correlation_config=self.config.get("correlation", {})),
+                  depends_on=["clean"]),
+            # No correlation dependency: the overview is the first thing users see
+            stage("profile_quick", _stage_profile_quick, depends_on=["clean"]),
+            stage("profile", partial(_stage_profile, profiling_config=self.config.get("profiling", {})),
+                  depends_on=["clean", "correlation"]),
+            stage("kpis", partial(_stage_kpis, source_kpis=source_kpis),
+                  depends_on=["clean", "correlation"], required=True),
+            stage("visuals", partial(_stage_visuals, visuals_config=self.config.get("visuals", {})),
+                  depends_on=["clean", "correlation"], required=True),
+            stage("insights", partial(_stage_insights, llm_config=self.llm_config),
+                  depends_on=["clean", "kpis"], fallback="Insight generation failed."),
+            stage("report", partial(_stage_report, report_dir=str(self.report_dir),
+                                    report_config=self.config.get("report", {})),
+                  depends_on=["kpis", "insights", "visuals"]),
+        ]
+        forecast_config = self.config.get("forecast", {})
+        if forecast_config.get("enabled", True):
+            stages.append(stage("forecast", partial(_stage_forecast, forecast_config=forecast_config),
+                                depends_on=["clean"]))
+        if self.cache is not None:
+            _assign_cache_keys(stages, dataset_hash or frame_fingerprint(df))
+        instr = self.config.get("instrumentation", {})
+        return StageGraph(stages, max_workers=cfg.get("max_workers", 4),
+                          max_process_workers=cfg.get("max_process_workers", 2),
+                          profile_stages=instr.get("profile_stages", []),
+                          trace_memory=instr.get("trace_memory", False),
+                          profile_dir=instr.get("profile_dir"),
+                          cache=self.cache)
 
-        # 1️⃣ Cleaning
-        cleaned_df, clean_summary = basic_cleaning(df)
-        results["clean_summary"] = clean_summary
-
-        # 2️⃣ Profiling
-        try:
-            profile_html = generate_profile_html(cleaned_df, minimal=True)
-            results["profile_html"] = profile_html
-        except Exception as e:
-            logger.exception("Profiling failed")
-            results["profile_html"] = None
-
-        # 3️⃣ KPI extraction
-        kpis = compute_basic_kpis(cleaned_df)
-        results["kpis"] = kpis
-
-        # 4️⃣ Visualizations
-        figs = generate_top_visuals(cleaned_df)
-        results["figures"] = figs
-
-        # 5️⃣ Insights
-        try:
-            insights = generate_insights(kpis=kpis, sample_rows=cleaned_df.head(50), model_name=self.model_name)
-            results["insights"] = insights
-        except Exception as e:
-            logger.exception("Insight generation failed")
-            results["insights"] = "Insight generation failed."
-
-        # 6️⃣ Report
-        try:
-            report = PDFReport()
-            report.add_title()
-            report.add_kpis(kpis)
-            report.add_insights(results.get("insights", ""))
-            for _, fig in figs[:3]:
-                report.add_figure(fig)
-            out_path = self.report_dir / f"insightiq_report_{os.getpid()}_{int(pd.Timestamp.now().timestamp())}.pdf"
-            report.output(str(out_path))
-            results["report_path"] = str(out_path)
-        except Exception as e:
-            logger.exception("Report generation failed")
-            results["report_path"] = None
+    def iter_pipeline(self, df: pd.DataFrame, dataset_hash: str = None, source_kpis: dict = None):
+        """
+        Run the pipeline and yield (stage_name, results) each time a stage finishes,
+        so callers can render partial results early. results is the same dict each time.
+        dataset_hash: content hash of df if already known (otherwise computed when caching).
+        """
+        results = {"stage_status": {}}
+        if self.ingest_info is not None:
+            results["ingest_info"] = self.ingest_info
 
+        graph = self.build_stage_graph(df, dataset_hash=dataset_hash, source_kpis=source_kpis)
+        results["metrics"] = graph.metrics
+        results["stage_count"] = len(graph.stages)
+        for name, status, value in graph.iter_run():
+            results["stage_status"][name] = status
+            _collect_stage_result(results, name, value)
+            yield name, results
+
+    def run_full_pipeline(self, df: pd.DataFrame, on_stage_complete=None, dataset_hash: str = None,
+                          source_kpis: dict = None) -> dict:
+        """Run the full pipeline and return results.
+        on_stage_complete(stage_name, results) is called with partial results as stages finish."""
+        results = {}
+        for name, results in self.iter_pipeline(df, dataset_hash=dataset_hash, source_kpis=source_kpis):
+            if on_stage_complete:
+                on_stage_complete(name, results)
         return results
+
+
+def _assign_cache_keys(stages, dataset_hash: str):
+    """
+    Chain cache keys through the graph: root stages hash the dataset, every stage hashes its
+    keyword parameters (minus the frame) and the keys of the stages it depends on.
+    """
+    from services.pipeline_cache import stage_cache_key
+    keys = {}
+    remaining = list(stages)
+    progressed = True
+    while remaining and progressed:  # unknown dependencies are reported by StageGraph._validate
+        progressed = False
+        for stage in list(remaining):
+            if not all(d in keys for d in stage.depends_on):
+                continue
+            params = {k: v for k, v in getattr(stage.fn, "keywords", {}).items() if k != "df"}
+            keys[stage.name] = stage_cache_key(
+                stage.name,
+                params={"version": STAGE_CACHE_VERSION, **params},
+                upstream_keys=[keys[d] for d in stage.depends_on],
+                dataset_hash=None if stage.depends_on else dataset_hash,
+            )
+            if stage.name not in UNCACHED_STAGES:
+                stage.cache_key = keys[stage.name]
+            remaining.remove(stage)
+            progressed = True
+
+def run_pipeline_job(ctx, df: pd.DataFrame, config: dict = None, dataset_hash: str = None,
+                     source_kpis: dict = None) -> dict:
+    """
+    Background-job entry point for services.job_queue: reports progress as stages finish,
+    stops between stages once cancelled, and writes the PDF into the job's directory.
+    """
+    config = dict(config or {})
+    config["paths"] = {**config.get("paths", {}), "report_dir": str(ctx.job_dir)}
+    manager = PipelineManager(config)
+    results = {}
+    stages = manager.iter_pipeline(df, dataset_hash=dataset_hash, source_kpis=source_kpis)
+    try:
+        for name, results in stages:
+            ctx.progress(len(results["stage_status"]) / results["stage_count"], f"finished {name}")
+            ctx.check_cancelled()
+    finally:
+        stages.close()
+    return results
+
+
+# -------------------------------
+# Stage functions (module level so process-pool stages can pickle them)
+# -------------------------------
+def _stage_optimize(inputs, df, optimize_config=None):
+    optimize_config = optimize_config or {}
+    if not optimize_config.get("enabled", True):
+        return {"df": df, "report": None}
+    optimized, report = capability("optimize")(
+        df,
+        parse_dates=optimize_config.get("parse_dates", True),
+        downcast=optimize_config.get("downcast", True),
+        categorize=optimize_config.get("categorize", True),
+        max_category_ratio=optimize_config.get("max_category_ratio", 0.5),
+    )
+    return {"df": optimized, "report": report}
+
+def _stage_clean(inputs, cleaning_config=None):
+    cleaning_config = cleaning_config or {}
+    df = inputs["optimize"]["df"]
+    cleaned_df, clean_summary = capability("clean")(
+        df,
+        drop_threshold=cleaning_config.get("drop_threshold", 0.9),
+        fill_numeric_strategy=cleaning_config.get("fill_numeric_strategy", "mean"),
+        stats=compute_column_stats(df),
+        memory_budget_mb=cleaning_config.get("memory_budget_mb", 256),
+    )
+    # One statistics pass over the cleaned frame, shared by the stages below
+    stats = compute_column_stats(cleaned_df)
+    return {"df": cleaned_df, "summary": clean_summary, "stats": stats}
+
+def _stage_correlation(inputs, correlation_config=None):
+    correlation_config = correlation_config or {}
+    clean = inputs["clean"]
+    columns = clean["stats"].numeric_cols
+    if len(columns) < 2:
+        return None
+    result = capability("correlation")(
+        clean["df"],
+        columns=columns,
+        max_rows=correlation_config.get("max_rows", 200_000),
+        block_size=correlation_config.get("block_size", 64),
+    )
+    return {"result": result, "top_pairs": result.top_pairs(correlation_config.get("top_k", 10))}
+
+def _top_pairs(inputs, k=None):
+    correlation = inputs.get("correlation")
+    if not correlation:
+        return None
+    return correlation["top_pairs"][:k] if k else correlation["top_pairs"]
+
+def _stage_profile_quick(inputs):
+    df = inputs["clean"]["df"]
+    sample, sample_info = capability("profile_sample")(df)
+    return capability("profile_quick")(sample, sample_info=sample_info)
+
+def _stage_profile(inputs, profiling_config):
+    clean = inputs["clean"]
+    cache_dir = profiling_config.get("cache_dir")
+    return capability("profile")(
+        clean["df"],
+        minimal=True,
+        large_mode=profiling_config.get("large_mode", "auto"),
+        sample_rows=profiling_config.get("sample_rows", 100_000),
+        cache_dir=cache_dir,
+        dataset_hash=clean["stats"].fingerprint(clean["df"]) if cache_dir else None,
+        top_correlations=_top_pairs(inputs),
+    )
+
+def _stage_kpis(inputs, source_kpis=None):
+    clean = inputs["clean"]
+    kpis = capability("kpis")(clean["df"], stats=clean["stats"])
+    if source_kpis:
+        # Whole-table figures from the source; df is only a sample of it
+        kpis = {**kpis, **source_kpis, "sample_row_count": kpis["row_count"]}
+    top_pairs = _top_pairs(inputs, k=5)
+    if top_pairs:
+        kpis["top_correlations"] = top_pairs
+    return kpis
+
+def _stage_visuals(inputs, visuals_config):
+    return capability("visuals")(
+        inputs["clean"]["df"],
+        render_mode=visuals_config.get("render_mode", "auto"),
+        max_points=visuals_config.get("max_points", 2000),
+        correlation=(inputs.get("correlation") or {}).get("result"),
+    )
+
+def _stage_insights(inputs, llm_config):
+    service = capability("inference_service")(**capability("llm_settings")(llm_config))
+    return capability("insights")(kpis=inputs["kpis"], sample_rows=inputs["clean"]["df"].head(50), service=service)
+
+def _stage_report(inputs, report_dir, report_config=None):
+    report_config = report_config or {}
+    report = capability("report")(image_cache_dir=report_config.get("image_cache_dir"),
+                                  image_cache_max_mb=report_config.get("image_cache_max_mb", 256),
+                                  render_workers=report_config.get("render_workers", 4))
+    report.add_title()
+    report.add_kpis(inputs["kpis"])
+    report.add_insights(inputs["insights"] or "")
+    report.add_figures(fig for _, fig in inputs["visuals"][:report_config.get("max_figures", 3)])
+    out_path = Path(report_dir) / f"insightiq_report_{os.getpid()}_{int(pd.Timestamp.now().timestamp())}.pdf"
+    report.output(str(out_path))
+    return str(out_path)
+
+def _stage_forecast(inputs, forecast_config):
+    clean = inputs["clean"]
+    stats = clean["stats"]
+    if not stats.datetime_cols or not stats.numeric_cols:
+        return None
+    return capability("forecast")(
+        clean["df"],
+        date_col=forecast_config.get("date_col") or stats.datetime_cols[0],
+        target_cols=forecast_config.get("target_cols") or stats.numeric_cols[:5],
+        group_col=forecast_config.get("group_col"),
+        periods=forecast_config.get("periods", 12),
+        method=forecast_config.get("method", "holt"),
+        freq=forecast_config.get("freq"),
+        max_series=forecast_config.get("max_series", 50),
+    )
+
+def _collect_stage_result(results: dict, name: str, value):
+    """Map a finished stage onto the public results keys."""
+    if name == "optimize":
+        results["dtype_report"] = value["report"]
+    elif name == "clean":
+        results["clean_summary"] = value["summary"]
+        results["column_stats"] = value["stats"].to_dict()
+    elif name == "correlation":
+        results["top_correlations"] = value["top_pairs"] if value else []
+    elif name == "profile_quick":
+        results["profile_quick_html"] = value
+    elif name == "profile":
+        results["profile_html"] = value
+    elif name == "kpis":
+        results["kpis"] = value
+    elif name == "visuals":
+        results["figures"] = value
+    elif name == "insights":
+        results["insights"] = value
+    elif name == "report":
+        results["report_path"] = value
+    elif name == "forecast":
+        results["forecasts"], results["forecast_summary"] = value if value else ({}, None)
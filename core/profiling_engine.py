@@ -1,26 +1,193 @@
 # core/profiling_engine.py
-from ydata_profiling import ProfileReport
+import html as html_lib
+import math
+import os
+import uuid
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from pathlib import Path
 import pandas as pd
+from core.column_stats import frame_fingerprint
 from services.logger import get_logger
+from services.instrumentation import instrumented
 
 logger = get_logger()
 
-def generate_profile_html(df: pd.DataFrame, minimal: bool = True) -> str:
+# Above this many rows the full ydata report is built from a sample
+LARGE_DATA_ROWS = 200_000
+DEFAULT_SAMPLE_ROWS = 100_000
+# Columns with at most this many distinct values can drive stratified sampling
+MAX_STRATA = 50
+
+
+def _pick_stratum(df: pd.DataFrame):
+    for col in df.select_dtypes(include=["object", "string", "category"]).columns:
+        if 1 < df[col].nunique(dropna=False) <= MAX_STRATA:
+            return col
+    return None
+
+
+def sample_for_profiling(df: pd.DataFrame, max_rows: int = DEFAULT_SAMPLE_ROWS, stratify_col=None, seed: int = 42):
+    """
+    Proportionally stratified sample (by stratify_col, or the first low-cardinality categorical)
+    or a uniform sample when no stratum fits. Returns the sample and a dict with 95% error bounds:
+      - proportion_95: worst-case half-width for any share/percentage (e.g. missing %)
+      - mean_95: half-width of each numeric column's mean
+    Both include the finite-population correction.
+    """
+    n_total = len(df)
+    if n_total <= max_rows:
+        return df, {"sampled": False, "population_rows": n_total, "sample_rows": n_total}
+
+    stratify_col = stratify_col or _pick_stratum(df)
+    if stratify_col is not None:
+        frac = max_rows / n_total
+        sample = df.groupby(stratify_col, dropna=False, observed=True, group_keys=False).sample(frac=frac, random_state=seed)
+    else:
+        sample = df.sample(n=max_rows, random_state=seed)
+
+    n = len(sample)
+    fpc = math.sqrt((n_total - n) / (n_total - 1)) if n_total > 1 else 0.0
+    numeric = sample.select_dtypes(include="number")
+    mean_bounds = (1.96 * numeric.std() / math.sqrt(max(n, 1)) * fpc).round(6)
+    info = {
+        "sampled": True,
+        "method": f"stratified by {stratify_col}" if stratify_col is not None else "uniform",
+        "population_rows": n_total,
+        "sample_rows": n,
+        "proportion_95": round(1.96 * math.sqrt(0.25 / max(n, 1)) * fpc, 6),
+        "mean_95": {str(c): float(v) for c, v in mean_bounds.items()},
+    }
+    return sample, info
+
+
+# -------------------------------
+# Fast first view: per-column sections computed in parallel
+# -------------------------------
+def _column_section(name, s: pd.Series) -> str:
+    n = len(s)
+    nulls = int(s.isna().sum())
+    rows = [
+        ("dtype", str(s.dtype)),
+        ("non-null", f"{n - nulls:,}"),
+        ("missing", f"{(nulls / n * 100) if n else 0:.2f}%"),
+        ("distinct", f"{s.nunique(dropna=True):,}"),
+    ]
+    if pd.api.types.is_numeric_dtype(s) and not pd.api.types.is_bool_dtype(s):
+        desc = s.describe()
+        rows += [(k, f"{desc[k]:.4g}") for k in ["mean", "std", "min", "25%", "50%", "75%", "max"] if k in desc]
+    elif pd.api.types.is_datetime64_any_dtype(s):
+        rows += [("min", str(s.min())), ("max", str(s.max()))]
+    else:
+        top = s.value_counts(dropna=True).head(5)
+        rows += [(f"top: {k}", f"{v:,}") for k, v in top.items()]
+    body = "".join(f"<tr><th>{html_lib.escape(str(k))}</th><td>{html_lib.escape(str(v))}</td></tr>" for k, v in rows)
+    return f"<section class='column'><h3>{html_lib.escape(str(name))}</h3><table>{body}</table></section>"
+
+
+def iter_profile_sections(df: pd.DataFrame, max_workers: int = None):
+    """
+    Yield (column, html_section) as each column's summary completes,
+    so a UI can render a first view and fill it in progressively.
+    """
+    with ThreadPoolExecutor(max_workers=max_workers) as pool:
+        futures = {pool.submit(_column_section, col, df[col]): col for col in df.columns}
+        for future in as_completed(futures):
+            yield futures[future], future.result()
+
+
+def _correlation_section(top_correlations) -> str:
+    """Ranked strongest pairs from core.correlation (shared with the heatmap and insights prompt)."""
+    if not top_correlations:
+        return ""
+    body = "".join(
+        f"<tr><th>{html_lib.escape(p['a'])} &harr; {html_lib.escape(p['b'])}</th><td>{p['r']:+.3f}</td></tr>"
+        for p in top_correlations
+    )
+    return f"<section class='correlations'><h3>Strongest correlations (Pearson)</h3><table>{body}</table></section>"
+
+
+@instrumented()
+def generate_quick_profile_html(df: pd.DataFrame, max_workers: int = None, sample_info: dict = None,
+                                top_correlations=None) -> str:
+    """
+    Lightweight overview (shape + per-column summaries) that renders in seconds on large data.
+    """
+    sections = dict(iter_profile_sections(df, max_workers=max_workers))
+    ordered = "".join(sections[c] for c in df.columns)
+    header = f"<h2>InsightIQ Quick Profile</h2><p>{len(df):,} rows x {len(df.columns)} columns</p>"
+    return header + _sample_banner(sample_info) + _correlation_section(top_correlations) + ordered
+
+
+def _sample_banner(sample_info: dict) -> str:
+    if not sample_info or not sample_info.get("sampled"):
+        return ""
+    return (
+        "<p class='sample-note'>Profiled a {method} sample of {sample_rows:,} of {population_rows:,} rows. "
+        "Percentages are within &plusmn;{pct:.2f} points at 95% confidence.</p>"
+    ).format(pct=sample_info["proportion_95"] * 100, **sample_info)
+
+
+def _with_banner(report_html: str, banner: str) -> str:
+    if not banner:
+        return report_html
+    if "<body>" in report_html:
+        return report_html.replace("<body>", "<body>" + banner, 1)
+    return banner + report_html
+
+
+def _cache_path(cache_dir, dataset_hash, minimal, large_mode, sample_rows, shared_corr=False):
+    suffix = "_sharedcorr" if shared_corr else ""
+    return Path(cache_dir) / f"{dataset_hash}_{'min' if minimal else 'full'}_{large_mode}_{sample_rows}{suffix}.html"
+
+
+@instrumented()
+def generate_profile_html(df: pd.DataFrame, minimal: bool = True, large_mode: str = "auto",
+                          sample_rows: int = DEFAULT_SAMPLE_ROWS, cache_dir: str = None,
+                          dataset_hash: str = None, top_correlations=None) -> str:
     """
     Generate a fully local HTML profiling report using ydata-profiling v4.17+.
+    large_mode: "auto" samples when df has more than LARGE_DATA_ROWS rows, "on" always samples,
+    "off" profiles every row. With cache_dir set, the HTML is cached by dataset content hash.
+    top_correlations (from core.correlation) replaces ydata's own Pearson pass with a ranked table.
     """
+    shared_corr = top_correlations is not None
+    cache_file = None
+    if cache_dir:
+        dataset_hash = dataset_hash or frame_fingerprint(df)
+        cache_file = _cache_path(cache_dir, dataset_hash, minimal, large_mode, sample_rows, shared_corr)
+        if cache_file.exists():
+            return cache_file.read_text(encoding="utf-8")
+
     try:
+        large = large_mode == "on" or (large_mode == "auto" and len(df) > LARGE_DATA_ROWS)
+        sample_info = None
+        if large:
+            df, sample_info = sample_for_profiling(df, max_rows=sample_rows)
+
+        # Imported here: ydata_profiling takes seconds to import and most views only need the quick profile
+        from ydata_profiling import ProfileReport
+
         # Only pass supported arguments
         profile = ProfileReport(
             df,
             title="InsightIQ Profiling Report",
             minimal=minimal,
             explorative=True,          # extra statistics locally
-            correlations={"pearson": {"calculate": True}},
-            interactions=False         # reduce rendering issues
+            correlations={"pearson": {"calculate": not shared_corr}},
+            interactions=False,        # reduce rendering issues
         )
 
-        html = profile.to_html()
+        html = _with_banner(profile.to_html(), _sample_banner(sample_info) + _correlation_section(top_correlations))
+        if cache_file is not None:
+            cache_file.parent.mkdir(parents=True, exist_ok=True)
+            # Temp file + rename: a concurrent run never reads a half-written report from the cache
+            tmp = cache_file.with_name(f".{cache_file.name}.{uuid.uuid4().hex}.tmp")
+            try:
+                tmp.write_text(html, encoding="utf-8")
+                os.replace(tmp, cache_file)
+            finally:
+                if tmp.exists():
+                    tmp.unlink()
         return html
 
     except Exception as e:
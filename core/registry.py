@@ -0,0 +1,63 @@
+# core/registry.py
+# Analytic capabilities by name, imported on first use.
+# Keeps heavy libraries (transformers/torch, ydata_profiling, plotly, fpdf, sklearn, statsmodels)
+# out of app and worker start-up until a stage actually needs them.
+
+import importlib
+import threading
+
+# name -> "module:attribute"
+CAPABILITIES = {
+    "optimize": "core.dtype_optimizer:optimize_dtypes",
+    "clean": "core.data_cleaning:basic_cleaning",
+    "kpis": "core.kpi_extractor:compute_basic_kpis",
+    "correlation": "core.correlation:compute_correlation",
+    "profile": "core.profiling_engine:generate_profile_html",
+    "profile_quick": "core.profiling_engine:generate_quick_profile_html",
+    "profile_sample": "core.profiling_engine:sample_for_profiling",
+    "visuals": "core.visualization:generate_top_visuals",
+    "insights": "core.insights_engine:generate_insights",
+    "summary": "core.ai_summarizer:generate_summary",
+    "inference_service": "services.llm_service:get_inference_service",
+    "llm_settings": "services.llm_service:service_settings",
+    "report": "core.report_generator:PDFReport",
+    "forecast": "core.forecasting:batch_forecast",
+    "anomalies": "core.anomaly_detector:detect_anomalies_scalable",
+    "clustering": "core.clustering:run_kmeans_scalable",
+}
+
+_loaded = {}
+_lock = threading.Lock()
+
+
+def register(name: str, target: str):
+    """Add or replace a capability ("package.module:attribute"); takes effect on next lookup."""
+    if ":" not in target:
+        raise ValueError(f"Capability target must look like 'module:attribute', got {target!r}")
+    with _lock:
+        CAPABILITIES[name] = target
+        _loaded.pop(name, None)
+
+
+def capability(name: str):
+    """Return the callable registered as `name`, importing its module the first time."""
+    obj = _loaded.get(name)
+    if obj is not None:
+        return obj
+    try:
+        target = CAPABILITIES[name]
+    except KeyError:
+        raise KeyError(f"Unknown capability {name!r}; registered: {sorted(CAPABILITIES)}") from None
+    module_name, attr = target.split(":", 1)
+    # Import without holding _lock: the import system has its own per-module locks, and a slow
+    # import (torch, ydata) must not block lookups of capabilities that are already loaded
+    obj = getattr(importlib.import_module(module_name), attr)
+    with _lock:
+        if CAPABILITIES.get(name) != target:  # re-registered meanwhile: don't cache the old target
+            return obj
+        return _loaded.setdefault(name, obj)
+
+
+def loaded_capabilities():
+    """Names imported so far in this process (for diagnostics and the start-up benchmark)."""
+    return sorted(_loaded)
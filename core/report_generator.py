@@ -1,16 +1,179 @@
 # core/report_generator.py
 # Generate PDF report using fpdf and images from Plotly figures
 
-from fpdf import FPDF
+from fpdf import FPDF, FPDF_VERSION
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+import hashlib
+import io
 import tempfile
+import threading
 from pathlib import Path
-import plotly.io as pio
 import os
+import time
+from services.logger import get_logger
+
+logger = get_logger()
+
+# fpdf2 accepts file-like images; legacy PyFPDF (1.x) only reads from a path
+IN_MEMORY_IMAGES = int(FPDF_VERSION.split(".")[0]) >= 2
+MAX_RENDER_WORKERS = 4
+PNG_CACHE_MAX_BYTES = 64 * 1024 * 1024
+# Default cap of the optional on-disk PNG cache (LRU by mtime)
+IMAGE_CACHE_MAX_BYTES = 256 * 1024 * 1024
+
+# figure hash -> PNG bytes, shared by every report in the process (LRU by total bytes)
+_PNG_CACHE = OrderedDict()
+_png_cache_bytes = 0
+_cache_lock = threading.Lock()
+_export_lock = threading.Lock()
+_export_server_started = False
+# Disk cache directories used in this process (cleared by clear_image_cache)
+_disk_cache_dirs = set()
+
+
+def figure_hash(fig, scale=1, width=None, height=None) -> str:
+    payload = f"{fig.to_json()}|{scale}|{width}|{height}"
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+def _cache_get(key):
+    with _cache_lock:
+        png = _PNG_CACHE.get(key)
+        if png is not None:
+            _PNG_CACHE.move_to_end(key)
+        return png
+
+
+def _cache_put(key, png: bytes):
+    global _png_cache_bytes
+    with _cache_lock:
+        if key in _PNG_CACHE:
+            return
+        _PNG_CACHE[key] = png
+        _png_cache_bytes += len(png)
+        while _png_cache_bytes > PNG_CACHE_MAX_BYTES and len(_PNG_CACHE) > 1:
+            _, old = _PNG_CACHE.popitem(last=False)
+            _png_cache_bytes -= len(old)
+
+
+def clear_image_cache(cache_dir=None):
+    """Empty the memory cache and the disk cache in cache_dir (default: every one used in this process)."""
+    global _png_cache_bytes
+    with _cache_lock:
+        _PNG_CACHE.clear()
+        _png_cache_bytes = 0
+        dirs = [Path(cache_dir)] if cache_dir else list(_disk_cache_dirs)
+    for d in dirs:
+        for p in d.glob("*.png"):
+            p.unlink(missing_ok=True)
+
+
+def _disk_evict(cache_dir: Path, max_bytes):
+    """Remove least recently used PNGs (by mtime) until cache_dir holds at most max_bytes."""
+    if not max_bytes:
+        return
+    files = []
+    for p in cache_dir.glob("*.png"):
+        try:
+            info = p.stat()
+        except OSError:
+            continue
+        files.append((info.st_mtime, info.st_size, p))
+    total = sum(size for _, size, _ in files)
+    for _, size, p in sorted(files):
+        if total <= max_bytes:
+            break
+        p.unlink(missing_ok=True)
+        total -= size
+
+
+def _start_export_server():
+    """
+    Keep one export process alive across figures and reports. Kaleido 0.x already reuses its
+    subprocess; Kaleido 1.x starts a browser per call unless its sync server is running.
+    """
+    global _export_server_started
+    with _export_lock:
+        if _export_server_started:
+            return
+        _export_server_started = True
+        try:
+            import kaleido
+            start = getattr(kaleido, "start_sync_server", None)
+            if start is not None:
+                start()
+        except Exception:
+            pass
+
+
+def rasterize_figure(fig, scale=1, width=None, height=None, cache_dir=None, cache_max_bytes=IMAGE_CACHE_MAX_BYTES):
+    """
+    PNG bytes for one figure, served from the memory (and optional disk) cache when seen before.
+    The disk cache is kept under cache_max_bytes by evicting the least recently used files.
+    """
+    import plotly.io as pio  # kaleido export stack, only needed when figures are rendered
+    key = figure_hash(fig, scale, width, height)
+    png = _cache_get(key)
+    if png is not None:
+        return png
+    disk = Path(cache_dir) / f"{key}.png" if cache_dir else None
+    if disk is not None:
+        with _cache_lock:
+            _disk_cache_dirs.add(disk.parent)
+    try:
+        png = disk.read_bytes() if disk is not None else None
+    except FileNotFoundError:
+        png = None
+    if png is not None:
+        now = time.time()
+        try:
+            os.utime(disk, (now, now))
+        except OSError:
+            pass
+    else:
+        png = pio.to_image(fig, format="png", scale=scale, width=width, height=height)
+        if disk is not None:
+            disk.parent.mkdir(parents=True, exist_ok=True)
+            tmp = disk.with_name(f".{disk.name}.{os.getpid()}.{threading.get_ident()}.tmp")
+            tmp.write_bytes(png)
+            os.replace(tmp, disk)
+            _disk_evict(disk.parent, cache_max_bytes)
+    _cache_put(key, png)
+    return png
+
+
+def rasterize_figures(figs, scale=1, max_workers=MAX_RENDER_WORKERS, cache_dir=None,
+                      cache_max_bytes=IMAGE_CACHE_MAX_BYTES):
+    """
+    Render figures concurrently (one shared export process). Returns PNG bytes per figure,
+    in order, with None for figures that failed to render.
+    """
+    figs = list(figs)
+    if not figs:
+        return []
+    _start_export_server()
+
+    def render(fig):
+        try:
+            return rasterize_figure(fig, scale=scale, cache_dir=cache_dir, cache_max_bytes=cache_max_bytes)
+        except Exception as e:
+            # If image rendering fails, simply skip figure
+            logger.warning(f"Failed to render figure for PDF: {e}")
+            return None
+
+    with ThreadPoolExecutor(max_workers=max(1, min(max_workers, len(figs)))) as pool:
+        return list(pool.map(render, figs))
+
 
 class PDFReport:
-    def __init__(self, title="InsightIQ Report"):
+    def __init__(self, title="InsightIQ Report", image_cache_dir=None, render_workers=MAX_RENDER_WORKERS,
+                 image_cache_max_mb=IMAGE_CACHE_MAX_BYTES // (1024 * 1024)):
         self.pdf = FPDF()
         self.title = title
+        self.image_cache_dir = image_cache_dir
+        self.image_cache_max_bytes = image_cache_max_mb * 1024 * 1024 if image_cache_max_mb else None
+        self.render_workers = render_workers
 
     def add_title(self):
         self.pdf.set_font("Arial", "B", 16)
@@ -31,24 +194,43 @@ class PDFReport:
         self.pdf.set_font("Arial", size=11)
         self.pdf.multi_cell(0, 7, insights_text)
 
+    def add_figures(self, figs, captions=None):
+        """Rasterize all figures concurrently, then place them in order."""
+        figs = list(figs)
+        captions = list(captions) if captions is not None else [None] * len(figs)
+        images = rasterize_figures(figs, max_workers=self.render_workers, cache_dir=self.image_cache_dir,
+                                   cache_max_bytes=self.image_cache_max_bytes)
+        for png, caption in zip(images, captions):
+            if png is not None:
+                self._place_image(png, caption)
+
     def add_figure(self, fig, caption=None):
-        # Save Plotly fig to a temporary PNG and add to PDF
-        tmp = tempfile.NamedTemporaryFile(delete=False, suffix=".png")
-        tmp.close()
+        self.add_figures([fig], [caption])
+
+    def _place_image(self, png: bytes, caption=None):
         try:
-            pio.write_image(fig, tmp.name, format="png", scale=1)
             self.pdf.ln(4)
-            self.pdf.image(tmp.name, w=180)
+            if IN_MEMORY_IMAGES:
+                self.pdf.image(io.BytesIO(png), w=180)
+            else:
+                self._place_image_from_file(png)
             if caption:
                 self.pdf.set_font("Arial", size=10)
                 self.pdf.multi_cell(0, 6, caption)
         except Exception as e:
-            # If image writing fails, simply skip figure
             print("Failed to add figure to PDF:", e)
+
+    def _place_image_from_file(self, png: bytes):
+        # PyFPDF 1.x fallback; install fpdf2 to skip the temp file
+        tmp = tempfile.NamedTemporaryFile(delete=False, suffix=".png")
+        try:
+            tmp.write(png)
+            tmp.close()
+            self.pdf.image(tmp.name, w=180)
         finally:
             try:
                 os.unlink(tmp.name)
-            except:
+            except OSError:
                 pass
 
     def output(self, path):
@@ -0,0 +1,204 @@
+# core/stage_graph.py
+# Run pipeline stages as a dependency graph on thread/process pools
+
+import time
+import tracemalloc
+from concurrent.futures import Future, ThreadPoolExecutor, ProcessPoolExecutor, wait, FIRST_COMPLETED
+from services.logger import get_logger
+from services.instrumentation import collect_metrics, measure
+
+logger = get_logger()
+
+STATUS_OK = "ok"
+STATUS_FAILED = "failed"
+STATUS_TIMEOUT = "timeout"
+
+
+class Stage:
+    """
+    One node of the pipeline graph.
+      - fn(inputs) receives a dict {dependency_name: result} and returns this stage's result
+      - executor: "thread" (default) or "process"; process stages need a picklable fn and inputs
+      - timeout: seconds before the stage is abandoned and its fallback used
+      - required: failures/timeouts of required stages abort the run
+      - cache_key: with a graph-level cache, a stored result under this key is reused instead of running fn
+    """
+
+    def __init__(self, name, fn, depends_on=(), executor="thread", timeout=None,
+                 required=False, fallback=None, cache_key=None):
+        self.name = name
+        self.fn = fn
+        self.depends_on = tuple(depends_on)
+        self.executor = executor
+        self.timeout = timeout
+        self.required = required
+        self.fallback = fallback
+        self.cache_key = cache_key
+
+
+class StageFailed(RuntimeError):
+    pass
+
+
+def _input_frame(fn, inputs):
+    # The DataFrame a stage works on: a direct input, a {"df": ...} input, or a df= keyword
+    candidates = list(inputs.values()) + list(getattr(fn, "keywords", {}).values())
+    for value in candidates:
+        if isinstance(value, dict):
+            value = value.get("df")
+        if hasattr(value, "shape"):
+            return value
+    return None
+
+
+def _run_stage(name, fn, inputs, profile=False, trace_memory=False, profile_dir=None):
+    """
+    Worker-side wrapper: runs the stage under measure() and returns (result, metric records),
+    so records from process-pool stages make it back to the parent too.
+    """
+    with collect_metrics() as records:
+        with measure(f"stage:{name}", data=_input_frame(fn, inputs), profile=profile,
+                     trace_memory=trace_memory, profile_dir=profile_dir):
+            value = fn(inputs)
+    return value, records
+
+
+class StageGraph:
+    def __init__(self, stages, max_workers=4, max_process_workers=2,
+                 profile_stages=(), trace_memory=False, profile_dir=None, cache=None):
+        """
+        profile_stages: stage names to run under cProfile
+        trace_memory: record tracemalloc peaks per stage (slower). Tracing runs once for the whole run,
+        so the peaks of stages that overlap in time include each other's allocations
+        cache: optional services.pipeline_cache.PipelineCache; stages with a cache_key are served
+        from it when possible and their successful results are stored in it
+        Metric records of every stage and instrumented function are gathered in self.metrics.
+        """
+        self.stages = {s.name: s for s in stages}
+        self.max_workers = max_workers
+        self.max_process_workers = max_process_workers
+        self.profile_stages = set(profile_stages)
+        self.trace_memory = trace_memory
+        self.profile_dir = profile_dir
+        self.cache = cache
+        self.metrics = []
+        self._validate()
+
+    def _validate(self):
+        for stage in self.stages.values():
+            missing = [d for d in stage.depends_on if d not in self.stages]
+            if missing:
+                raise ValueError(f"Stage '{stage.name}' depends on unknown stages {missing}")
+        # Kahn's algorithm: every stage must be reachable without a cycle
+        indegree = {n: len(s.depends_on) for n, s in self.stages.items()}
+        ready = [n for n, d in indegree.items() if d == 0]
+        seen = 0
+        while ready:
+            name = ready.pop()
+            seen += 1
+            for other in self.stages.values():
+                if name in other.depends_on:
+                    indegree[other.name] -= 1
+                    if indegree[other.name] == 0:
+                        ready.append(other.name)
+        if seen != len(self.stages):
+            raise ValueError("Stage graph contains a cycle")
+
+    def iter_run(self):
+        """
+        Execute the graph, yielding (stage_name, status, result) as each stage finishes.
+        Independent stages run concurrently; a stage starts as soon as its dependencies are done.
+        Timed-out stages are abandoned (their worker cannot be interrupted) and yield their fallback.
+        """
+        results, status = {}, {}
+        pending = {}   # future -> (stage, deadline)
+        from_cache = set()
+        thread_pool = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="stage")
+        process_pool = None
+        if any(s.executor == "process" for s in self.stages.values()):
+            process_pool = ProcessPoolExecutor(max_workers=self.max_process_workers)
+        # One tracing session for the run instead of stages starting/stopping it under each other
+        owns_tracing = self.trace_memory and not tracemalloc.is_tracing()
+        if owns_tracing:
+            tracemalloc.start()
+
+        def submit_ready():
+            for name, stage in self.stages.items():
+                if name in status or any(f_stage.name == name for f_stage, _ in pending.values()):
+                    continue
+                if not all(d in status for d in stage.depends_on):
+                    continue
+                if self.cache is not None and stage.cache_key:
+                    hit, value = self.cache.get(stage.cache_key)
+                    if hit:
+                        future = Future()
+                        future.set_result((value, [{"name": f"stage:{name}", "status": "ok",
+                                                    "cache_hit": True, "wall_seconds": 0.0}]))
+                        pending[future] = (stage, None)
+                        from_cache.add(future)
+                        continue
+                inputs = {d: results[d] for d in stage.depends_on}
+                pool = process_pool if stage.executor == "process" else thread_pool
+                future = pool.submit(_run_stage, name, stage.fn, inputs,
+                                     profile=name in self.profile_stages,
+                                     trace_memory=self.trace_memory, profile_dir=self.profile_dir)
+                deadline = time.monotonic() + stage.timeout if stage.timeout else None
+                pending[future] = (stage, deadline)
+
+        try:
+            submit_ready()
+            while pending:
+                deadlines = [d for _, d in pending.values() if d is not None]
+                wait_for = max(min(deadlines) - time.monotonic(), 0) if deadlines else None
+                done, _ = wait(list(pending), timeout=wait_for, return_when=FIRST_COMPLETED)
+
+                finished = []
+                for future in done:
+                    stage, _ = pending.pop(future)
+                    try:
+                        value, records = future.result()
+                        self.metrics.extend(records)
+                        if self.cache is not None and stage.cache_key and future not in from_cache:
+                            self.cache.put(stage.cache_key, value)
+                        finished.append((stage, STATUS_OK, value))
+                    except Exception as e:
+                        logger.exception(f"Stage '{stage.name}' failed")
+                        if stage.required:
+                            raise StageFailed(f"Required stage '{stage.name}' failed: {e}") from e
+                        finished.append((stage, STATUS_FAILED, stage.fallback))
+
+                now = time.monotonic()
+                for future, (stage, deadline) in list(pending.items()):
+                    if deadline is not None and now >= deadline:
+                        pending.pop(future)
+                        future.cancel()
+                        logger.error(f"Stage '{stage.name}' timed out after {stage.timeout}s")
+                        if stage.required:
+                            raise StageFailed(f"Required stage '{stage.name}' timed out")
+                        finished.append((stage, STATUS_TIMEOUT, stage.fallback))
+
+                for stage, stage_status, value in finished:
+                    results[stage.name] = value
+                    status[stage.name] = stage_status
+                    yield stage.name, stage_status, value
+                submit_ready()
+        finally:
+            # Don't block on abandoned (timed-out) stages
+            thread_pool.shutdown(wait=False, cancel_futures=True)
+            if process_pool is not None:
+                process_pool.shutdown(wait=False, cancel_futures=True)
+            if owns_tracing:
+                tracemalloc.stop()
+
+    def run(self, on_stage_complete=None):
+        """
+        Execute the whole graph. Returns ({stage: result}, {stage: status}).
+        on_stage_complete(name, status, result) is called as each stage finishes.
+        """
+        results, status = {}, {}
+        for name, stage_status, value in self.iter_run():
+            results[name] = value
+            status[name] = stage_status
+            if on_stage_complete:
+                on_stage_complete(name, stage_status, value)
+        return results, status
@@ -2,12 +2,115 @@
 # Plotly helpers: generate a few standard charts automatically
 
 import plotly.express as px
+import plotly.graph_objects as go
+import numpy as np
 import pandas as pd
+from core.correlation import compute_correlation
+from services.instrumentation import instrumented
 
+# Above this many rows render_mode="auto" aggregates before building figures
+AGGREGATE_ROWS = 50_000
+# Points per trace in aggregated mode (trend lines, scatter-matrix sample)
+MAX_POINTS = 2_000
+# Wider numeric tables show only the columns in the strongest pairs; cell labels only when small
+MAX_HEATMAP_COLUMNS = 20
+HEATMAP_LABEL_COLUMNS = 12
 
-def generate_top_visuals(df: pd.DataFrame, max_charts: int = 5):
+
+# -------------------------------
+# Aggregation helpers: figure size depends on bins/points, not on row count
+# -------------------------------
+def lttb(x: np.ndarray, y: np.ndarray, n_out: int) -> np.ndarray:
+    """
+    Largest-Triangle-Three-Buckets downsampling. Returns indices of the n_out points
+    that best preserve the visual shape of the line (x must be sorted, numeric).
+    """
+    n = len(x)
+    if n_out >= n or n_out < 3:
+        return np.arange(n)
+    x = np.asarray(x, dtype=np.float64)
+    y = np.asarray(y, dtype=np.float64)
+    idx = np.empty(n_out, dtype=np.int64)
+    idx[0], idx[-1] = 0, n - 1
+    # n_out - 2 buckets between the fixed first and last points
+    edges = np.linspace(1, n - 1, n_out - 1).astype(np.int64)
+    a = 0
+    for i in range(n_out - 2):
+        start, end = edges[i], edges[i + 1]
+        next_end = edges[i + 2] if i + 2 < len(edges) else n
+        avg_x = x[end:next_end].mean()
+        avg_y = y[end:next_end].mean()
+        area = np.abs((x[a] - avg_x) * (y[start:end] - y[a]) - (x[a] - x[start:end]) * (avg_y - y[a]))
+        a = start + int(area.argmax())
+        idx[i + 1] = a
+    return idx
+
+
+def histogram_figure(s: pd.Series, col: str, nbins: int = 30):
+    """Histogram from np.histogram counts (nbins bars instead of every raw value)."""
+    values = s.to_numpy(dtype="float64", na_value=np.nan)
+    values = values[np.isfinite(values)]
+    counts, edges = np.histogram(values, bins=nbins) if values.size else (np.zeros(0), np.zeros(1))
+    fig = go.Figure(go.Bar(x=(edges[:-1] + edges[1:]) / 2, y=counts, width=np.diff(edges), name=col))
+    fig.update_layout(title=f"Distribution — {col}", xaxis_title=col, yaxis_title="count", bargap=0)
+    return fig
+
+
+def trend_figure(df: pd.DataFrame, date_col: str, col: str, max_points: int = MAX_POINTS):
+    """Time trend downsampled with LTTB to at most max_points."""
+    part = df[[date_col, col]].dropna().sort_values(date_col)
+    x = part[date_col].to_numpy()
+    y = part[col].to_numpy(dtype="float64")
+    keep = lttb(part[date_col].astype("int64").to_numpy(), y, max_points)
+    fig = px.line(x=x[keep], y=y[keep], labels={"x": date_col, "y": col}, title=f"Trend over time — {col}")
+    if len(keep) < len(part):
+        fig.update_layout(title=f"Trend over time — {col} ({len(keep):,} of {len(part):,} points, LTTB)")
+    return fig
+
+
+def correlation_figure(correlation, max_columns: int = MAX_HEATMAP_COLUMNS):
+    """Heatmap of a CorrelationResult, limited to the columns of its strongest pairs."""
+    cols = correlation.focus_columns(max_columns)
+    title = "Correlation Matrix"
+    if len(cols) < len(correlation.columns):
+        title += f" — {len(cols)} of {len(correlation.columns)} columns with the strongest pairs"
+    if correlation.sampled:
+        title += f" ({correlation.n_rows:,}-row sample)"
+    return px.imshow(correlation.to_frame(cols), text_auto=".2f" if len(cols) <= HEATMAP_LABEL_COLUMNS else False,
+                     zmin=-1, zmax=1, color_continuous_scale="RdBu_r", title=title)
+
+
+def box_figure(df: pd.DataFrame, cat: str, col: str, max_categories: int = 10):
+    """
+    Box plot from per-category quartiles (Plotly precomputed-box traces).
+    Whiskers are clipped to 1.5 IQR within the observed range; individual outliers are not drawn.
+    """
+    top = df[cat].value_counts().nlargest(max_categories).index
+    part = df.loc[df[cat].isin(top), [cat, col]]
+    grouped = part.groupby(cat, observed=True)[col]
+    q = grouped.quantile([0.25, 0.5, 0.75]).unstack()
+    lo, hi = grouped.min(), grouped.max()
+    iqr = q[0.75] - q[0.25]
+    fig = go.Figure(go.Box(
+        x=[str(c) for c in q.index],
+        q1=q[0.25], median=q[0.5], q3=q[0.75],
+        lowerfence=np.maximum(lo, q[0.25] - 1.5 * iqr),
+        upperfence=np.minimum(hi, q[0.75] + 1.5 * iqr),
+        name=col,
+    ))
+    fig.update_layout(title=f"{col} by {cat}", xaxis_title=cat, yaxis_title=col)
+    return fig
+
+
+@instrumented()
+def generate_top_visuals(df: pd.DataFrame, max_charts: int = 5, render_mode: str = "auto",
+                         max_points: int = MAX_POINTS, correlation=None):
     """
     Returns list of (title, fig) tuples for display.
+    Pass `correlation` (core.correlation.CorrelationResult) to reuse an already computed matrix.
+
+    render_mode: "aggregate" pre-bins/downsamples in NumPy so figure payloads stay bounded,
+    "raw" hands every row to Plotly Express, "auto" aggregates above AGGREGATE_ROWS rows.
 
     Strategy:
     - Numeric columns:
@@ -20,23 +123,28 @@ def generate_top_visuals(df: pd.DataFrame, max_charts: int = 5):
         * Box plots: numeric vs categorical (distribution per category)
     """
     figs = []
+    aggregate = render_mode == "aggregate" or (render_mode == "auto" and len(df) > AGGREGATE_ROWS)
 
     # Basic type splits
     numeric = df.select_dtypes(include="number")
-    categorical = df.select_dtypes(include="object")
+    categorical = df.select_dtypes(include=["object", "string", "category"])
     datetime_cols = df.select_dtypes(include="datetime64[ns]").columns
 
     # 1) Numeric histograms for first 3 numeric cols
     for col in numeric.columns[:3]:
-        fig = px.histogram(df, x=col, nbins=30, title=f"Distribution — {col}")
+        if aggregate:
+            fig = histogram_figure(df[col], col, nbins=30)
+        else:
+            fig = px.histogram(df, x=col, nbins=30, title=f"Distribution — {col}")
         figs.append((f"hist_{col}", fig))
         if len(figs) >= max_charts:
             return figs
 
     # 2) Correlation heatmap (if enough numeric cols)
     if numeric.shape[1] >= 2:
-        corr = numeric.corr()
-        fig = px.imshow(corr, text_auto=True, title="Correlation Matrix")
+        if correlation is None:
+            correlation = compute_correlation(df, columns=list(numeric.columns))
+        fig = correlation_figure(correlation)
         figs.append(("corr_matrix", fig))
         if len(figs) >= max_charts:
             return figs
@@ -45,14 +153,17 @@ def generate_top_visuals(df: pd.DataFrame, max_charts: int = 5):
     if len(datetime_cols) and numeric.shape[1]:
         date_col = datetime_cols[0]
         # Sort by date for a proper time axis
-        df_sorted = df.sort_values(date_col)
+        df_sorted = None if aggregate else df.sort_values(date_col)
         for col in numeric.columns[:2]:
-            fig = px.line(
-                df_sorted,
-                x=date_col,
-                y=col,
-                title=f"Trend over time — {col}",
-            )
+            if aggregate:
+                fig = trend_figure(df, date_col, col, max_points=max_points)
+            else:
+                fig = px.line(
+                    df_sorted,
+                    x=date_col,
+                    y=col,
+                    title=f"Trend over time — {col}",
+                )
             figs.append((f"trend_{col}", fig))
             if len(figs) >= max_charts:
                 return figs
@@ -60,10 +171,15 @@ def generate_top_visuals(df: pd.DataFrame, max_charts: int = 5):
     # 4) Scatter-matrix (pairplot) for key numeric features
     if numeric.shape[1] >= 3:
         cols = numeric.columns[:4]  # limit for readability
+        source = df
+        title = "Scatter Matrix — key numeric features"
+        if aggregate and len(df) > max_points:
+            source = df[list(cols)].sample(n=max_points, random_state=42)
+            title += f" (random sample of {max_points:,} rows)"
         fig = px.scatter_matrix(
-            df,
+            source,
             dimensions=cols,
-            title="Scatter Matrix — key numeric features",
+            title=title,
         )
         figs.append(("scatter_matrix", fig))
         if len(figs) >= max_charts:
@@ -86,13 +202,16 @@ def generate_top_visuals(df: pd.DataFrame, max_charts: int = 5):
     if len(categorical.columns) and numeric.shape[1]:
         cat = categorical.columns[0]
         for col in numeric.columns[:2]:
-            fig = px.box(
-                df,
-                x=cat,
-                y=col,
-                points="outliers",
-                title=f"{col} by {cat}",
-            )
+            if aggregate:
+                fig = box_figure(df, cat, col)
+            else:
+                fig = px.box(
+                    df,
+                    x=cat,
+                    y=col,
+                    points="outliers",
+                    title=f"{col} by {cat}",
+                )
             figs.append((f"box_{col}_by_{cat}", fig))
             if len(figs) >= max_charts:
                 return figs
@@ -0,0 +1,273 @@
+# run_batch.py
+# Headless batch runner: the full InsightIQ pipeline over many datasets, without Streamlit.
+#
+# Usage (from the repository root):
+#   python run_batch.py exports/                       # every CSV/Parquet/Feather/Excel file in a directory
+#   python run_batch.py manifest.csv --workers 4       # or a manifest (CSV or JSON) of files and SQL sources
+#   python run_batch.py exports/ --out reports/nightly --threads-per-worker 2
+#   python run_batch.py exports/ --cache                # reuse stage results across runs (pipeline_cache in config)
+#
+# Manifest columns / keys (one dataset per row):
+#   name       output folder name (defaults to the file name / table)
+#   path       file to load                     -- or, for SQL Server sources --
+#   server, database, username, password_env (environment variable holding the password),
+#   table or query, max_rows, pushdown (true: KPIs computed on the server, a sample is fetched)
+#
+# Output: <out>/<name>/summary.json (+ the PDF report) per dataset and <out>/batch_summary.json
+# with totals and throughput (datasets/hour).
+
+import argparse
+import csv
+import json
+import multiprocessing
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from datetime import datetime, timezone
+from pathlib import Path
+
+# Set before any pipeline module is imported (workers inherit it): plain in-process caches
+os.environ.setdefault("INSIGHTIQ_HEADLESS", "1")
+
+FILE_SUFFIXES = {".csv", ".txt", ".parquet", ".pq", ".feather", ".arrow", ".ipc", ".xlsx", ".xls"}
+# Scheduling estimates for SQL sources, whose size is unknown until they are read
+SQL_ROW_BYTES = 100
+SQL_UNBOUNDED_ROWS = 10_000_000
+THREAD_ENV_VARS = ["OMP_NUM_THREADS", "MKL_NUM_THREADS", "OPENBLAS_NUM_THREADS", "NUMEXPR_NUM_THREADS"]
+
+# Per worker process, set up once by _init_worker
+_WORKER = {}
+
+
+def load_config(path="config.yaml") -> dict:
+    import yaml
+    p = Path(path)
+    if not p.exists():
+        return {}
+    return yaml.safe_load(p.read_text(encoding="utf-8")) or {}
+
+
+def _safe_name(name: str) -> str:
+    return "".join(c if c.isalnum() or c in "-_." else "_" for c in str(name)).strip("._") or "dataset"
+
+
+def _as_bool(value) -> bool:
+    return str(value).strip().lower() in ("1", "true", "yes", "y")
+
+
+def discover_datasets(source: str):
+    """Dataset specs from a directory (files by suffix) or a CSV/JSON manifest."""
+    p = Path(source)
+    if p.is_dir():
+        files = sorted(f for f in p.iterdir() if f.is_file() and f.suffix.lower() in FILE_SUFFIXES)
+        specs = [{"name": f.stem, "path": str(f)} for f in files]
+    elif p.suffix.lower() in (".json", ".csv"):
+        if p.suffix.lower() == ".json":
+            specs = json.loads(p.read_text(encoding="utf-8"))
+        else:
+            with open(p, newline="", encoding="utf-8") as fh:
+                specs = [{k: v for k, v in row.items() if v not in (None, "")} for row in csv.DictReader(fh)]
+        # Relative paths in a manifest are relative to the manifest
+        for spec in specs:
+            if spec.get("path") and not Path(spec["path"]).is_absolute():
+                spec["path"] = str(p.parent / spec["path"])
+    else:
+        raise ValueError(f"{source} is neither a directory nor a .csv/.json manifest")
+
+    seen = {}
+    for spec in specs:
+        name = _safe_name(spec.get("name") or Path(spec.get("path") or spec.get("table") or "query").stem)
+        seen[name] = seen.get(name, 0) + 1
+        spec["name"] = name if seen[name] == 1 else f"{name}_{seen[name]}"
+    return specs
+
+
+def _size_hint(spec) -> int:
+    """Approximate input bytes, used to start the largest datasets first."""
+    path = spec.get("path")
+    if path:
+        return Path(path).stat().st_size if Path(path).exists() else 0
+    if spec.get("max_rows"):
+        rows = int(spec["max_rows"])
+    elif spec.get("table") and _as_bool(spec.get("pushdown", False)):
+        rows = 100_000  # only the sample is fetched
+    else:
+        # A whole table or query of unknown size: assume it is large rather than schedule it last
+        rows = SQL_UNBOUNDED_ROWS
+    return rows * SQL_ROW_BYTES
+
+
+def _init_worker(config: dict, threads_per_worker: int):
+    """Runs once per worker process: cap native threads, then load the model a single time."""
+    if threads_per_worker:
+        for var in THREAD_ENV_VARS:
+            os.environ[var] = str(threads_per_worker)
+    from core.pipeline_manager import PipelineManager
+    from core.registry import capability
+    from services.logger import get_logger
+    _WORKER["config"] = config
+    _WORKER["logger"] = get_logger()
+    llm_config = PipelineManager(config).llm_config
+    try:
+        # Same cached service the insights stage asks for, so every dataset reuses this load
+        capability("inference_service")(**capability("llm_settings")(llm_config)).pipeline()
+    except Exception as e:
+        # Insights then fall back to their failure text; the rest of the pipeline still runs
+        _WORKER["logger"].warning(f"Worker {os.getpid()}: model preload failed: {e}")
+    if threads_per_worker:
+        try:
+            import torch
+            torch.set_num_threads(threads_per_worker)
+        except ImportError:
+            pass
+
+
+def _load_source(spec: dict):
+    """(df, source_kpis) for one dataset spec."""
+    if spec.get("path"):
+        from core.ingestion import read_dataset
+        ingestion = _WORKER["config"].get("ingestion", {})
+        df, _ = read_dataset(spec["path"], dtype_backend=ingestion.get("dtype_backend", "compact"),
+                             memory_map=ingestion.get("memory_map", True),
+                             block_size_mb=ingestion.get("block_size_mb", 16))
+        return df, None
+
+    from services.sql_server import connect_sql_server, fetch_query, fetch_table, fetch_sample, pushdown_kpis, \
+        fill_sample_medians
+    password = os.environ.get(spec.get("password_env", ""), spec.get("password", ""))
+    max_rows = int(spec["max_rows"]) if spec.get("max_rows") else None
+    conn = connect_sql_server(spec["server"], spec["database"], spec.get("username"), password)
+    try:
+        if spec.get("table") and _as_bool(spec.get("pushdown", False)):
+            source_kpis = pushdown_kpis(conn, spec["table"])
+            df = fetch_sample(conn, spec["table"], n_rows=max_rows or 100_000, row_count=source_kpis["row_count"])
+            fill_sample_medians(source_kpis, df)
+            return df, source_kpis
+        if spec.get("table"):
+            return fetch_table(conn, spec["table"], chunksize=50_000, max_rows=max_rows), None
+        return fetch_query(conn, spec["query"], chunksize=50_000, max_rows=max_rows), None
+    finally:
+        conn.close()
+
+
+def _json_default(value):
+    if hasattr(value, "item"):
+        return value.item()
+    return str(value)
+
+
+def run_dataset(spec: dict, out_dir: str) -> dict:
+    """Load one dataset, run the full pipeline, write <out_dir>/<name>/summary.json."""
+    from core.pipeline_manager import PipelineManager
+    dataset_dir = Path(out_dir) / spec["name"]
+    dataset_dir.mkdir(parents=True, exist_ok=True)
+    config = dict(_WORKER["config"])
+    config["paths"] = {**config.get("paths", {}), "report_dir": str(dataset_dir)}
+    summary = {"name": spec["name"], "source": spec.get("path") or spec.get("table") or "query",
+               "worker_pid": os.getpid(), "status": "ok"}
+    start = time.perf_counter()
+    try:
+        df, source_kpis = _load_source(spec)
+        summary["load_seconds"] = round(time.perf_counter() - start, 3)
+        summary["rows"], summary["columns"] = int(len(df)), int(len(df.columns))
+        results = PipelineManager(config).run_full_pipeline(df, source_kpis=source_kpis)
+        summary.update({
+            "stage_status": results.get("stage_status"),
+            "stage_seconds": {r["name"].split(":", 1)[-1]: r.get("wall_seconds")
+                              for r in results.get("metrics", []) if str(r.get("name", "")).startswith("stage:")},
+            "kpis": results.get("kpis"),
+            "top_correlations": results.get("top_correlations"),
+            "clean_summary": results.get("clean_summary"),
+            "forecast_summary": results.get("forecast_summary"),
+            "insights": results.get("insights"),
+            "report_path": results.get("report_path"),
+        })
+        if any(status != "ok" for status in (results.get("stage_status") or {}).values()):
+            summary["status"] = "partial"
+    except Exception as e:
+        _WORKER["logger"].exception(f"Dataset {spec['name']} failed")
+        summary["status"] = "failed"
+        summary["error"] = f"{type(e).__name__}: {e}"
+    summary["seconds"] = round(time.perf_counter() - start, 3)
+    (dataset_dir / "summary.json").write_text(json.dumps(summary, indent=2, default=_json_default), encoding="utf-8")
+    return summary
+
+
+def run_batch(specs, out_dir: str, config: dict, workers: int = None, threads_per_worker: int = None) -> dict:
+    """
+    Run every dataset on a process pool (spawned workers, one model load each).
+    Largest inputs are submitted first so a big file does not start last and stretch the batch.
+    """
+    out = Path(out_dir)
+    out.mkdir(parents=True, exist_ok=True)
+    workers = workers or max(1, min(len(specs), (os.cpu_count() or 2) // 2))
+    if threads_per_worker is None:
+        threads_per_worker = max(1, (os.cpu_count() or 1) // workers)
+    ordered = sorted(specs, key=_size_hint, reverse=True)
+
+    started = time.perf_counter()
+    summaries = []
+    with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn"),
+                             initializer=_init_worker, initargs=(config, threads_per_worker)) as pool:
+        futures = {pool.submit(run_dataset, spec, str(out)): spec for spec in ordered}
+        for future in as_completed(futures):
+            spec = futures[future]
+            try:
+                summary = future.result()
+            except Exception as e:  # worker crashed (e.g. killed for memory)
+                summary = {"name": spec["name"], "status": "failed", "error": f"{type(e).__name__}: {e}"}
+            summaries.append(summary)
+            elapsed = time.perf_counter() - started
+            print(f"[{len(summaries)}/{len(specs)}] {summary['name']}: {summary['status']} "
+                  f"in {summary.get('seconds', 0):.1f}s ({len(summaries) / elapsed * 3600:.1f} datasets/hour)",
+                  flush=True)
+
+    elapsed = time.perf_counter() - started
+    counts = {}
+    for s in summaries:
+        counts[s["status"]] = counts.get(s["status"], 0) + 1
+    batch = {
+        "finished_at": datetime.now(timezone.utc).isoformat(),
+        "datasets": len(specs),
+        "status_counts": counts,
+        "workers": workers,
+        "threads_per_worker": threads_per_worker,
+        "wall_seconds": round(elapsed, 2),
+        "datasets_per_hour": round(len(summaries) / elapsed * 3600, 2) if elapsed else None,
+        "mean_dataset_seconds": round(sum(s.get("seconds", 0) for s in summaries) / len(summaries), 2)
+        if summaries else None,
+        "failed": [{"name": s["name"], "error": s.get("error")} for s in summaries if s["status"] == "failed"],
+        "results": {s["name"]: str(out / s["name"] / "summary.json") for s in summaries},
+    }
+    (out / "batch_summary.json").write_text(json.dumps(batch, indent=2, default=_json_default), encoding="utf-8")
+    return batch
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Run the InsightIQ pipeline headless over many datasets.")
+    parser.add_argument("source", help="directory of data files, or a .csv/.json manifest")
+    parser.add_argument("--config", default="config.yaml")
+    parser.add_argument("--out", default="reports/batch", help="output directory")
+    parser.add_argument("--workers", type=int, default=None, help="worker processes (default: half the cores)")
+    parser.add_argument("--threads-per-worker", type=int, default=None,
+                        help="BLAS/torch threads per worker (default: cores / workers)")
+    parser.add_argument("--cache", action="store_true",
+                        help="use the per-stage pipeline cache (off by default: batch datasets rarely repeat)")
+    args = parser.parse_args(argv)
+
+    config = load_config(args.config)
+    config["pipeline_cache"] = {**config.get("pipeline_cache", {}), "enabled": args.cache}
+    specs = discover_datasets(args.source)
+    if not specs:
+        print(f"No datasets found in {args.source}", file=sys.stderr)
+        return 1
+    out_dir = Path(args.out) / datetime.now().strftime("%Y%m%d-%H%M%S")
+    batch = run_batch(specs, str(out_dir), config, workers=args.workers, threads_per_worker=args.threads_per_worker)
+    print(json.dumps({k: batch[k] for k in ("datasets", "status_counts", "wall_seconds", "datasets_per_hour")}))
+    print(f"Summaries written to {out_dir}")
+    return 1 if batch["status_counts"].get("failed") else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
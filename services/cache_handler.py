@@ -1,8 +1,69 @@
 # services/cache_handler.py
-# Provide caching decorators for expensive computations (placeholder)
+# Provide caching decorators for expensive computations
+# (pipeline stage results are cached by services.pipeline_cache)
+#
+# Inside Streamlit these are st.cache_data / st.cache_resource. Headless runs (run_batch.py,
+# INSIGHTIQ_HEADLESS=1, or streamlit not installed) get an in-process equivalent instead.
 
-import streamlit as st
+import copy
+import functools
+import inspect
+import os
+import threading
+from collections import OrderedDict
 
-# Use st.cache_data for data objects and st.cache_resource for models
-cache_data = st.cache_data
-cache_resource = st.cache_resource
+
+def _memoize(copy_result: bool, max_entries: int = None):
+    """
+    Minimal st.cache_* stand-in: keyed by arguments, skipping parameters whose name starts with
+    "_" (the Streamlit convention for unhashable inputs); LRU-bounded by max_entries.
+    """
+    def decorate(func):
+        signature = inspect.signature(func)
+        entries = OrderedDict()
+        lock = threading.RLock()
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            bound = signature.bind(*args, **kwargs)
+            bound.apply_defaults()
+            key = repr([(k, v) for k, v in bound.arguments.items() if not k.startswith("_")])
+            with lock:
+                if key in entries:
+                    entries.move_to_end(key)
+                    value = entries[key]
+                else:
+                    value = func(*args, **kwargs)
+                    entries[key] = value
+                    while max_entries and len(entries) > max_entries:
+                        entries.popitem(last=False)
+            # cache_data hands every caller its own copy, like Streamlit's pickled values
+            return copy.deepcopy(value) if copy_result else value
+
+        wrapper.clear = entries.clear
+        return wrapper
+    return decorate
+
+
+def _headless_decorator(copy_result: bool):
+    def decorator(func=None, *, max_entries=None, **_streamlit_options):
+        if func is None:
+            return _memoize(copy_result, max_entries)
+        return _memoize(copy_result, max_entries)(func)
+    return decorator
+
+
+HEADLESS = os.getenv("INSIGHTIQ_HEADLESS", "").lower() in ("1", "true", "yes")
+if not HEADLESS:
+    try:
+        import streamlit as st
+    except ImportError:
+        HEADLESS = True
+
+if HEADLESS:
+    cache_data = _headless_decorator(copy_result=True)
+    cache_resource = _headless_decorator(copy_result=False)
+else:
+    # Use st.cache_data for data objects and st.cache_resource for models
+    cache_data = st.cache_data
+    cache_resource = st.cache_resource
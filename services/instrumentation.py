@@ -0,0 +1,196 @@
+# services/instrumentation.py
+# Per-stage / per-function timing and memory instrumentation
+
+import contextvars
+import cProfile
+import functools
+import io
+import pstats
+import sys
+import threading
+import time
+import tracemalloc
+from contextlib import contextmanager
+from pathlib import Path
+from services.logger import log_metrics
+
+MB = 1024 * 1024
+
+# Records produced while a collect_metrics() block is active land in this list
+_active_collector = contextvars.ContextVar("insightiq_metrics_collector", default=None)
+
+# Only one profiler can be active per process (Python 3.12+ raises on a second enable()),
+# so profiled blocks running on different threads take turns
+_profile_lock = threading.Lock()
+
+# tracemalloc is process-wide: blocks traced at the same time share one session and one peak
+_trace_lock = threading.Lock()
+_trace_users = 0
+_trace_owned = False
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+
+def current_rss_bytes():
+    """Current resident set size, or None if it cannot be read on this platform."""
+    try:
+        import psutil
+        return psutil.Process().memory_info().rss
+    except Exception:
+        pass
+    try:
+        with open("/proc/self/statm") as f:
+            pages = int(f.read().split()[1])
+        return pages * resource.getpagesize()
+    except Exception:
+        return None
+
+
+def peak_rss_bytes():
+    """High-water mark of the process RSS, or None if unavailable."""
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports KiB, macOS bytes
+    return peak if sys.platform == "darwin" else peak * 1024
+
+
+def _trace_enter():
+    """Join the shared tracemalloc session (starting it for the first block); returns the traced bytes now."""
+    global _trace_users, _trace_owned
+    with _trace_lock:
+        if _trace_users == 0:
+            if not tracemalloc.is_tracing():
+                tracemalloc.start()
+                _trace_owned = True
+            # Only the first of overlapping blocks resets the peak, so nobody else's peak is lost
+            tracemalloc.reset_peak()
+        _trace_users += 1
+        return tracemalloc.get_traced_memory()[0]
+
+
+def _trace_exit():
+    """Peak traced bytes so far; the last block out stops tracing if a block started it."""
+    global _trace_users, _trace_owned
+    with _trace_lock:
+        peak = tracemalloc.get_traced_memory()[1]
+        _trace_users -= 1
+        if _trace_users == 0 and _trace_owned:
+            tracemalloc.stop()
+            _trace_owned = False
+        return peak
+
+
+def _shape_of(obj):
+    shape = getattr(obj, "shape", None)
+    if shape is None or len(shape) == 0:
+        return None, None
+    return int(shape[0]), (int(shape[1]) if len(shape) > 1 else 1)
+
+
+@contextmanager
+def collect_metrics():
+    """
+    Collect every record emitted by measure()/instrumented() inside this block
+    (including worker threads started with a copied context).
+    """
+    records = []
+    token = _active_collector.set(records)
+    try:
+        yield records
+    finally:
+        _active_collector.reset(token)
+
+
+@contextmanager
+def measure(name, data=None, profile=False, trace_memory=False, profile_dir=None):
+    """
+    Measure a block of work and emit one structured record:
+      wall_seconds, cpu_seconds (thread CPU), rss_delta_mb,
+      process_rss_peak_mb (high-water mark of the whole process since it started, not of this block),
+      rows/columns of `data`, and optionally
+      tracemalloc_peak_mb (trace_memory=True; slows allocations): peak traced memory above the level at
+        the start of the block. Tracing is process-wide, so when blocks overlap (concurrent stages) the
+        peak includes their allocations too.
+      profile_top: cProfile summary of this block (profile=True; dumped to profile_dir if given).
+        Profiled blocks on different threads run one at a time.
+    Yields the record dict, so callers can add fields (e.g. output rows).
+    """
+    rows, columns = _shape_of(data)
+    record = {"name": name, "rows": rows, "columns": columns, "status": "ok"}
+
+    if trace_memory:
+        traced_start = _trace_enter()
+
+    profiler = None
+    if profile:
+        _profile_lock.acquire()
+        profiler = cProfile.Profile()
+    rss_start = current_rss_bytes()
+    wall_start = time.perf_counter()
+    cpu_start = time.thread_time()
+    if profiler:
+        try:
+            profiler.enable()
+        except BaseException:
+            _profile_lock.release()
+            raise
+    try:
+        yield record
+    except BaseException as e:
+        record["status"] = "error"
+        record["error"] = repr(e)
+        raise
+    finally:
+        if profiler:
+            profiler.disable()
+            _profile_lock.release()
+        record["wall_seconds"] = round(time.perf_counter() - wall_start, 4)
+        record["cpu_seconds"] = round(time.thread_time() - cpu_start, 4)
+
+        rss_end = current_rss_bytes()
+        if rss_start is not None and rss_end is not None:
+            record["rss_delta_mb"] = round((rss_end - rss_start) / MB, 2)
+        peak = peak_rss_bytes()
+        if peak is not None:
+            record["process_rss_peak_mb"] = round(peak / MB, 2)
+
+        if trace_memory:
+            traced_peak = _trace_exit()
+            record["tracemalloc_peak_mb"] = round(max(traced_peak - traced_start, 0) / MB, 2)
+
+        if profiler:
+            buf = io.StringIO()
+            pstats.Stats(profiler, stream=buf).sort_stats("cumulative").print_stats(25)
+            record["profile_top"] = buf.getvalue()
+            if profile_dir:
+                out = Path(profile_dir)
+                out.mkdir(parents=True, exist_ok=True)
+                prof_path = out / f"{name}_{int(time.time() * 1000)}.prof"
+                profiler.dump_stats(str(prof_path))
+                record["profile_path"] = str(prof_path)
+
+        collector = _active_collector.get()
+        if collector is not None:
+            collector.append(record)
+        log_metrics({k: v for k, v in record.items() if k != "profile_top"})
+
+
+def instrumented(name=None):
+    """
+    Decorator recording a measure() record for every call of a core function.
+    rows/columns are taken from the first DataFrame-like positional argument.
+    """
+    def decorator(fn):
+        label = name or fn.__name__
+
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            data = next((a for a in args if hasattr(a, "shape")), None)
+            with measure(label, data=data):
+                return fn(*args, **kwargs)
+        return wrapper
+    return decorator
@@ -0,0 +1,289 @@
+# services/job_queue.py
+# Local background jobs: bounded worker pool, priorities, progress, cancellation,
+# results persisted under reports/jobs/<job_id>/ so they outlive Streamlit reruns.
+
+from pathlib import Path
+import itertools
+import json
+import os
+import pickle
+import queue
+import threading
+import time
+import uuid
+from services.cache_handler import cache_resource
+from services.logger import get_logger
+
+logger = get_logger()
+
+JOB_QUEUED = "queued"
+JOB_RUNNING = "running"
+JOB_DONE = "done"
+JOB_FAILED = "failed"
+JOB_CANCELLED = "cancelled"
+FINAL_STATES = (JOB_DONE, JOB_FAILED, JOB_CANCELLED)
+
+# Seconds between status.json rewrites for progress-only updates
+PROGRESS_WRITE_INTERVAL = 0.5
+
+
+class JobCancelled(Exception):
+    """Raised inside a job (via JobContext.check_cancelled) once cancellation was requested."""
+
+
+class Job:
+    def __init__(self, job_id, name, priority):
+        self.id = job_id
+        self.name = name
+        self.priority = priority
+        self.status = JOB_QUEUED
+        self.progress = 0.0
+        self.message = ""
+        self.error = None
+        self.submitted = time.time()
+        self.started = None
+        self.finished = None
+        self.cancel_event = threading.Event()
+        self.result = None
+        self.fn = None
+        self.args = ()
+        self.kwargs = {}
+
+    def to_dict(self) -> dict:
+        return {
+            "id": self.id,
+            "name": self.name,
+            "priority": self.priority,
+            "status": self.status,
+            "progress": round(self.progress, 4),
+            "message": self.message,
+            "error": self.error,
+            "submitted": self.submitted,
+            "started": self.started,
+            "finished": self.finished,
+        }
+
+
+class JobContext:
+    """Handed to the job function: report progress and poll for cancellation."""
+
+    def __init__(self, job_queue, job):
+        self._queue = job_queue
+        self._job = job
+
+    @property
+    def job_id(self) -> str:
+        return self._job.id
+
+    @property
+    def cancelled(self) -> bool:
+        return self._job.cancel_event.is_set()
+
+    def check_cancelled(self):
+        if self.cancelled:
+            raise JobCancelled(self._job.id)
+
+    def progress(self, fraction: float, message: str = None):
+        self._queue._set_progress(self._job, fraction, message)
+
+    @property
+    def job_dir(self) -> Path:
+        """Directory for files the job writes next to its result (reports, exports)."""
+        return self._queue.job_dir(self._job.id)
+
+
+class JobQueue:
+    """
+    fn(ctx, *args, **kwargs) runs on one of max_workers threads; lower priority numbers run first.
+    Layout: <jobs_dir>/<job_id>/status.json and result.pkl.
+    Jobs from a previous process are reloaded read-only; ones it left unfinished are marked failed.
+    """
+
+    def __init__(self, max_workers: int = 2, jobs_dir: str = "reports/jobs", max_jobs_kept: int = 200):
+        self.jobs_dir = Path(jobs_dir)
+        self.jobs_dir.mkdir(parents=True, exist_ok=True)
+        self.max_workers = max_workers
+        self.max_jobs_kept = max_jobs_kept
+        self._jobs = {}
+        self._lock = threading.Lock()
+        self._queue = queue.PriorityQueue()
+        self._seq = itertools.count()  # FIFO among equal priorities
+        self._last_write = {}
+        self._closed = False
+        self._load_existing()
+        self._workers = [threading.Thread(target=self._worker, name=f"insightiq-job-{i}", daemon=True)
+                         for i in range(max_workers)]
+        for t in self._workers:
+            t.start()
+
+    # ---- public API ----
+    def submit(self, fn, *args, name: str = None, priority: int = 10, **kwargs) -> str:
+        if self._closed:
+            raise RuntimeError("JobQueue is shut down")
+        job = Job(uuid.uuid4().hex[:12], name or getattr(fn, "__name__", "job"), priority)
+        job.fn, job.args, job.kwargs = fn, args, kwargs
+        with self._lock:
+            self._jobs[job.id] = job
+        self._write_status(job, force=True)
+        self._queue.put((priority, next(self._seq), job.id))
+        self._prune()
+        return job.id
+
+    def status(self, job_id: str) -> dict:
+        job = self._jobs.get(job_id)
+        if job is None:
+            raise KeyError(f"Unknown job {job_id}")
+        return job.to_dict()
+
+    def progress(self, job_id: str) -> float:
+        return self.status(job_id)["progress"]
+
+    def result(self, job_id: str):
+        """Result of a finished job (loaded from disk if it ran in an earlier process); None otherwise."""
+        job = self._jobs.get(job_id)
+        if job is None or job.status != JOB_DONE:
+            return None
+        if job.result is None:
+            path = self.job_dir(job_id) / "result.pkl"
+            if path.exists():
+                with open(path, "rb") as fh:
+                    job.result = pickle.load(fh)
+        return job.result
+
+    def cancel(self, job_id: str) -> bool:
+        """Queued jobs are dropped; running jobs stop at their next check_cancelled()."""
+        job = self._jobs.get(job_id)
+        if job is None or job.status in FINAL_STATES:
+            return False
+        job.cancel_event.set()
+        with self._lock:
+            if job.status == JOB_QUEUED:
+                self._finish(job, JOB_CANCELLED)
+        return True
+
+    def list_jobs(self):
+        return sorted((j.to_dict() for j in self._jobs.values()), key=lambda d: d["submitted"], reverse=True)
+
+    def stats(self) -> dict:
+        counts = {}
+        for job in self._jobs.values():
+            counts[job.status] = counts.get(job.status, 0) + 1
+        return {"workers": self.max_workers, "queued": self._queue.qsize(), "jobs": counts}
+
+    def job_dir(self, job_id: str) -> Path:
+        return self.jobs_dir / job_id
+
+    def shutdown(self, cancel_pending: bool = True):
+        self._closed = True
+        if cancel_pending:
+            for job in list(self._jobs.values()):
+                if job.status in (JOB_QUEUED, JOB_RUNNING):
+                    self.cancel(job.id)
+        for _ in self._workers:
+            self._queue.put((float("inf"), next(self._seq), None))
+
+    # ---- workers ----
+    def _worker(self):
+        while True:
+            _, _, job_id = self._queue.get()
+            if job_id is None:
+                return
+            job = self._jobs.get(job_id)
+            with self._lock:
+                if job is None or job.status != JOB_QUEUED:
+                    continue  # cancelled while queued
+                job.status = JOB_RUNNING
+                job.started = time.time()
+            self._write_status(job, force=True)
+            try:
+                result = job.fn(JobContext(self, job), *job.args, **job.kwargs)
+                if job.cancel_event.is_set():
+                    raise JobCancelled(job.id)
+                self._save_result(job, result)
+                job.result = result
+                job.progress = 1.0
+                self._finish(job, JOB_DONE)
+            except JobCancelled:
+                self._finish(job, JOB_CANCELLED)
+            except Exception as e:
+                logger.exception(f"Job {job.id} ({job.name}) failed")
+                job.error = str(e)
+                self._finish(job, JOB_FAILED)
+            finally:
+                job.fn, job.args, job.kwargs = None, (), {}  # release the input data
+
+    def _finish(self, job, status):
+        job.status = status
+        job.finished = time.time()
+        self._write_status(job, force=True)
+
+    def _set_progress(self, job, fraction, message=None):
+        job.progress = min(max(float(fraction), 0.0), 1.0)
+        if message is not None:
+            job.message = message
+        self._write_status(job)
+
+    # ---- persistence ----
+    def _write_status(self, job, force=False):
+        now = time.monotonic()
+        if not force and now - self._last_write.get(job.id, 0) < PROGRESS_WRITE_INTERVAL:
+            return
+        self._last_write[job.id] = now
+        self._atomic_write(self.job_dir(job.id) / "status.json",
+                           json.dumps(job.to_dict(), default=str).encode("utf-8"))
+
+    def _save_result(self, job, result):
+        self._atomic_write(self.job_dir(job.id) / "result.pkl", pickle.dumps(result, protocol=pickle.HIGHEST_PROTOCOL))
+
+    @staticmethod
+    def _atomic_write(path: Path, data: bytes):
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = path.with_name(f".{path.name}.{uuid.uuid4().hex}.tmp")
+        try:
+            tmp.write_bytes(data)
+            os.replace(tmp, path)
+        finally:
+            if tmp.exists():
+                tmp.unlink()
+
+    def _load_existing(self):
+        for status_file in self.jobs_dir.glob("*/status.json"):
+            try:
+                doc = json.loads(status_file.read_text(encoding="utf-8"))
+            except (OSError, ValueError):
+                continue
+            job = Job(doc["id"], doc.get("name"), doc.get("priority", 10))
+            for key in ("status", "progress", "message", "error", "submitted", "started", "finished"):
+                setattr(job, key, doc.get(key))
+            if job.status not in FINAL_STATES:
+                job.status = JOB_FAILED
+                job.error = "interrupted (application restarted)"
+                job.finished = time.time()
+                self._write_status(job, force=True)
+            self._jobs[job.id] = job
+
+    def _prune(self):
+        """Keep the newest max_jobs_kept finished jobs (memory and disk)."""
+        finished = sorted((j for j in self._jobs.values() if j.status in FINAL_STATES),
+                          key=lambda j: j.submitted or 0)
+        for job in finished[:max(len(finished) - self.max_jobs_kept, 0)]:
+            with self._lock:
+                self._jobs.pop(job.id, None)
+            self._last_write.pop(job.id, None)
+            job_dir = self.job_dir(job.id)
+            for f in job_dir.glob("*"):
+                if f.is_file():
+                    f.unlink(missing_ok=True)
+            try:
+                job_dir.rmdir()
+            except OSError:
+                pass
+
+
+@cache_resource(show_spinner=False)
+def get_job_queue(max_workers: int = 2, jobs_dir: str = "reports/jobs") -> JobQueue:
+    """
+    Process-wide queue shared by all Streamlit sessions, so jobs survive reruns
+    and the worker count caps concurrent heavy runs across users.
+    """
+    return JobQueue(max_workers=max_workers, jobs_dir=jobs_dir)
@@ -0,0 +1,272 @@
+# services/llm_service.py
+# One shared local text2text model for all sessions: micro-batched generation + on-disk prompt cache.
+
+from concurrent.futures import Future
+from pathlib import Path
+import hashlib
+import json
+import os
+import queue
+import threading
+import time
+import uuid
+from services.cache_handler import cache_resource
+from services.logger import get_logger
+
+logger = get_logger()
+
+DEFAULT_MODEL = "google/flan-t5-small"
+DEFAULT_GENERATION = {"max_new_tokens": 150, "do_sample": False}
+
+
+class PromptCache:
+    """
+    Generated text keyed by sha256(model, prompt, generation params).
+    Layout: <cache_dir>/<key[:2]>/<key>.json; least-recently-used entries are evicted past max_bytes.
+    """
+
+    def __init__(self, cache_dir="models/llm_cache", max_bytes=None):
+        self.base = Path(cache_dir)
+        self.base.mkdir(parents=True, exist_ok=True)
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def make_key(model_name: str, prompt: str, params: dict) -> str:
+        payload = json.dumps({"model": model_name, "prompt": prompt, "params": params}, sort_keys=True, default=str)
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def path(self, key: str) -> Path:
+        return self.base / key[:2] / f"{key}.json"
+
+    def get(self, key: str):
+        p = self.path(key)
+        try:
+            text = json.loads(p.read_text(encoding="utf-8"))["text"]
+        except (OSError, ValueError, KeyError):
+            return None
+        now = time.time()
+        try:
+            os.utime(p, (now, now))
+        except OSError:
+            pass
+        return text
+
+    def put(self, key: str, text: str):
+        p = self.path(key)
+        p.parent.mkdir(parents=True, exist_ok=True)
+        tmp = p.with_name(f".{p.name}.{uuid.uuid4().hex}.tmp")
+        try:
+            tmp.write_text(json.dumps({"text": text}), encoding="utf-8")
+            os.replace(tmp, p)
+        finally:
+            if tmp.exists():
+                tmp.unlink()
+        self.evict()
+
+    def evict(self):
+        """Drop least-recently-used entries once the cache exceeds max_bytes."""
+        if not self.max_bytes:
+            return []
+        with self._lock:
+            files = []
+            for p in self.base.glob("*/*.json"):
+                try:
+                    info = p.stat()
+                except OSError:
+                    continue
+                files.append((info.st_mtime, info.st_size, p))
+            total = sum(size for _, size, _ in files)
+            removed = []
+            for _, size, p in sorted(files):
+                if total <= self.max_bytes:
+                    break
+                p.unlink(missing_ok=True)
+                total -= size
+                removed.append(str(p))
+            return removed
+
+
+class InferenceService:
+    """
+    Owns the text2text pipeline. Requests from any thread (Streamlit sessions, pipeline stages)
+    are queued; a single worker collects up to max_batch_size of them, waiting at most
+    batch_wait_ms after the first, and runs them through the model in one forward pass.
+    Identical prompts within a batch share one generation; repeats are served from the prompt cache.
+    """
+
+    def __init__(self, model_name: str = DEFAULT_MODEL, max_batch_size: int = 8, batch_wait_ms: int = 25,
+                 cache_dir: str = "models/llm_cache", max_cache_mb: int = 64, max_input_chars: int = 2000,
+                 generation: dict = None, device: int = -1):
+        self.model_name = model_name
+        self.max_batch_size = max(1, max_batch_size)
+        self.batch_wait = batch_wait_ms / 1000.0
+        self.max_input_chars = max_input_chars
+        self.generation = {**DEFAULT_GENERATION, **(generation or {})}
+        self.device = device  # -1 = CPU
+        self.cache = PromptCache(cache_dir, max_bytes=max_cache_mb * 1024 * 1024 if max_cache_mb else None) \
+            if cache_dir else None
+        self._pipe = None
+        self._load_lock = threading.Lock()
+        self._queue = queue.Queue()
+        self._worker = None
+        self._worker_lock = threading.Lock()
+        self._stats = {"requests": 0, "cache_hits": 0, "batches": 0, "generated": 0, "failed": 0}
+        self._stats_lock = threading.Lock()
+
+    # ---- model ----
+    def pipeline(self):
+        """Load the model on first use (keeps app start-up free of the transformers import)."""
+        if self._pipe is None:
+            with self._load_lock:
+                if self._pipe is None:
+                    from transformers import pipeline
+                    self._pipe = pipeline("text2text-generation", model=self.model_name, device=self.device)
+        return self._pipe
+
+    # ---- public API ----
+    def submit(self, prompt: str, **generation) -> Future:
+        """Queue a prompt; the Future resolves to the generated text."""
+        if self.max_input_chars and len(prompt) > self.max_input_chars:
+            prompt = prompt[:self.max_input_chars] + "\n\n[truncated input]"
+        params = {**self.generation, **generation}
+        if "max_length" in generation:
+            params.pop("max_new_tokens", None)
+        key = PromptCache.make_key(self.model_name, prompt, params)
+        self._count("requests")
+
+        future = Future()
+        cached = self.cache.get(key) if self.cache else None
+        if cached is not None:
+            self._count("cache_hits")
+            future.set_result(cached)
+            return future
+        self._ensure_worker()
+        self._queue.put((key, prompt, params, future))
+        return future
+
+    def generate(self, prompt: str, timeout: float = None, **generation) -> str:
+        return self.submit(prompt, **generation).result(timeout)
+
+    def generate_many(self, prompts, timeout: float = None, **generation):
+        futures = [self.submit(p, **generation) for p in prompts]
+        return [f.result(timeout) for f in futures]
+
+    def stats(self) -> dict:
+        with self._stats_lock:
+            stats = dict(self._stats)
+        return {**stats, "queued": self._queue.qsize(), "model_loaded": self._pipe is not None}
+
+    def _count(self, name: str, n: int = 1):
+        with self._stats_lock:
+            self._stats[name] += n
+
+    # ---- batching worker ----
+    def _ensure_worker(self):
+        with self._worker_lock:
+            if self._worker is None or not self._worker.is_alive():
+                self._worker = threading.Thread(target=self._run, name="insightiq-llm", daemon=True)
+                self._worker.start()
+
+    def _collect_batch(self):
+        batch = [self._queue.get()]
+        deadline = time.monotonic() + self.batch_wait
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(self._queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self):
+        while True:
+            batch = self._collect_batch()
+            # Only requests with the same generation params can share a forward pass
+            groups = {}
+            for item in batch:
+                groups.setdefault(json.dumps(item[2], sort_keys=True, default=str), []).append(item)
+            for items in groups.values():
+                try:
+                    self._run_group(items)
+                except Exception as e:
+                    # Never let one bad group kill the worker: callers would wait on their futures forever
+                    logger.exception("LLM batch worker error")
+                    for *_, future in items:
+                        if not future.done():
+                            future.set_exception(e)
+
+    def _run_group(self, items):
+        waiting = {}
+        for key, prompt, params, future in items:
+            waiting.setdefault(key, (prompt, params, []))[2].append(future)
+        keys = list(waiting)
+        params = items[0][2]
+        try:
+            outputs = self.pipeline()([waiting[k][0] for k in keys], batch_size=len(keys), **params)
+        except Exception as e:
+            logger.exception("LLM batch of %d prompts failed", len(keys))
+            for k in keys:
+                for future in waiting[k][2]:
+                    future.set_exception(e)
+            return
+        self._count("batches")
+        self._count("generated", len(keys))
+        outputs = list(outputs)
+        for i, k in enumerate(keys):
+            futures = waiting[k][2]
+            try:
+                if i >= len(outputs):
+                    raise RuntimeError(f"LLM pipeline returned {len(outputs)} outputs for {len(keys)} prompts")
+                out = outputs[i]
+                if isinstance(out, list):
+                    out = out[0]
+                text = out.get("generated_text") or out.get("summary_text") or str(out)
+            except Exception as e:
+                logger.exception("Could not read LLM output for %s", k)
+                self._count("failed")
+                for future in futures:
+                    future.set_exception(e)
+                continue
+            if self.cache:
+                try:
+                    self.cache.put(k, text)
+                except Exception:
+                    logger.warning("Could not write LLM cache entry %s", k)
+            for future in futures:
+                future.set_result(text)
+
+
+def service_settings(llm_config: dict = None) -> dict:
+    """Map the llm: section of config.yaml to get_inference_service keyword arguments."""
+    cfg = llm_config or {}
+    return {
+        "model_name": cfg.get("model_name") or os.getenv("INSIGHT_MODEL", DEFAULT_MODEL),
+        "max_batch_size": cfg.get("max_batch_size", 8),
+        "batch_wait_ms": cfg.get("batch_wait_ms", 25),
+        "cache_dir": cfg.get("cache_dir", "models/llm_cache"),
+        "max_cache_mb": cfg.get("max_cache_mb", 64),
+        "max_input_chars": cfg.get("max_input_chars", 2000),
+        "max_new_tokens": cfg.get("max_new_tokens", DEFAULT_GENERATION["max_new_tokens"]),
+        "num_beams": cfg.get("num_beams", 1),
+    }
+
+
+@cache_resource(show_spinner=False)
+def get_inference_service(model_name: str = None, max_batch_size: int = 8, batch_wait_ms: int = 25,
+                          cache_dir: str = "models/llm_cache", max_cache_mb: int = 64, max_input_chars: int = 2000,
+                          max_new_tokens: int = 150, num_beams: int = 1) -> InferenceService:
+    """
+    Process-wide service, shared by every Streamlit session and rerun.
+    """
+    return InferenceService(
+        model_name=model_name or os.getenv("INSIGHT_MODEL", DEFAULT_MODEL),
+        max_batch_size=max_batch_size,
+        batch_wait_ms=batch_wait_ms,
+        cache_dir=cache_dir,
+        max_cache_mb=max_cache_mb,
+        max_input_chars=max_input_chars,
+        generation={"max_new_tokens": max_new_tokens, "num_beams": num_beams, "do_sample": False},
+    )
@@ -1,14 +1,24 @@
 # services/logger.py
 # Lightweight logger using print or loguru if available
 
+import json
+
 try:
     from loguru import logger as loguru_logger
     loguru_logger.add("logs/insightiq.log", rotation="10 MB", retention="7 days", enqueue=True)
     def get_logger():
         return loguru_logger
+
+    def log_metrics(record: dict):
+        """Emit a structured metrics record (available as extra["metrics"] to loguru sinks)."""
+        loguru_logger.bind(metrics=record).info("metrics {}", json.dumps(record, default=str))
 except Exception:
     import logging
     logging.basicConfig(level=logging.INFO)
     def get_logger():
         return logging.getLogger("insightiq")
 
+    def log_metrics(record: dict):
+        """Emit a structured metrics record as a JSON log line."""
+        logging.getLogger("insightiq.metrics").info("metrics %s", json.dumps(record, default=str))
+
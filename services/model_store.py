@@ -0,0 +1,77 @@
+# services/model_store.py
+# Persist fitted models on disk, keyed by model kind + dataset schema + version.
+
+from pathlib import Path
+import hashlib
+import json
+import os
+import time
+import uuid
+import joblib
+
+
+class ModelStore:
+    """
+    Layout: <base_dir>/<kind>/<key>.joblib
+    The key is a hash of the feature schema, the fit parameters and a caller-supplied
+    dataset version, so a new schema or parameter set never loads a stale model.
+    """
+
+    def __init__(self, base_dir="models/fitted", max_bytes=None):
+        self.base = Path(base_dir)
+        self.base.mkdir(parents=True, exist_ok=True)
+        self.max_bytes = max_bytes
+
+    @staticmethod
+    def make_key(columns, dtypes=None, params=None, version=None) -> str:
+        payload = {
+            "columns": [str(c) for c in columns],
+            "dtypes": [str(d) for d in (dtypes if dtypes is not None else [])],
+            "params": params or {},
+            "version": version,
+        }
+        return hashlib.sha256(json.dumps(payload, sort_keys=True, default=str).encode("utf-8")).hexdigest()[:32]
+
+    def path(self, kind: str, key: str) -> Path:
+        return self.base / kind / f"{key}.joblib"
+
+    def load(self, kind: str, key: str):
+        p = self.path(kind, key)
+        if not p.exists():
+            return None
+        try:
+            obj = joblib.load(p)
+        except Exception:
+            # Corrupt or written by an incompatible library version: refit
+            return None
+        now = time.time()
+        os.utime(p, (now, now))
+        return obj
+
+    def save(self, kind: str, key: str, obj) -> str:
+        p = self.path(kind, key)
+        p.parent.mkdir(parents=True, exist_ok=True)
+        tmp = p.with_name(f".{p.name}.{uuid.uuid4().hex}.tmp")
+        try:
+            joblib.dump(obj, tmp)
+            os.replace(tmp, p)
+        finally:
+            if tmp.exists():
+                tmp.unlink()
+        self.evict()
+        return str(p)
+
+    def evict(self):
+        """Drop least-recently-used models once the store exceeds max_bytes."""
+        if not self.max_bytes:
+            return []
+        files = [(p.stat().st_mtime, p.stat().st_size, p) for p in self.base.glob("*/*.joblib")]
+        total = sum(size for _, size, _ in files)
+        removed = []
+        for _, size, p in sorted(files):
+            if total <= self.max_bytes:
+                break
+            p.unlink(missing_ok=True)
+            total -= size
+            removed.append(str(p))
+        return removed
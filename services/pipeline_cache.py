@@ -0,0 +1,209 @@
+# services/pipeline_cache.py
+# Per-stage pipeline results keyed by dataset content hash + stage parameters + upstream keys.
+# Memory LRU tier that spills evicted entries to a size-bounded disk tier.
+
+from collections import OrderedDict
+from pathlib import Path
+import hashlib
+import json
+import os
+import pickle
+import sys
+import threading
+import time
+import uuid
+from services.cache_handler import cache_resource
+from services.logger import get_logger
+
+logger = get_logger()
+
+MB = 1024 * 1024
+
+
+def stage_cache_key(stage: str, params=None, upstream_keys=(), dataset_hash: str = None) -> str:
+    """
+    Chained key: a stage's key changes when its own params, the dataset, or any upstream key changes,
+    so editing e.g. the forecast horizon only invalidates the forecast stage.
+    """
+    payload = {"stage": stage, "params": params or {}, "upstream": list(upstream_keys), "dataset": dataset_hash}
+    return hashlib.sha256(json.dumps(payload, sort_keys=True, default=str).encode("utf-8")).hexdigest()
+
+
+def estimate_bytes(value, _depth=0) -> int:
+    """
+    In-memory size estimate: DataFrames/Series including their Python string objects (deep),
+    arrays by buffer size, containers recursively.
+    """
+    if _depth > 4:
+        return sys.getsizeof(value)
+    memory_usage = getattr(value, "memory_usage", None)
+    if callable(memory_usage) and hasattr(value, "shape"):
+        try:
+            usage = memory_usage(index=True, deep=True)
+            return int(usage.sum()) if hasattr(usage, "sum") else int(usage)
+        except TypeError:
+            pass
+    nbytes = getattr(value, "nbytes", None)
+    if isinstance(nbytes, int):
+        return nbytes
+    if isinstance(value, (str, bytes, bytearray)):
+        return len(value)
+    if isinstance(value, dict):
+        return sum(estimate_bytes(k, _depth + 1) + estimate_bytes(v, _depth + 1) for k, v in value.items())
+    if isinstance(value, (list, tuple, set)):
+        return sum(estimate_bytes(v, _depth + 1) for v in value)
+    if hasattr(value, "__dict__"):
+        return sys.getsizeof(value) + estimate_bytes(vars(value), _depth + 1)
+    return sys.getsizeof(value)
+
+
+class PipelineCache:
+    """
+    get/put by key. Memory tier: LRU bounded by max_memory_bytes (estimated sizes).
+    Entries pushed out of memory are pickled to <cache_dir>/<key[:2]>/<key>.pkl (disk tier,
+    LRU by mtime, bounded by max_disk_bytes) and promoted back to memory on the next hit.
+    Values that cannot be pickled simply stay memory-only.
+    """
+
+    def __init__(self, max_memory_bytes=512 * MB, cache_dir="data/pipeline_cache", max_disk_bytes=2048 * MB):
+        self.max_memory_bytes = max_memory_bytes
+        self.max_disk_bytes = max_disk_bytes
+        self.base = Path(cache_dir) if cache_dir else None
+        if self.base is not None:
+            self.base.mkdir(parents=True, exist_ok=True)
+        self._memory = OrderedDict()  # key -> (value, size)
+        self._memory_bytes = 0
+        self._lock = threading.RLock()
+        self._stats = {"memory_hits": 0, "disk_hits": 0, "misses": 0, "spilled": 0}
+
+    # ---- public API ----
+    def get(self, key: str):
+        """Returns (hit, value)."""
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is not None:
+                self._memory.move_to_end(key)
+                self._stats["memory_hits"] += 1
+                return True, entry[0]
+        value = self._disk_get(key)
+        with self._lock:
+            self._stats["disk_hits" if value is not None else "misses"] += 1
+        if value is not None:
+            self._memory_put(key, value[0], spill=False)
+            return True, value[0]
+        return False, None
+
+    def put(self, key: str, value):
+        self._memory_put(key, value, spill=True)
+
+    def invalidate(self, key: str):
+        with self._lock:
+            entry = self._memory.pop(key, None)
+            if entry is not None:
+                self._memory_bytes -= entry[1]
+        if self.base is not None:
+            self._disk_path(key).unlink(missing_ok=True)
+
+    def clear(self):
+        with self._lock:
+            self._memory.clear()
+            self._memory_bytes = 0
+        if self.base is not None:
+            for p in self.base.glob("*/*.pkl"):
+                p.unlink(missing_ok=True)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {**self._stats, "memory_entries": len(self._memory),
+                    "memory_mb": round(self._memory_bytes / MB, 2)}
+
+    # ---- memory tier ----
+    def _memory_put(self, key, value, spill):
+        size = estimate_bytes(value)
+        spilled = []
+        with self._lock:
+            old = self._memory.pop(key, None)
+            if old is not None:
+                self._memory_bytes -= old[1]
+            if self.max_memory_bytes and size > self.max_memory_bytes:
+                spilled.append((key, value))  # too big for memory: disk only
+            else:
+                self._memory[key] = (value, size)
+                self._memory_bytes += size
+            while self.max_memory_bytes and self._memory_bytes > self.max_memory_bytes and self._memory:
+                old_key, (old_value, old_size) = self._memory.popitem(last=False)
+                self._memory_bytes -= old_size
+                spilled.append((old_key, old_value))
+        # Pickle outside the lock; entries promoted from disk are already there
+        for spill_key, spill_value in spilled:
+            if spill or spill_key != key:
+                self._disk_put(spill_key, spill_value)
+
+    # ---- disk tier ----
+    def _disk_path(self, key: str) -> Path:
+        return self.base / key[:2] / f"{key}.pkl"
+
+    def _disk_get(self, key):
+        if self.base is None:
+            return None
+        p = self._disk_path(key)
+        try:
+            with open(p, "rb") as fh:
+                value = pickle.load(fh)
+        except FileNotFoundError:
+            return None
+        except Exception:
+            # Corrupt or written by an incompatible library version: recompute
+            p.unlink(missing_ok=True)
+            return None
+        now = time.time()
+        try:
+            os.utime(p, (now, now))
+        except OSError:
+            pass
+        return (value,)
+
+    def _disk_put(self, key, value):
+        if self.base is None:
+            return
+        p = self._disk_path(key)
+        if p.exists():
+            return
+        p.parent.mkdir(parents=True, exist_ok=True)
+        tmp = p.with_name(f".{p.name}.{uuid.uuid4().hex}.tmp")
+        try:
+            with open(tmp, "wb") as fh:
+                pickle.dump(value, fh, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(tmp, p)
+            with self._lock:
+                self._stats["spilled"] += 1
+        except Exception as e:
+            logger.warning(f"Pipeline cache: could not spill {key[:12]} to disk: {e}")
+        finally:
+            if tmp.exists():
+                tmp.unlink()
+        self._disk_evict()
+
+    def _disk_evict(self):
+        if not self.max_disk_bytes:
+            return
+        files = []
+        for p in self.base.glob("*/*.pkl"):
+            try:
+                info = p.stat()
+            except OSError:
+                continue
+            files.append((info.st_mtime, info.st_size, p))
+        total = sum(size for _, size, _ in files)
+        for _, size, p in sorted(files):
+            if total <= self.max_disk_bytes:
+                break
+            p.unlink(missing_ok=True)
+            total -= size
+
+
+@cache_resource(show_spinner=False)
+def get_pipeline_cache(max_memory_mb: int = 512, cache_dir: str = "data/pipeline_cache",
+                       max_disk_mb: int = 2048) -> PipelineCache:
+    """Process-wide cache shared by every session, rerun and background job."""
+    return PipelineCache(max_memory_bytes=max_memory_mb * MB, cache_dir=cache_dir, max_disk_bytes=max_disk_mb * MB)
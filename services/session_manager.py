@@ -1,11 +1,257 @@
 # services/session_manager.py
-# Simple Streamlit session helpers
+# Simple Streamlit session helpers, plus a process-wide store for the DataFrames sessions hold:
+# one shared copy per content hash, memory budgets per session and overall, spill to disk.
+
+from collections import OrderedDict
+import threading
+import time
+import uuid
+from services.cache_handler import cache_resource
+from services.logger import get_logger
+from services.storage_manager import StorageManager
+
+logger = get_logger()
+
+MB = 1024 * 1024
 
-import streamlit as st
 
 def get_session_state(defaults: dict = None):
+    import streamlit as st
     defaults = defaults or {}
     for k, v in defaults.items():
         if k not in st.session_state:
             st.session_state[k] = v
     return st.session_state
+
+
+def current_session_id() -> str:
+    """Stable id for the current Streamlit session (kept in its session_state)."""
+    state = get_session_state()
+    if "_insightiq_session_id" not in state:
+        state["_insightiq_session_id"] = uuid.uuid4().hex
+    return state["_insightiq_session_id"]
+
+
+class _Frame:
+    def __init__(self, content_hash, df, nbytes, meta):
+        self.content_hash = content_hash
+        self.df = df              # None while spilled
+        self.nbytes = nbytes
+        self.meta = meta or {}
+        self.sessions = set()
+        self.spillable = True
+
+    @property
+    def resident(self) -> bool:
+        return self.df is not None
+
+
+class SessionDataManager:
+    """
+    DataFrames referenced by sessions as session -> {key: content hash}.
+      - a frame is stored once per content hash, however many sessions use it (reference counted,
+        dropped when the last session releases it)
+      - sessions get a shallow copy: adding/dropping columns stays private to the session, but the
+        values are shared and must not be modified in place
+      - resident bytes are bounded per session (max_session_bytes, counting every frame it references)
+        and overall (max_total_bytes); least recently used frames are spilled to the StorageManager's
+        frames/<hash>.feather and read back (memory-mapped) on next access
+      - sessions idle longer than idle_timeout seconds are released (Streamlit does not signal closes)
+      - spilled frames are read back with dtype_backend (use the ingestion setting frames were loaded with)
+    """
+
+    def __init__(self, storage: StorageManager, max_total_bytes=4096 * MB, max_session_bytes=1024 * MB,
+                 idle_timeout=3600, dtype_backend="compact"):
+        self.storage = storage
+        self.dtype_backend = dtype_backend
+        self.max_total_bytes = max_total_bytes
+        self.max_session_bytes = max_session_bytes
+        self.idle_timeout = idle_timeout
+        self._frames = OrderedDict()   # content hash -> _Frame, least recently used first
+        self._sessions = {}            # session id -> {key: content hash}
+        self._last_seen = {}
+        self._lock = threading.RLock()
+        self._stats = {"shared_hits": 0, "spilled": 0, "reloaded": 0, "lost": 0}
+
+    # ---- public API ----
+    def put(self, session_id: str, key: str, df, content_hash: str = None, meta: dict = None):
+        """
+        Register df as the session's `key` and return the shared frame to use from now on
+        (an identical frame already held by another session is reused and df is discarded).
+        """
+        if content_hash is None:
+            from core.column_stats import frame_fingerprint
+            content_hash = frame_fingerprint(df)
+        with self._lock:
+            self._touch_session(session_id)
+            frame = self._frames.get(content_hash)
+            if frame is None:
+                nbytes = int(df.memory_usage(index=True, deep=True).sum())
+                frame = self._frames[content_hash] = _Frame(content_hash, df, nbytes, meta)
+            else:
+                self._stats["shared_hits"] += 1
+            self._bind(session_id, key, frame)
+            return self._checkout(frame, session_id)
+
+    def attach(self, session_id: str, key: str, content_hash: str):
+        """Bind `key` to a frame another session already registered; None if the hash is unknown."""
+        with self._lock:
+            self._touch_session(session_id)
+            frame = self._frames.get(content_hash)
+            if frame is None:
+                return None
+            self._stats["shared_hits"] += 1
+            self._bind(session_id, key, frame)
+            return self._checkout(frame, session_id)
+
+    def get(self, session_id: str, key: str):
+        """The session's frame for `key`, or None if never stored (or its spill file was evicted)."""
+        with self._lock:
+            self._touch_session(session_id)
+            content_hash = self._sessions.get(session_id, {}).get(key)
+            frame = self._frames.get(content_hash) if content_hash else None
+            if frame is None:
+                return None
+            return self._checkout(frame, session_id)
+
+    def metadata(self, content_hash: str) -> dict:
+        with self._lock:
+            frame = self._frames.get(content_hash)
+            return dict(frame.meta) if frame is not None else {}
+
+    def release(self, session_id: str, key: str = None):
+        """Forget one key (or the whole session); frames no other session uses are dropped."""
+        with self._lock:
+            keys = self._sessions.get(session_id, {})
+            for k in ([key] if key is not None else list(keys)):
+                content_hash = keys.pop(k, None)
+                if content_hash is not None and content_hash not in keys.values():
+                    self._unref(session_id, content_hash)
+            if key is None or not keys:
+                self._sessions.pop(session_id, None)
+                self._last_seen.pop(session_id, None)
+
+    def expire_idle(self):
+        if not self.idle_timeout:
+            return
+        cutoff = time.monotonic() - self.idle_timeout
+        with self._lock:
+            for session_id in [s for s, seen in self._last_seen.items() if seen < cutoff]:
+                self.release(session_id)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                **self._stats,
+                "sessions": len(self._sessions),
+                "frames": len(self._frames),
+                "resident_frames": sum(1 for f in self._frames.values() if f.resident),
+                "resident_mb": round(self._resident_bytes() / MB, 2),
+                "logical_mb": round(sum(self._session_bytes(s, resident_only=False)
+                                        for s in self._sessions) / MB, 2),
+            }
+
+    def session_stats(self, session_id: str) -> dict:
+        with self._lock:
+            return {"keys": dict(self._sessions.get(session_id, {})),
+                    "resident_mb": round(self._session_bytes(session_id) / MB, 2),
+                    "budget_mb": round(self.max_session_bytes / MB, 2) if self.max_session_bytes else None}
+
+    # ---- internals (called with the lock held) ----
+    def _touch_session(self, session_id):
+        self._last_seen[session_id] = time.monotonic()
+        self.expire_idle()
+
+    def _bind(self, session_id, key, frame):
+        keys = self._sessions.setdefault(session_id, {})
+        old = keys.get(key)
+        keys[key] = frame.content_hash
+        frame.sessions.add(session_id)
+        if old is not None and old != frame.content_hash and old not in keys.values():
+            self._unref(session_id, old)
+
+    def _unref(self, session_id, content_hash):
+        frame = self._frames.get(content_hash)
+        if frame is None:
+            return
+        frame.sessions.discard(session_id)
+        if not frame.sessions:
+            # The feather copy (if any) stays in the StorageManager, which evicts it by LRU
+            del self._frames[content_hash]
+
+    def _checkout(self, frame, session_id):
+        if not frame.resident and not self._reload(frame):
+            return None
+        self._frames.move_to_end(frame.content_hash)
+        df = frame.df
+        self._enforce(session_id, keep=frame.content_hash)
+        return df.copy(deep=False)
+
+    def _reload(self, frame) -> bool:
+        df = self.storage.get_frame(frame.content_hash, dtype_backend=self.dtype_backend)
+        if df is None:
+            logger.warning(f"Session data: spilled frame {frame.content_hash[:12]} was evicted from disk")
+            self._stats["lost"] += 1
+            for session_id in list(frame.sessions):
+                keys = self._sessions.get(session_id, {})
+                for k in [k for k, h in keys.items() if h == frame.content_hash]:
+                    keys.pop(k)
+            del self._frames[frame.content_hash]
+            return False
+        frame.df = df
+        # The Arrow round trip can change dtypes (and so the size) of what was spilled
+        frame.nbytes = int(df.memory_usage(index=True, deep=True).sum())
+        self._stats["reloaded"] += 1
+        return True
+
+    def _spill(self, frame) -> bool:
+        if not frame.spillable:
+            return False
+        try:
+            self.storage.put_frame(frame.content_hash, frame.df)
+        except Exception as e:
+            # e.g. mixed-type object columns pyarrow cannot write: keep it in memory
+            logger.warning(f"Session data: cannot spill {frame.content_hash[:12]}: {e}")
+            frame.spillable = False
+            return False
+        frame.df = None
+        self._stats["spilled"] += 1
+        return True
+
+    def _resident_bytes(self) -> int:
+        return sum(f.nbytes for f in self._frames.values() if f.resident)
+
+    def _session_bytes(self, session_id, resident_only=True) -> int:
+        hashes = set(self._sessions.get(session_id, {}).values())
+        return sum(f.nbytes for h, f in self._frames.items()
+                   if h in hashes and (f.resident or not resident_only))
+
+    def _enforce(self, session_id, keep):
+        """Spill LRU frames (never `keep`, the one being handed out) until both budgets hold."""
+        if self.max_session_bytes:
+            mine = set(self._sessions.get(session_id, {}).values())
+            for frame in list(self._frames.values()):
+                if self._session_bytes(session_id) <= self.max_session_bytes:
+                    break
+                if frame.content_hash in mine and frame.content_hash != keep and frame.resident:
+                    self._spill(frame)
+        if self.max_total_bytes:
+            for frame in list(self._frames.values()):
+                if self._resident_bytes() <= self.max_total_bytes:
+                    break
+                if frame.content_hash != keep and frame.resident:
+                    self._spill(frame)
+
+
+@cache_resource(show_spinner=False)
+def get_session_data_manager(data_dir: str = "data", max_total_mb: int = 4096, max_session_mb: int = 1024,
+                             idle_timeout_minutes: int = 60, max_disk_mb: int = None,
+                             dtype_backend: str = "compact") -> SessionDataManager:
+    """
+    Process-wide manager shared by every Streamlit session. Pass the same data_dir/max_disk_mb as
+    the app's StorageManager: spilled frames live in (and are evicted with) its columnar cache.
+    """
+    storage = StorageManager(data_dir, max_bytes=max_disk_mb * MB if max_disk_mb else None)
+    return SessionDataManager(storage, max_total_bytes=max_total_mb * MB,
+                              max_session_bytes=max_session_mb * MB, idle_timeout=idle_timeout_minutes * 60,
+                              dtype_backend=dtype_backend)
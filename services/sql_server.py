@@ -1,8 +1,15 @@
+import hashlib
+import threading
+import time
+from contextlib import contextmanager
 import pyodbc
 import pandas as pd
+from services.cache_handler import cache_resource
+
+DEFAULT_DRIVER = "{ODBC Driver 17 for SQL Server}"
 
 def connect_sql_server(server, database, username, password,
-                       driver="{ODBC Driver 17 for SQL Server}"):
+                       driver=DEFAULT_DRIVER):
     """
     Establish connection to Microsoft SQL Server
     """
@@ -15,15 +22,450 @@ def connect_sql_server(server, database, username, password,
     )
     return pyodbc.connect(conn_str)
 
-def fetch_table(conn, table_name):
+class ConnectionPool:
+    """
+    Thread-safe pool of pyodbc connections keyed by server/database/user.
+      - at most max_size open connections (idle + in use) per key
+      - idle connections are health-checked with SELECT 1 before reuse
+      - connections idle longer than idle_timeout seconds are closed
+    """
+
+    def __init__(self, max_size=5, idle_timeout=300, health_check_interval=30, acquire_timeout=30):
+        self.max_size = max_size
+        self.idle_timeout = idle_timeout
+        self.health_check_interval = health_check_interval
+        self.acquire_timeout = acquire_timeout
+        self._cond = threading.Condition()
+        self._idle = {}      # key -> [(conn, last_used, last_checked)]
+        self._in_use = {}    # key -> number of checked-out connections
+
+    @staticmethod
+    def make_key(server, database, username, password, driver=DEFAULT_DRIVER):
+        # Password is part of the key (hashed) so changed credentials never reuse a session
+        pwd_hash = hashlib.sha256((password or "").encode("utf-8")).hexdigest()[:16]
+        return (server, database, username, driver, pwd_hash)
+
+    def _is_healthy(self, conn):
+        try:
+            cursor = conn.cursor()
+            cursor.execute("SELECT 1")
+            cursor.fetchone()
+            cursor.close()
+            return True
+        except Exception:
+            return False
+
+    @staticmethod
+    def _close(conn):
+        try:
+            conn.close()
+        except Exception:
+            pass
+
+    def _evict_idle_locked(self, now):
+        """Drop expired idle entries; returns their connections for the caller to close unlocked."""
+        expired = []
+        for key, entries in self._idle.items():
+            keep = []
+            for conn, last_used, last_checked in entries:
+                if now - last_used > self.idle_timeout:
+                    expired.append(conn)
+                else:
+                    keep.append((conn, last_used, last_checked))
+            self._idle[key] = keep
+        return expired
+
+    def _open_count(self, key):
+        return len(self._idle.get(key, [])) + self._in_use.get(key, 0)
+
+    def acquire(self, server, database, username, password, driver=DEFAULT_DRIVER):
+        """
+        Return (key, connection). Reuses a healthy idle connection when possible,
+        opens a new one while under max_size, otherwise waits for a release.
+        Only bookkeeping happens under the pool lock: a slot is reserved there, and health checks,
+        closes and connects (network round-trips) run after it is released.
+        """
+        key = self.make_key(server, database, username, password, driver)
+        deadline = time.monotonic() + self.acquire_timeout
+        while True:
+            candidate, reserved = None, False
+            with self._cond:
+                now = time.monotonic()
+                expired = self._evict_idle_locked(now)
+                idle = self._idle.setdefault(key, [])
+                if idle:
+                    candidate = idle.pop()
+                    reserved = True
+                elif self._open_count(key) < self.max_size:
+                    reserved = True
+                if reserved:
+                    self._in_use[key] = self._in_use.get(key, 0) + 1
+                elif not expired:
+                    remaining = deadline - now
+                    if remaining <= 0:
+                        raise TimeoutError(f"No SQL Server connection available for {server}/{database} "
+                                           f"after {self.acquire_timeout}s (max_size={self.max_size})")
+                    self._cond.wait(remaining)
+            for conn in expired:
+                self._close(conn)
+            if reserved:
+                break
+
+        if candidate is not None:
+            conn, _, last_checked = candidate
+            if time.monotonic() - last_checked < self.health_check_interval or self._is_healthy(conn):
+                return key, conn
+            self._close(conn)  # dead: its reserved slot goes to the replacement opened below
+
+        try:
+            conn = connect_sql_server(server, database, username, password, driver=driver)
+        except Exception:
+            with self._cond:
+                self._in_use[key] -= 1
+                self._cond.notify()
+            raise
+        return key, conn
+
+    def release(self, key, conn, broken=False):
+        """
+        Return a connection to the pool. Open transactions are rolled back;
+        broken connections are closed instead of reused.
+        """
+        if not broken:
+            try:
+                conn.rollback()
+            except Exception:
+                broken = True
+        if broken:
+            self._close(conn)
+        with self._cond:
+            self._in_use[key] = max(self._in_use.get(key, 1) - 1, 0)
+            if not broken:
+                now = time.monotonic()
+                self._idle.setdefault(key, []).append((conn, now, now))
+            self._cond.notify()
+
+    @contextmanager
+    def connection(self, server, database, username, password, driver=DEFAULT_DRIVER):
+        key, conn = self.acquire(server, database, username, password, driver)
+        broken = False
+        try:
+            yield conn
+        except pyodbc.Error:
+            broken = True
+            raise
+        finally:
+            self.release(key, conn, broken=broken)
+
+    def evict_idle(self):
+        with self._cond:
+            expired = self._evict_idle_locked(time.monotonic())
+        for conn in expired:
+            self._close(conn)
+
+    def close_all(self):
+        with self._cond:
+            conns = [conn for entries in self._idle.values() for conn, _, _ in entries]
+            self._idle.clear()
+        for conn in conns:
+            self._close(conn)
+
+    def stats(self):
+        with self._cond:
+            return {
+                "idle": sum(len(v) for v in self._idle.values()),
+                "in_use": sum(self._in_use.values()),
+                "keys": len(set(self._idle) | set(self._in_use)),
+            }
+
+@cache_resource(show_spinner=False)
+def get_connection_pool(max_size=5, idle_timeout=300, health_check_interval=30):
+    """
+    Process-wide connection pool shared across Streamlit sessions and reruns.
+    """
+    return ConnectionPool(max_size=max_size, idle_timeout=idle_timeout,
+                          health_check_interval=health_check_interval)
+
+def pooled_connection(server, database, username, password, driver=DEFAULT_DRIVER):
     """
-    Fetch full table from SQL Server
+    Context manager yielding a pooled connection:
+        with pooled_connection(server, db, user, pwd) as conn: ...
     """
-    query = f"SELECT * FROM {table_name}"
-    return pd.read_sql(query, conn)
+    return get_connection_pool().connection(server, database, username, password, driver=driver)
+
+DEFAULT_CHUNKSIZE = 50_000
+
+def iter_query(conn, sql_query, chunksize=DEFAULT_CHUNKSIZE, max_rows=None,
+               progress_callback=None, memory_budget_mb=None):
+    """
+    Stream a query result as DataFrame chunks instead of one big frame.
+    Rows are pulled with cursor.fetchmany into buffers of cursor.arraysize rows,
+    so only the current chunk is held in memory.
+      - max_rows: stop after this many rows
+      - progress_callback(rows_fetched): called after every chunk
+      - memory_budget_mb: shrink the chunk size so a single chunk stays under this budget
+    """
+    cursor = conn.cursor()
+    cursor.arraysize = chunksize
+    try:
+        cursor.execute(sql_query)
+        columns = [col[0] for col in cursor.description]
+        fetched = 0
+        while max_rows is None or fetched < max_rows:
+            size = chunksize if max_rows is None else min(chunksize, max_rows - fetched)
+            rows = cursor.fetchmany(size)
+            if not rows:
+                break
+            chunk = pd.DataFrame.from_records([tuple(r) for r in rows], columns=columns)
+            fetched += len(chunk)
+
+            if memory_budget_mb:
+                row_bytes = max(chunk.memory_usage(deep=True).sum() / len(chunk), 1)
+                chunksize = max(1, min(chunksize, int(memory_budget_mb * 1024 * 1024 / row_bytes)))
+                cursor.arraysize = chunksize
+
+            if progress_callback:
+                progress_callback(fetched)
+            yield chunk
+    finally:
+        cursor.close()
+
+def iter_table(conn, table_name, chunksize=DEFAULT_CHUNKSIZE, max_rows=None,
+               progress_callback=None, memory_budget_mb=None):
+    """
+    Stream a SQL Server table in chunks. A row limit is pushed to the server as TOP (n).
+    """
+    top = f"TOP ({int(max_rows)}) " if max_rows else ""
+    query = f"SELECT {top}* FROM {table_name}"
+    return iter_query(conn, query, chunksize=chunksize, max_rows=max_rows,
+                      progress_callback=progress_callback, memory_budget_mb=memory_budget_mb)
+
+def _concat_chunks(chunks):
+    frames = list(chunks)
+    if not frames:
+        return pd.DataFrame()
+    return pd.concat(frames, ignore_index=True)
+
+def fetch_table(conn, table_name, chunksize=None, max_rows=None, progress_callback=None):
+    """
+    Fetch full table from SQL Server.
+    With chunksize or max_rows set, rows are streamed in batches and concatenated.
+    """
+    if chunksize is None and max_rows is None:
+        query = f"SELECT * FROM {table_name}"
+        return pd.read_sql(query, conn)
+    return _concat_chunks(iter_table(conn, table_name, chunksize=chunksize or DEFAULT_CHUNKSIZE,
+                                     max_rows=max_rows, progress_callback=progress_callback))
+
+def fetch_query(conn, sql_query, chunksize=None, max_rows=None, progress_callback=None):
+    """
+    Execute custom SQL query.
+    With chunksize or max_rows set, rows are streamed in batches and concatenated.
+    """
+    if chunksize is None and max_rows is None:
+        return pd.read_sql(sql_query, conn)
+    return _concat_chunks(iter_query(conn, sql_query, chunksize=chunksize or DEFAULT_CHUNKSIZE,
+                                     max_rows=max_rows, progress_callback=progress_callback))
+
+# -------------------------------
+# Pushdown: KPIs computed by SQL Server, only a sample crosses the wire
+# -------------------------------
+NUMERIC_SQL_TYPES = {"tinyint", "smallint", "int", "bigint", "decimal", "numeric",
+                     "float", "real", "money", "smallmoney"}
+TEXT_SQL_TYPES = {"char", "varchar", "nchar", "nvarchar", "text", "ntext", "sysname"}
+# Types that cannot be compared / counted distinct
+UNCOMPARABLE_SQL_TYPES = {"text", "ntext", "image", "xml", "geography", "geometry", "hierarchyid", "sql_variant"}
+MEDIAN_COLUMNS = 5
+
+def quote_identifier(name):
+    """[name] with ] escaped, for identifiers built into generated SQL."""
+    return "[" + str(name).replace("]", "]]") + "]"
+
+def _split_table_name(table_name):
+    """'db.schema.table' / '[schema].[table]' / 'table' -> list of unquoted parts."""
+    parts, current, in_brackets, i = [], "", False, 0
+    while i < len(table_name):
+        ch = table_name[i]
+        if in_brackets:
+            if ch == "]" and table_name[i + 1:i + 2] == "]":
+                current += "]"
+                i += 1
+            elif ch == "]":
+                in_brackets = False
+            else:
+                current += ch
+        elif ch == "[":
+            in_brackets = True
+        elif ch == ".":
+            parts.append(current)
+            current = ""
+        else:
+            current += ch
+        i += 1
+    parts.append(current)
+    return [p.strip() for p in parts]
+
+def quote_table(table_name):
+    return ".".join(quote_identifier(p) for p in _split_table_name(table_name))
+
+def table_columns(conn, table_name):
+    """
+    [(column, data_type)] in column order. OBJECT_ID resolves the name exactly like the
+    generated queries will (default schema, views, three-part names).
+    """
+    parts = _split_table_name(table_name)
+    catalog = f"{quote_identifier(parts[-3])}." if len(parts) >= 3 else ""
+    # Join on user_type_id so CLR types (geography, geometry, hierarchyid share system_type_id 240)
+    # keep their own name; user-defined alias types report their base system type instead
+    sql = (f"SELECT c.name, CASE WHEN t.is_user_defined = 1 AND t.is_assembly_type = 0 "
+           f"THEN TYPE_NAME(c.system_type_id) ELSE t.name END FROM {catalog}sys.columns AS c "
+           f"JOIN {catalog}sys.types AS t ON t.user_type_id = c.user_type_id "
+           "WHERE c.object_id = OBJECT_ID(?) ORDER BY c.column_id")
+    cursor = conn.cursor()
+    try:
+        cursor.execute(sql, quote_table(table_name))
+        columns = [(row[0], row[1].lower()) for row in cursor.fetchall()]
+    finally:
+        cursor.close()
+    if not columns:
+        raise ValueError(f"Table {table_name!r} not found or has no visible columns")
+    return columns
+
+def _fetch_one(conn, sql):
+    cursor = conn.cursor()
+    try:
+        cursor.execute(sql)
+        return cursor.fetchone()
+    finally:
+        cursor.close()
+
+APPROX_DISTINCT = "APPROX_COUNT_DISTINCT({col})"
+EXACT_DISTINCT = "COUNT_BIG(DISTINCT {col})"
+
+def _aggregate_query(source, columns, distinct_template):
+    exprs = ["COUNT_BIG(*)"]
+    for name, dtype in columns:
+        col = quote_identifier(name)
+        exprs.append(f"SUM(CASE WHEN {col} IS NULL THEN 1 ELSE 0 END)")
+        if dtype in NUMERIC_SQL_TYPES:
+            exprs += [f"AVG(CAST({col} AS FLOAT))", f"MIN({col})", f"MAX({col})"]
+        if dtype not in UNCOMPARABLE_SQL_TYPES:
+            exprs.append(distinct_template.format(col=col))
+    return f"SELECT {', '.join(exprs)} FROM {source}"
+
+def _medians(conn, source, numeric_cols):
+    if not numeric_cols:
+        return {}
+    # PERCENTILE_CONT is a window function: every row carries the result, TOP (1) keeps one
+    exprs = ", ".join(f"PERCENTILE_CONT(0.5) WITHIN GROUP (ORDER BY {quote_identifier(c)}) OVER ()"
+                      for c in numeric_cols)
+    row = _fetch_one(conn, f"SELECT TOP (1) {exprs} FROM {source}")
+    if row is None:
+        return {c: float("nan") for c in numeric_cols}
+    return {c: float(v) if v is not None else float("nan") for c, v in zip(numeric_cols, row)}
+
+def _duplicate_rows(conn, source, columns):
+    comparable = [quote_identifier(n) for n, t in columns if t not in UNCOMPARABLE_SQL_TYPES]
+    if len(comparable) < len(columns):
+        return None  # rows differing only in text/xml columns cannot be told apart server-side
+    row = _fetch_one(conn, f"SELECT COUNT_BIG(*) - (SELECT COUNT_BIG(*) FROM "
+                           f"(SELECT DISTINCT {', '.join(comparable)} FROM {source}) AS d) FROM {source}")
+    return int(row[0])
+
+def pushdown_kpis(conn, table_name, approx_distinct=True, count_duplicates=False, exact_medians=False):
+    """
+    KPIs for a SQL Server table computed server-side, in the shape of compute_basic_kpis
+    (plus min/max, distinct counts and estimate flags, like KPIAccumulator.to_kpis).
+      - one scan: COUNT_BIG, per-column null counts, AVG/MIN/MAX, APPROX_COUNT_DISTINCT
+        (SQL Server 2019+; older servers fall back to exact COUNT(DISTINCT))
+      - medians are left as NaN for fill_sample_medians() to estimate from the fetched sample;
+        exact_medians=True uses PERCENTILE_CONT(0.5) instead, which sorts every median column of
+        the full table (minutes, not seconds, on 100M rows)
+      - duplicate_rows needs a DISTINCT over every column, so it is only counted on request
+    """
+    source = quote_table(table_name)
+    columns = table_columns(conn, table_name)
+    approx = approx_distinct
+    row = None
+    if approx:
+        try:
+            row = _fetch_one(conn, _aggregate_query(source, columns, APPROX_DISTINCT))
+        except pyodbc.Error:
+            approx = False
+    if row is None:
+        row = _fetch_one(conn, _aggregate_query(source, columns, EXACT_DISTINCT))
+
+    values = iter(row)
+    row_count = int(next(values))
+    null_counts, means, minmax, distinct = {}, {}, {}, {}
+    for name, dtype in columns:
+        null_counts[name] = int(next(values) or 0)
+        if dtype in NUMERIC_SQL_TYPES:
+            mean, lo, hi = next(values), next(values), next(values)
+            means[name] = float(mean) if mean is not None else float("nan")
+            minmax[name] = (float(lo) if lo is not None else float("nan"),
+                            float(hi) if hi is not None else float("nan"))
+        if dtype not in UNCOMPARABLE_SQL_TYPES:
+            distinct[str(name)] = int(next(values) or 0)
+
+    numeric_cols = [n for n, t in columns if t in NUMERIC_SQL_TYPES]
+    if exact_medians:
+        medians = _medians(conn, source, numeric_cols[:MEDIAN_COLUMNS])
+    else:
+        medians = {c: float("nan") for c in numeric_cols[:MEDIAN_COLUMNS]}
+    cells = row_count * len(columns)
+    return {
+        "row_count": row_count,
+        "column_count": len(columns),
+        "missing_pct_overall": float(round(sum(null_counts.values()) / cells * 100, 4)) if cells else float("nan"),
+        "duplicate_rows": _duplicate_rows(conn, source, columns) if count_duplicates else None,
+        "numeric_columns": len(numeric_cols),
+        "categorical_columns": sum(1 for _, t in columns if t in TEXT_SQL_TYPES),
+        "numeric_sample_stats": {
+            c: {"mean": means[c], "median": medians[c], "min": minmax[c][0], "max": minmax[c][1]}
+            for c in numeric_cols[:MEDIAN_COLUMNS]
+        },
+        "distinct_counts_approx": distinct,
+        "estimated": {"median": not exact_medians, "distinct_counts": approx, "duplicate_rows": not count_duplicates},
+        "source": "sql_pushdown",
+    }
+
+def fill_sample_medians(kpis, sample):
+    """Fill medians pushdown_kpis left open (exact_medians=False) from the fetched sample DataFrame."""
+    for col, stats in kpis.get("numeric_sample_stats", {}).items():
+        if stats.get("median") != stats.get("median") and col in sample.columns:  # NaN
+            values = pd.to_numeric(sample[col], errors="coerce")
+            stats["median"] = float(values.median()) if values.notna().any() else float("nan")
+    return kpis
 
-def fetch_query(conn, sql_query):
+def fetch_sample(conn, table_name, n_rows=100_000, row_count=None, seed=42, chunksize=DEFAULT_CHUNKSIZE,
+                 progress_callback=None):
     """
-    Execute custom SQL query
+    About n_rows random rows for charts and modelling, without a full transfer.
+    TABLESAMPLE picks whole pages (cheap, slightly clustered) at 2x the needed rate so page-level
+    variance rarely leaves fewer than n_rows; the oversampled set (~2n rows, not the table) is then
+    shuffled with ORDER BY CHECKSUM(NEWID()) before TOP, so the cap does not keep only the pages
+    that come first in scan order. Views and other sources without TABLESAMPLE use a per-row
+    CHECKSUM(NEWID()) filter instead. seed fixes the sampled pages, not the final shuffle.
+    row_count (e.g. from pushdown_kpis) avoids a COUNT_BIG(*) round trip.
     """
-    return pd.read_sql(sql_query, conn)
+    source = quote_table(table_name)
+    if row_count is None:
+        row_count = int(_fetch_one(conn, f"SELECT COUNT_BIG(*) FROM {source}")[0])
+    n_rows = int(n_rows)
+    if row_count <= n_rows:
+        query = f"SELECT * FROM {source}"
+        return _concat_chunks(iter_query(conn, query, chunksize=chunksize, progress_callback=progress_callback))
+    percent = min(100.0, n_rows * 2 / row_count * 100)
+    query = (f"SELECT TOP ({n_rows}) * FROM {source} TABLESAMPLE ({percent:.6f} PERCENT) "
+             f"REPEATABLE ({int(seed)}) ORDER BY CHECKSUM(NEWID())")
+    try:
+        return _concat_chunks(iter_query(conn, query, chunksize=chunksize, max_rows=n_rows,
+                                         progress_callback=progress_callback))
+    except pyodbc.Error:
+        pass
+    per_million = max(1, int(round(percent * 10_000)))
+    query = (f"SELECT TOP ({n_rows}) * FROM {source} "
+             f"WHERE ABS(CHECKSUM(NEWID())) % 1000000 < {per_million} ORDER BY CHECKSUM(NEWID())")
+    return _concat_chunks(iter_query(conn, query, chunksize=chunksize, max_rows=n_rows,
+                                     progress_callback=progress_callback))
@@ -1,27 +1,193 @@
 # services/storage_manager.py
-# Simple local storage handler with optional future S3/GCS hooks.
+# Content-addressed local storage: raw uploads and parsed columnar frames keyed by content hash.
 
 from pathlib import Path
-import shutil
+import hashlib
+import os
+import time
+import uuid
+
+HASH_CHUNK_BYTES = 8 * 1024 * 1024
+
 
 class StorageManager:
-    def __init__(self, base_dir="data"):
+    """
+    Layout under base_dir:
+      raw/<sha256><suffix>     original upload bytes
+      frames/<sha256>.feather  parsed frame as uncompressed Arrow IPC (memory-mappable)
+    Files are touched on every hit, and the oldest are evicted once the
+    directory grows past max_bytes (LRU).
+    """
+
+    def __init__(self, base_dir="data", max_bytes=None):
         self.base = Path(base_dir)
-        self.base.mkdir(parents=True, exist_ok=True)
+        self.raw_dir = self.base / "raw"
+        self.frame_dir = self.base / "frames"
+        self.max_bytes = max_bytes
+        for d in (self.base, self.raw_dir, self.frame_dir):
+            d.mkdir(parents=True, exist_ok=True)
+
+    @staticmethod
+    def content_hash(source) -> str:
+        """
+        SHA-256 of an uploaded file (anything with getbuffer()) or of a file on disk.
+        """
+        h = hashlib.sha256()
+        if hasattr(source, "getbuffer"):
+            h.update(source.getbuffer())
+        else:
+            with open(source, "rb") as f:
+                for block in iter(lambda: f.read(HASH_CHUNK_BYTES), b""):
+                    h.update(block)
+        return h.hexdigest()
 
     def save_uploaded_file(self, uploaded_file, dest_name=None):
-        dest_name = dest_name or getattr(uploaded_file, "name", "uploaded_file")
-        dest = self.base / dest_name
-        with open(dest, "wb") as f:
-            f.write(uploaded_file.getbuffer())
+        """
+        Store the raw upload once under its content hash and return the path.
+        """
+        if dest_name is None:
+            suffix = Path(getattr(uploaded_file, "name", "")).suffix.lower()
+            dest_name = f"{self.content_hash(uploaded_file)}{suffix}"
+        dest = self.raw_dir / dest_name
+        if dest.exists():
+            self._touch(dest)
+        else:
+            self._atomic_write(dest, lambda f: f.write(uploaded_file.getbuffer()))
+            self.evict()
+        return str(dest)
+
+    def frame_path(self, digest: str) -> Path:
+        return self.frame_dir / f"{digest}.feather"
+
+    def has_frame(self, digest: str) -> bool:
+        return self.frame_path(digest).exists()
+
+    def put_frame(self, digest: str, df):
+        """
+        Persist a parsed frame as uncompressed Feather so later reads can be memory-mapped.
+        """
+        import pyarrow as pa
+        import pyarrow.feather as feather
+
+        dest = self.frame_path(digest)
+        if dest.exists():
+            self._touch(dest)
+            return str(dest)
+        table = pa.Table.from_pandas(df, preserve_index=False)
+        self._atomic_write(dest, lambda f: feather.write_feather(table, f, compression="uncompressed"))
+        self.evict()
         return str(dest)
 
+    def get_frame(self, digest: str, dtype_backend: str = "compact"):
+        """
+        Read a stored frame back (memory-mapped), or None if it was never stored or has been evicted.
+        dtype_backend is converted the same way as core.ingestion.read_dataset, so a spilled frame
+        comes back with the dtypes it was loaded with.
+        """
+        import pyarrow.feather as feather
+        from core.ingestion import _arrow_to_pandas
+
+        path = self.frame_path(digest)
+        try:
+            table = feather.read_table(path, memory_map=True)
+        except FileNotFoundError:
+            return None
+        self._touch(path)
+        return _arrow_to_pandas(table, dtype_backend)
+
+    def load_dataset(self, uploaded_file, reader, content_hash: str = None):
+        """
+        Load an upload through the columnar cache.
+        reader(source, name=...) must return (df, info), e.g. core.ingestion.read_dataset.
+        On a hit the cached Feather file is read (memory-mapped) instead of re-parsing the upload.
+        content_hash: the upload's content_hash() if the caller already has it (saves hashing it again).
+        """
+        name = getattr(uploaded_file, "name", None) or str(uploaded_file)
+        digest = content_hash or self.content_hash(uploaded_file)
+        path = self.frame_path(digest)
+
+        if path.exists():
+            self._touch(path)
+            df, info = reader(path, name=str(path))
+            info.update({"source": name, "content_hash": digest, "cache_hit": True})
+            return df, info
+
+        df, info = reader(uploaded_file, name=name)
+        try:
+            self.put_frame(digest, df)
+        except Exception:
+            # Frames pyarrow cannot serialise (e.g. mixed-type object columns) just skip the cache
+            pass
+        info.update({"content_hash": digest, "cache_hit": False})
+        return df, info
+
+    def total_bytes(self) -> int:
+        return sum(p.stat().st_size for p in self._cached_files())
+
+    def evict(self):
+        """
+        Delete least-recently-used cache files until the store fits in max_bytes.
+        Returns the list of removed paths.
+        """
+        if not self.max_bytes:
+            return []
+        files = []
+        for p in self._cached_files():
+            try:
+                st = p.stat()
+            except FileNotFoundError:
+                continue
+            files.append((st.st_mtime, st.st_size, p))
+        total = sum(size for _, size, _ in files)
+        removed = []
+        for _, size, p in sorted(files):
+            if total <= self.max_bytes:
+                break
+            try:
+                p.unlink()
+                total -= size
+                removed.append(str(p))
+            except FileNotFoundError:
+                pass
+        return removed
+
     def list_files(self):
         return [str(x) for x in self.base.glob("*")]
 
     def remove(self, filename):
-        p = self.base / filename
-        if p.exists():
-            p.unlink()
-            return True
-        return False
+        """
+        Remove a file by name, or every cached file for a content hash.
+        """
+        candidates = [self.base / filename, self.frame_path(filename)]
+        candidates += list(self.raw_dir.glob(f"{filename}*"))
+        removed = False
+        for p in candidates:
+            if p.exists() and p.is_file():
+                p.unlink()
+                removed = True
+        return removed
+
+    def _cached_files(self):
+        # Skip in-flight temp files (".name.<uuid>.tmp") written by _atomic_write
+        return [p for d in (self.raw_dir, self.frame_dir) for p in d.iterdir()
+                if p.is_file() and not p.name.startswith(".")]
+
+    @staticmethod
+    def _touch(path: Path):
+        now = time.time()
+        try:
+            os.utime(path, (now, now))
+        except FileNotFoundError:
+            pass
+
+    @staticmethod
+    def _atomic_write(dest: Path, write_fn):
+        # Write to a temp file and rename so concurrent readers never see a partial file
+        tmp = dest.with_name(f".{dest.name}.{uuid.uuid4().hex}.tmp")
+        try:
+            with open(tmp, "wb") as f:
+                write_fn(f)
+            os.replace(tmp, dest)
+        finally:
+            if tmp.exists():
+                tmp.unlink()